@@ -0,0 +1,24 @@
+"""event parser version
+
+Revision ID: 3c0e5b7d91a2
+Revises: 80fef638c158
+Create Date: 2026-10-17 15:22:41.538120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c0e5b7d91a2'
+down_revision = '80fef638c158'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('events', sa.Column('parser_version', sa.Integer))
+
+
+def downgrade() -> None:
+    op.drop_column('events', 'parser_version')
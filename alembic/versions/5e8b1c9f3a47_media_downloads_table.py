@@ -0,0 +1,48 @@
+"""media downloads table
+
+Revision ID: 5e8b1c9f3a47
+Revises: d41b7a3f6c28
+Create Date: 2026-10-17 20:12:44.318720
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b1c9f3a47'
+down_revision = 'd41b7a3f6c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'media_downloads',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('chat_type', sa.String(), nullable=True),
+        sa.Column('event_chat_id', sa.Integer(), nullable=True),
+        sa.Column('event_message_id', sa.Integer(), nullable=True),
+        sa.Column('file_id', sa.String(), nullable=False),
+        sa.Column('file_unique_id', sa.String(), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=True),
+        sa.Column('media_type', sa.String(), nullable=True),
+        sa.Column('file_path', sa.String(), nullable=True),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('next_attempt_on', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('downloaded_on', sa.DateTime(), nullable=True),
+        sa.Column('created_on', sa.DateTime(), nullable=True),
+        sa.Column('updated_on', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('chat_id', 'message_id')
+    )
+    op.create_index('index_media_downloads_status_next_attempt_on', 'media_downloads', ['status', 'next_attempt_on'], unique=False)
+    op.create_index('index_media_downloads_file_unique_id', 'media_downloads', ['file_unique_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('index_media_downloads_file_unique_id', table_name='media_downloads')
+    op.drop_index('index_media_downloads_status_next_attempt_on', table_name='media_downloads')
+    op.drop_table('media_downloads')
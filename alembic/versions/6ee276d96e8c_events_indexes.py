@@ -0,0 +1,34 @@
+"""events indexes
+
+Revision ID: 6ee276d96e8c
+Revises: d7fdd977312e
+Create Date: 2026-10-17 10:12:41.518204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6ee276d96e8c'
+down_revision = 'd7fdd977312e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('index_events_start_date', 'events', ['start_date', 'deleted', 'region', 'event_type'])
+    op.create_index('index_events_end_date', 'events', ['end_date', 'deleted', 'region', 'event_type'])
+    op.create_index('index_events_start_year_month_day', 'events', ['start_year', 'start_month', 'start_day', 'deleted', 'region', 'event_type'])
+    op.create_index('index_events_soon', 'events', ['soon', 'deleted', 'start_year', 'start_month', 'start_day'])
+    op.create_index('index_events_discussion_group_message', 'events', ['discussion_group_chat_id', 'discussion_group_message_id'])
+
+    # refresh the planner's statistics, so it knows how selective the new indexes are
+    op.execute("ANALYZE events")
+
+
+def downgrade() -> None:
+    op.drop_index('index_events_start_date', 'events')
+    op.drop_index('index_events_end_date', 'events')
+    op.drop_index('index_events_start_year_month_day', 'events')
+    op.drop_index('index_events_soon', 'events')
+    op.drop_index('index_events_discussion_group_message', 'events')
@@ -0,0 +1,36 @@
+"""relay tables indexes
+
+Revision ID: 80fef638c158
+Revises: 6ee276d96e8c
+Create Date: 2026-10-17 11:03:27.204517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '80fef638c158'
+down_revision = '6ee276d96e8c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('index_user_messages_forwarded_message', 'user_messages', ['forwarded_chat_id', 'forwarded_message_id'])
+    op.create_index('index_chat_members_chat_id_status', 'chat_members', ['chat_id', 'status'])
+    op.create_index('index_private_chat_messages_user_id_revoked', 'private_chat_messages', ['user_id', 'revoked', 'message_id'])
+
+    for flag_column in ('is_staff_chat', 'is_evaluation_chat', 'is_users_chat', 'is_events_chat'):
+        op.create_index(f'index_chats_{flag_column}', 'chats', [flag_column], sqlite_where=sa.text(f'{flag_column} = 1'))
+
+    op.execute("ANALYZE")
+
+
+def downgrade() -> None:
+    op.drop_index('index_user_messages_forwarded_message', 'user_messages')
+    op.drop_index('index_chat_members_chat_id_status', 'chat_members')
+    op.drop_index('index_private_chat_messages_user_id_revoked', 'private_chat_messages')
+
+    for flag_column in ('is_staff_chat', 'is_evaluation_chat', 'is_users_chat', 'is_events_chat'):
+        op.drop_index(f'index_chats_{flag_column}', 'chats')
@@ -0,0 +1,41 @@
+"""event hashtags table
+
+Revision ID: 9a4f2c6e1d7b
+Revises: 3c0e5b7d91a2
+Create Date: 2026-10-17 17:48:12.204915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4f2c6e1d7b'
+down_revision = '3c0e5b7d91a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'event_hashtags',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('hashtag', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id', 'message_id'], ['events.chat_id', 'events.message_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chat_id', 'message_id', 'hashtag')
+    )
+    op.create_index('index_event_hashtags_hashtag', 'event_hashtags', ['hashtag', 'chat_id', 'message_id'], unique=False)
+
+    # fill the table from the hashtags json list saved in the events table
+    op.execute(
+        "INSERT OR IGNORE INTO event_hashtags (chat_id, message_id, hashtag) "
+        "SELECT events.chat_id, events.message_id, lower(hashtags_list.value) "
+        "FROM events, json_each(events.hashtags) AS hashtags_list "
+        "WHERE events.hashtags IS NOT NULL AND json_valid(events.hashtags)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('index_event_hashtags_hashtag', table_name='event_hashtags')
+    op.drop_table('event_hashtags')
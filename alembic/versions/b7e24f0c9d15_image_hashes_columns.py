@@ -0,0 +1,30 @@
+"""image hashes columns
+
+Revision ID: b7e24f0c9d15
+Revises: 5e8b1c9f3a47
+Create Date: 2026-10-17 21:03:18.552106
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e24f0c9d15'
+down_revision = '5e8b1c9f3a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('staff_chat_messages', sa.Column('media_phash', sa.String))
+    op.add_column('staff_chat_messages', sa.Column('media_dhash', sa.String))
+    op.add_column('media_downloads', sa.Column('phash', sa.String))
+    op.add_column('media_downloads', sa.Column('dhash', sa.String))
+
+
+def downgrade() -> None:
+    op.drop_column('media_downloads', 'dhash')
+    op.drop_column('media_downloads', 'phash')
+    op.drop_column('staff_chat_messages', 'media_dhash')
+    op.drop_column('staff_chat_messages', 'media_phash')
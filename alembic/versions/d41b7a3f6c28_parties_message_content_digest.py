@@ -0,0 +1,24 @@
+"""parties message content digest
+
+Revision ID: d41b7a3f6c28
+Revises: 9a4f2c6e1d7b
+Create Date: 2026-10-17 19:05:37.691402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b7a3f6c28'
+down_revision = '9a4f2c6e1d7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('parties_messages', sa.Column('content_digest', sa.String))
+
+
+def downgrade() -> None:
+    op.drop_column('parties_messages', 'content_digest')
@@ -0,0 +1,37 @@
+"""staff chat messages text minhash
+
+Revision ID: e3a9c51d7f80
+Revises: b7e24f0c9d15
+Create Date: 2026-10-17 21:47:09.128337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c51d7f80'
+down_revision = 'b7e24f0c9d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('staff_chat_messages', sa.Column('text_minhash', sa.String))
+
+    op.create_table(
+        'staff_chat_message_text_buckets',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('band', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id', 'message_id'], ['staff_chat_messages.chat_id', 'staff_chat_messages.message_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chat_id', 'message_id', 'band')
+    )
+    op.create_index('index_staff_chat_message_text_buckets_bucket', 'staff_chat_message_text_buckets', ['bucket', 'chat_id', 'message_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('index_staff_chat_message_text_buckets_bucket', table_name='staff_chat_message_text_buckets')
+    op.drop_table('staff_chat_message_text_buckets')
+    op.drop_column('staff_chat_messages', 'text_minhash')
@@ -467,8 +467,6 @@ class TempDataKey:
     DB_INSTANCES = "_database_instances"
     EVENTS_FILTERS = "events_filters"
     EVENTS_CACHE = "events_cache"
-    EVENTS_CACHE_DATA = "events_cache_data"
-    EVENTS_CACHE_SAVED_ON = "events_cache_saved_on"
     RADAR_DATE_OVERRIDE = "radar_date_override"
     RADAR_PROTECT_CONTENT_OVERRIDE = "radar_protect_content_override"
     FIRST_DIFF_TEXT = "first_diff_text"
@@ -0,0 +1,66 @@
+from typing import Optional, Union, Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import ChatMemberAdministrator, ChatMemberOwner
+
+from database.models import ChatMember as DbChatMember, chat_members_to_dict
+from database.async_queries import users
+from database.queries import chat_members
+from database.queries.chat_members import MEMBERSHIP_CACHE_FLAGS, update_cached_membership
+
+
+async def save_administrators(session: AsyncSession, chat_id: int, administrators: Iterable[Union[ChatMemberAdministrator, ChatMemberOwner]], save_users=True):
+    if save_users:
+        for administrator in administrators:
+            # mae sure we have the User model for that user
+            await users.get_safe(session, administrator.user)
+
+    chat_administrators_dict = chat_members_to_dict(chat_id, administrators)
+
+    for _, chat_member_dict in chat_administrators_dict.items():
+        chat_administrator = DbChatMember(**chat_member_dict)
+        await session.merge(chat_administrator)
+        update_cached_membership(chat_id, chat_administrator.user_id, chat_administrator.status)
+
+
+async def is_member(session: AsyncSession, user_id: int, chat_filter, is_admin=False) -> Optional[DbChatMember]:
+    statement = chat_members.is_member_statement(user_id, chat_filter, is_admin)
+    chat_member = (await session.execute(statement)).scalar_one_or_none()
+
+    return chat_member
+
+
+async def is_member_cached(session: AsyncSession, user_id: int, chat_filter, is_admin=False) -> bool:
+    """same as database.queries.chat_members.is_member_cached(), and it uses the same cache"""
+    if chat_filter.key not in MEMBERSHIP_CACHE_FLAGS:
+        return bool(await is_member(session, user_id, chat_filter, is_admin=is_admin))
+
+    cached, status = chat_members.get_cached_membership(user_id, chat_filter.key)
+    if not cached:
+        chat_member = await get_chat_member(session, user_id, chat_filter)
+        status = chat_member.status if chat_member else None
+        chat_members.set_cached_membership(user_id, chat_filter.key, status)
+
+    return chat_members.membership_status_matches(status, is_admin)
+
+
+async def get_chat_member(session: AsyncSession, user_id: int, chat_filter) -> Optional[DbChatMember]:
+    statement = chat_members.get_chat_member_statement(user_id, chat_filter)
+    chat_member = (await session.execute(statement)).scalar_one_or_none()
+
+    return chat_member
+
+
+async def get_chat_member_by_id(session: AsyncSession, user_id: int, chat_id: int) -> Optional[DbChatMember]:
+    statement = chat_members.get_chat_member_by_id_statement(user_id, chat_id)
+    chat_member = (await session.execute(statement)).scalar_one_or_none()
+
+    return chat_member
+
+
+async def get_user_chat_members(session: AsyncSession, user_id: int):
+    return await session.scalars(chat_members.get_user_chat_members_statement(user_id))
+
+
+async def get_chat_chat_members(session: AsyncSession, chat_filter, admins_only: bool = False):
+    return await session.scalars(chat_members.get_chat_chat_members_statement(chat_filter, admins_only))
@@ -0,0 +1,108 @@
+from typing import Optional, Tuple
+
+from sqlalchemy import true, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Chat as TelegramChat
+from telegram import ChatMember
+
+from database.models import Chat, ChatMember as DbChatMember, chat_members_to_dict
+from database.async_queries import users
+from database.queries import chats
+from database.queries.chats import SpecialChatsCache, CachedChat
+
+
+async def get_chat(session: AsyncSession, chat_filter) -> Optional[Chat]:
+    statement = select(Chat).where(chat_filter == true())
+    chat: Optional[Chat] = (await session.execute(statement)).scalar_one_or_none()
+    return chat
+
+
+async def get_core_chats(session: AsyncSession):
+    return await session.scalars(chats.get_core_chats_statement())
+
+
+# the cache is the same one used by database.queries.chats
+
+async def refresh_cache(session: AsyncSession):
+    """must be called after a chat's role (or the bot's permissions in a special chat) has been changed and committed"""
+    chats.set_cache(await get_core_chats(session))
+
+
+async def get_cached_chat(session: AsyncSession, chat_filter) -> Optional[CachedChat]:
+    """same as get_chat(), but served from memory. Use get_chat() when the returned object has to be modified"""
+    if SpecialChatsCache.chats is None:
+        SpecialChatsCache.misses += 1
+        await refresh_cache(session)
+    else:
+        SpecialChatsCache.hits += 1
+
+    return SpecialChatsCache.chats[chat_filter.key]
+
+
+async def reset_staff_chat(session: AsyncSession):
+    await session.execute(update(Chat).values(is_staff_chat=False))
+
+
+async def reset_users_chat(session: AsyncSession):
+    await session.execute(update(Chat).values(is_users_chat=False))
+
+
+async def reset_log_chat(session: AsyncSession):
+    await session.execute(update(Chat).values(is_log_chat=False))
+
+
+async def reset_modlog_chat(session: AsyncSession):
+    await session.execute(update(Chat).values(is_modlog_chat=False))
+
+
+async def reset_events_chat(session: AsyncSession):
+    await session.execute(update(Chat).values(is_events_chat=False))
+
+
+async def reset_evaluation_chat(session: AsyncSession):
+    await session.execute(update(Chat).values(is_evaluation_chat=False))
+
+
+async def get_all_chats(session: AsyncSession):
+    statement = select(Chat).where()
+    return await session.scalars(statement)
+
+
+async def get_or_create(session: AsyncSession, chat_id: int, create_if_missing=True, telegram_chat: Optional[TelegramChat] = None):
+    statement = select(Chat).where(Chat.chat_id == chat_id)
+    chat: Chat = (await session.execute(statement)).scalar_one_or_none()
+
+    if not chat and create_if_missing:
+        chat = Chat(telegram_chat)
+        session.add(chat)
+
+    return chat
+
+
+async def get_safe(session: AsyncSession, telegram_chat: TelegramChat, create_if_missing=True, update_metadata_if_existing=True, commit=False):
+    statement = select(Chat).where(Chat.chat_id == telegram_chat.id)
+    chat: Chat = (await session.execute(statement)).scalar_one_or_none()
+
+    if not chat and create_if_missing:
+        chat = Chat(telegram_chat)
+        session.add(chat)
+    elif chat and update_metadata_if_existing:
+        chat.update_metadata(telegram_chat)
+
+    if commit:
+        await session.commit()
+
+    return chat
+
+
+async def update_administrators(session: AsyncSession, chat: Chat, administrators: Tuple[ChatMember], save_users=True):
+    if save_users:
+        for administrator in administrators:
+            # mae sure we have the User model for that user
+            await users.get_safe(session, administrator.user)
+
+    chat_administrators_dict = chat_members_to_dict(chat.chat_id, administrators)
+
+    for _, chat_member_dict in chat_administrators_dict.items():
+        chat_administrator = DbChatMember(**chat_member_dict)
+        await session.merge(chat_administrator)
@@ -0,0 +1,72 @@
+import datetime
+from typing import Optional, List, Any, Tuple
+
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Message
+
+from database.models import Event
+from database.queries import events
+
+
+async def get_or_create(session: AsyncSession, chat_id: int, message_id: int, create_if_missing=True, commit=False) -> Optional[Event]:
+    statement = select(Event).where(Event.chat_id == chat_id, Event.message_id == message_id)
+    event: Event = (await session.execute(statement)).scalar_one_or_none()
+
+    if not event and create_if_missing:
+        event = Event(chat_id, message_id)
+        session.add(event)
+        if commit:
+            await session.commit()
+
+    return event
+
+
+async def get_event_from_discussion_group_message(session: AsyncSession, message: Message) -> Optional[Event]:
+    statement = select(Event).where(
+        Event.discussion_group_chat_id == message.chat.id,
+        Event.discussion_group_message_id == message.message_thread_id
+    )
+    result = await session.execute(statement)
+    return result.scalar_one_or_none()
+
+
+async def get_event_from_discussion_group_message_id(session: AsyncSession, chat_id: int, message_id: int) -> Optional[Event]:
+    statement = select(Event).where(
+        Event.discussion_group_chat_id == chat_id,
+        Event.discussion_group_message_id == message_id
+    )
+    result = await session.execute(statement)
+    return result.scalar_one_or_none()
+
+
+async def get_event_from_channel_or_discussion_group(session: AsyncSession, chat_id: int, message_id: int) -> Optional[Event]:
+    statement = select(Event).where(
+        or_(
+            and_(Event.chat_id == chat_id, Event.message_id == message_id),
+            and_(Event.discussion_group_chat_id == chat_id, Event.discussion_group_message_id == message_id)
+        )
+    )
+    result = await session.execute(statement)
+    return result.scalar_one_or_none()
+
+
+async def get_events(
+        session: AsyncSession,
+        skip_canceled: bool = False,
+        filters: Optional[List] = None,
+        order_by: Optional[List] = None  # list of Event class property to use as order_by
+):
+    statement = events.get_events_statement(skip_canceled, filters, order_by)
+
+    return await session.scalars(statement)
+
+
+async def get_week_events(session: AsyncSession, now: datetime.datetime, filters: List, weeks: int = 1) -> Tuple[Any, datetime.date, datetime.date]:
+    statement, last_monday, next_monday = events.get_week_events_statement(now, filters, weeks)
+
+    return await session.scalars(statement), last_monday, next_monday
+
+
+async def get_all_events(session: AsyncSession):
+    return await session.scalars(events.get_all_events_statement())
@@ -0,0 +1,13 @@
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import PartiesMessage
+from database.queries import parties_messages
+
+
+async def get_last_parties_message(session: AsyncSession, chat_id: int, events_type: str):
+    statement = parties_messages.get_last_parties_message_statement(chat_id, events_type)
+    parties_message: Optional[PartiesMessage] = (await session.scalars(statement)).first()
+
+    return parties_message
@@ -0,0 +1,73 @@
+from typing import Optional, Union, List, Dict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from constants import BOT_SETTINGS_DEFAULTS
+from database.models import BotSetting
+from database.queries import settings
+from database.queries.settings import SettingsCache, CachedBotSetting
+
+
+async def get_settings(session: AsyncSession):
+    statement = select(BotSetting).where()
+    return await session.scalars(statement)
+
+
+async def get_settings_as_dict(
+        session: AsyncSession,
+        include_categories: Optional[Union[List[str], str]] = None,
+        exclude_categories: Optional[Union[List[str], str]] = None
+):
+    statement = settings.get_settings_as_dict_statement(include_categories, exclude_categories)
+    settings_dict = {}
+    for setting in await session.scalars(statement):
+        settings_dict[setting.key] = setting
+    return settings_dict
+
+
+async def get_or_create(session: AsyncSession, key: str, create_if_missing=True, value=None):
+    statement = select(BotSetting).where(BotSetting.key == key)
+    setting: BotSetting = (await session.execute(statement)).scalar_one_or_none()
+
+    if not setting and create_if_missing:
+        setting = BotSetting(key=key, value=value, category=BOT_SETTINGS_DEFAULTS[key]["category"])
+        session.add(setting)
+
+    return setting
+
+
+# the cache is the same one used by database.queries.settings
+
+async def load_cache(session: AsyncSession):
+    settings.set_cache(await get_settings(session))
+
+
+async def get_cached(session: AsyncSession, key: str) -> CachedBotSetting:
+    if SettingsCache.settings is None:
+        SettingsCache.misses += 1
+        await load_cache(session)
+    elif key not in SettingsCache.settings:
+        SettingsCache.misses += 1
+    else:
+        SettingsCache.hits += 1
+
+    if key not in SettingsCache.settings:
+        # the setting does not exist yet: create it the same way get_or_create() would
+        SettingsCache.settings[key] = CachedBotSetting(await get_or_create(session, key))
+
+    return SettingsCache.settings[key]
+
+
+async def get_value(session: AsyncSession, key: str):
+    return (await get_cached(session, key)).value()
+
+
+async def get_cached_as_dict(session: AsyncSession, include_categories: Optional[Union[List[str], str]] = None) -> Dict[str, CachedBotSetting]:
+    if SettingsCache.settings is None:
+        SettingsCache.misses += 1
+        await load_cache(session)
+    else:
+        SettingsCache.hits += 1
+
+    return settings.get_cached_categories(include_categories)
@@ -0,0 +1,44 @@
+from typing import Optional
+
+from sqlalchemy import true, update, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import User as TelegramUser
+
+from database.models import User
+
+
+async def get_or_create(session: AsyncSession, user_id: int, create_if_missing=True, telegram_user: Optional[TelegramUser] = None):
+    statement = select(User).where(User.user_id == user_id)
+    user: Optional[User] = (await session.execute(statement)).scalar_one_or_none()
+
+    if not user and create_if_missing:
+        user = User(telegram_user)
+        session.add(user)
+
+    return user
+
+
+async def get_safe(session: AsyncSession, telegram_user: TelegramUser, create_if_missing=True, update_metadata_if_existing=True, commit=False):
+    statement = select(User).where(User.user_id == telegram_user.id)
+    user: Optional[User] = (await session.execute(statement)).scalar_one_or_none()
+
+    if not user and create_if_missing:
+        user = User(telegram_user)
+        session.add(user)
+    elif user and update_metadata_if_existing:
+        user.update_metadata(telegram_user)
+
+    if commit:
+        await session.commit()
+
+    return user
+
+
+async def get_approvers(session: AsyncSession):
+    statement = select(User).where(User.can_evaluate_applications == true())
+
+    return await session.scalars(statement)
+
+
+async def reset_approvers(session: AsyncSession):
+    await session.execute(update(User).values(can_evaluate_applications=False))
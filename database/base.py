@@ -1,14 +1,106 @@
 from contextlib import contextmanager
-from typing import cast
 
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy.orm import scoped_session
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
-engine = create_engine("sqlite:///bot.db")
-SessionClass = sessionmaker(bind=engine)
+from config import config
+
+DB_URL = "sqlite:///bot.db"
+ASYNC_DB_URL = "sqlite+aiosqlite:///bot.db"
+
+# the [database] section is optional, so older config files keep working
+DB_CONFIG = config.get("database", {})
+
+engine = create_engine(
+    DB_URL,
+    poolclass=QueuePool,
+    pool_size=DB_CONFIG.get("pool_size", 5),
+    max_overflow=DB_CONFIG.get("pool_max_overflow", 10),
+    pool_timeout=DB_CONFIG.get("pool_timeout", 30),
+    pool_pre_ping=DB_CONFIG.get("pool_pre_ping", True),
+    # the pool is shared between handlers and jobs, which might run in different threads
+    connect_args={"check_same_thread": False}
+)
+
+# used by the async queries in database/async_queries, so handlers do not block the event loop while
+# waiting for the db. aiosqlite runs each connection in its own thread
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_CONFIG.get("pool_size", 5),
+    max_overflow=DB_CONFIG.get("pool_max_overflow", 10),
+    pool_timeout=DB_CONFIG.get("pool_timeout", 30),
+    pool_pre_ping=DB_CONFIG.get("pool_pre_ping", True)
+)
+
+# PRAGMAs applied to every new connection. WAL lets readers (handlers, jobs) work while a writer commits,
+# and busy_timeout makes a connection wait for the lock instead of failing immediately with "database is locked"
+SQLITE_PRAGMAS = dict(
+    journal_mode=DB_CONFIG.get("journal_mode", "WAL"),
+    synchronous=DB_CONFIG.get("synchronous", "NORMAL"),
+    busy_timeout=DB_CONFIG.get("busy_timeout", 5000),  # milliseconds
+    cache_size=DB_CONFIG.get("cache_size", -20000),  # negative: KiB instead of pages
+    mmap_size=DB_CONFIG.get("mmap_size", 134217728),  # bytes
+    temp_store=DB_CONFIG.get("temp_store", "MEMORY")
+)
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+class SessionStats:
+    opened = 0
+    closed = 0
+
+    @classmethod
+    def open_sessions(cls):
+        return cls.opened - cls.closed
+
+
+class CountedSession(Session):
+    """Session that keeps track of how many sessions were opened and closed during the process lifetime"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counted_close = False
+        SessionStats.opened += 1
+
+    def close(self):
+        super().close()
+        if not self.counted_close:
+            # a session can be closed more than once, count it only the first time
+            self.counted_close = True
+            SessionStats.closed += 1
+
+
+# one session factory for the whole process
+SessionClass = sessionmaker(bind=engine, class_=CountedSession)
+# expire_on_commit=False: in async mode, expired attributes cannot be lazy-loaded when accessed after a commit
+AsyncSessionClass = async_sessionmaker(bind=async_engine, sync_session_class=CountedSession, expire_on_commit=False)
+
+
+def get_db_stats() -> dict:
+    return dict(
+        sessions_opened=SessionStats.opened,
+        sessions_closed=SessionStats.closed,
+        sessions_open=SessionStats.open_sessions(),
+        pool_size=engine.pool.size(),
+        pool_checked_out=engine.pool.checkedout(),
+        pool_checked_in=engine.pool.checkedin(),
+        pool_overflow=engine.pool.overflow(),
+        async_pool_checked_out=async_engine.pool.checkedout()
+    )
 
 
 @contextmanager
@@ -26,10 +118,15 @@ def session_scope():
 
 
 def get_session(connection=None) -> Session:
-    """get a new db session"""
+    """get a new db session from the process-wide session factory. The caller is responsible for closing it"""
+
+    return SessionClass()
+
+
+def get_async_session() -> AsyncSession:
+    """get a new async db session from the process-wide async session factory. The caller is responsible for closing it"""
 
-    session = scoped_session(sessionmaker(bind=engine))
-    return cast(Session, session)
+    return AsyncSessionClass()
 
 
 Base = declarative_base()
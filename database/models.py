@@ -4,7 +4,7 @@ import logging
 from pathlib import Path
 from typing import List, Optional, Union, Iterable
 
-from sqlalchemy import Column, ForeignKey, Integer, Boolean, String, DateTime, Float, Date, Index, ForeignKeyConstraint
+from sqlalchemy import Column, ForeignKey, Integer, Boolean, String, DateTime, Float, Date, Index, ForeignKeyConstraint, true
 from sqlalchemy.orm import relationship, mapped_column, Mapped
 from telegram import ChatMember as TgChatMember, ChatMemberAdministrator, User as TelegramUser, Chat as TelegramChat, \
     ChatMemberOwner, ChatMemberRestricted, \
@@ -12,6 +12,7 @@ from telegram import ChatMember as TgChatMember, ChatMemberAdministrator, User a
 from telegram.constants import ChatMemberStatus
 from telegram.helpers import mention_html
 
+import text_hashes
 import utilities
 from config import config
 from constants import Language
@@ -238,6 +239,12 @@ class Chat(Base):
     chat_members = relationship("ChatMember", back_populates="chat", cascade="all, delete, delete-orphan, save-update")
     admin_messages = relationship("AdminMessage", back_populates="chat", cascade="all, delete, delete-orphan, save-update")
 
+    # partial indexes: only the (very few) rows with the flag set are indexed
+    Index('index_chats_is_staff_chat', is_staff_chat, sqlite_where=is_staff_chat == true())
+    Index('index_chats_is_evaluation_chat', is_evaluation_chat, sqlite_where=is_evaluation_chat == true())
+    Index('index_chats_is_users_chat', is_users_chat, sqlite_where=is_users_chat == true())
+    Index('index_chats_is_events_chat', is_events_chat, sqlite_where=is_events_chat == true())
+
     def __init__(self, telegram_chat: TelegramChat):
         self.update_metadata(telegram_chat)
 
@@ -494,6 +501,9 @@ class ChatMember(Base):
     user: User = relationship("User", back_populates="chat_members")
     chat: Chat = relationship("Chat", back_populates="chat_members")
 
+    # the primary key already covers lookups by user_id, this one is for lookups by chat
+    Index('index_chat_members_chat_id_status', chat_id, status)
+
     @classmethod
     def from_chat_member(cls, chat_id, chat_member: chat_member_union_type):
         chat_member_dict = chat_member_to_dict(chat_member)
@@ -565,6 +575,8 @@ class UserMessage(Base):
     user: User = relationship("User", back_populates="user_messages")
     admin_messages = relationship("AdminMessage", back_populates="user_message")
 
+    Index('index_user_messages_forwarded_message', forwarded_chat_id, forwarded_message_id)
+
     def __init__(self, message_id, user_id, forwarded_chat_id, forwarded_message_id, message_datetime):
         self.message_id = message_id
         self.user_id = user_id
@@ -850,6 +862,8 @@ class PrivateChatMessage(Base):
 
     user: User = relationship("User", back_populates="private_chat_messages")
 
+    Index('index_private_chat_messages_user_id_revoked', user_id, revoked, message_id)
+
     def __init__(
             self,
             message_id: int,
@@ -1011,6 +1025,7 @@ class Event(Base):
     hashtags = Column(String, default=None)  # hashtag entities as json string
 
     dates_from_hashtags = Column(Boolean, default=False)
+    parser_version = Column(Integer, default=None)  # version of the parser that last parsed the post, see common.PARSER_VERSION
 
     send_validity_notifications = Column(Boolean, default=True)
     validity_notification_chat_id = Column(Integer, default=None)
@@ -1028,6 +1043,15 @@ class Event(Base):
 
     chat: Chat = relationship("Chat")
     comments = relationship("ChannelComment", back_populates="event")
+    event_hashtags = relationship("EventHashtag", back_populates="event", cascade="all, delete-orphan")
+
+    # radar/parties list queries: week filters (start_date OR end_date range), month filters, "soon" filter
+    Index('index_events_start_date', start_date, deleted, region, event_type)
+    Index('index_events_end_date', end_date, deleted, region, event_type)
+    Index('index_events_start_year_month_day', start_year, start_month, start_day, deleted, region, event_type)
+    Index('index_events_soon', soon, deleted, start_year, start_month, start_day)
+    # comments in the discussion group
+    Index('index_events_discussion_group_message', discussion_group_chat_id, discussion_group_message_id)
 
     def __init__(self, chat_id: int, message_id: int):
         self.message_id = message_id
@@ -1267,6 +1291,13 @@ class Event(Base):
     def save_hashtags(self, hashtags_list: List):
         self.hashtags = json.dumps(hashtags_list, indent=2)
 
+        # keep the normalized table in sync, reusing the rows of the hashtags that didn't change
+        current_hashtags = {event_hashtag.hashtag: event_hashtag for event_hashtag in self.event_hashtags}
+        self.event_hashtags = [
+            current_hashtags.get(hashtag) or EventHashtag(hashtag=hashtag)
+            for hashtag in dict.fromkeys(hashtags_list)
+        ]
+
     def get_hashtags(self) -> List:
         if not self.hashtags:
             return []
@@ -1280,6 +1311,117 @@ class Event(Base):
         return f"Event(origin={self.chat_id}/{self.message_id}, title=\"{self.event_title}\", date={self.pretty_date()}, link={self.message_link()})"
 
 
+class EventHashtag(Base):
+    """one row per (event, hashtag): it mirrors Event.hashtags so events can be filtered by hashtag in sql"""
+    __tablename__ = 'event_hashtags'
+    __allow_unmapped__ = True
+
+    chat_id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, primary_key=True)
+    hashtag = Column(String, primary_key=True)  # lowercase, with the '#'
+
+    __table_args__ = (ForeignKeyConstraint(
+        [chat_id, message_id],
+        ['events.chat_id', 'events.message_id'],
+        ondelete="CASCADE"
+    ),)
+
+    event: Event = relationship("Event", back_populates="event_hashtags")
+
+    Index('index_event_hashtags_hashtag', hashtag, chat_id, message_id)
+
+    def __repr__(self):
+        return f"EventHashtag(chat_id={self.chat_id}, message_id={self.message_id}, hashtag={self.hashtag})"
+
+
+class MediaDownloadStatus:
+    QUEUED = 10
+    DONE = 20
+    FAILED = 30  # gave up after too many attempts, or the file cannot be downloaded
+
+
+class MediaDownload(Base):
+    """a media to back up (see plugins/events/media_backup.py): one row per message, downloaded by the backup workers.
+    Files are saved once per file_unique_id in the media store, so these rows are also the messages -> file references"""
+    __tablename__ = 'media_downloads'
+    __allow_unmapped__ = True
+
+    chat_id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, primary_key=True)
+    chat_type = Column(String, default=None)
+
+    # the event the file path should be saved to, once downloaded
+    event_chat_id = Column(Integer, default=None)
+    event_message_id = Column(Integer, default=None)
+
+    file_id = Column(String, nullable=False)
+    file_unique_id = Column(String, nullable=False)
+    file_size = Column(Integer, default=None)
+    media_type = Column(String, default=None)
+    file_path = Column(String, default=None)
+    # perceptual hashes of photos (hex strings, see image_hashes.py)
+    phash = Column(String, default=None)
+    dhash = Column(String, default=None)
+
+    status = Column(Integer, default=MediaDownloadStatus.QUEUED)
+    attempts = Column(Integer, default=0)
+    next_attempt_on = Column(DateTime, default=utilities.now)
+    last_error = Column(String, default=None)
+    downloaded_on = Column(DateTime, default=None)
+
+    created_on = Column(DateTime, default=utilities.now)
+    updated_on = Column(DateTime, default=utilities.now, onupdate=utilities.now)
+
+    Index('index_media_downloads_status_next_attempt_on', status, next_attempt_on)
+    Index('index_media_downloads_file_unique_id', file_unique_id, status)
+
+    def __init__(self, chat_id: int, message_id: int):
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    def save_media(self, message: Message, file_path: Union[Path, str]):
+        """(re)queue the download of the message's media"""
+        self.chat_type = message.chat.type
+        self.file_id, self.file_unique_id, _ = utilities.get_media_ids(message)
+        self.file_size = message.effective_attachment[-1].file_size if message.photo else message.effective_attachment.file_size
+        self.media_type = utilities.detect_media_type(message, raise_on_unknown_type=False)
+        self.file_path = str(file_path)
+
+        self.status = MediaDownloadStatus.QUEUED
+        self.attempts = 0
+        self.next_attempt_on = utilities.now()
+        self.last_error = None
+        self.downloaded_on = None
+
+    def set_event(self, event: Optional[Event]):
+        if not event:
+            return
+
+        self.event_chat_id = event.chat_id
+        self.event_message_id = event.message_id
+
+    def save_image_hashes(self, phash: str, dhash: str):
+        self.phash = phash
+        self.dhash = dhash
+
+    def set_downloaded(self):
+        self.status = MediaDownloadStatus.DONE
+        self.last_error = None
+        self.downloaded_on = utilities.now()
+
+    def set_failed(self, error: str, retry_in: Optional[int] = None):
+        """retry_in: seconds to wait before the next attempt. If None, the download will not be attempted again"""
+        self.attempts += 1
+        self.last_error = error
+        if retry_in is None:
+            self.status = MediaDownloadStatus.FAILED
+        else:
+            self.next_attempt_on = utilities.now() + datetime.timedelta(seconds=retry_in)
+
+    def __repr__(self):
+        return f"MediaDownload(origin={self.chat_id}/{self.message_id}, file_unique_id={self.file_unique_id}, status={self.status}, attempts={self.attempts})"
+
+
 class ChannelComment(Base):
     __tablename__ = 'channel_comments'
     __allow_unmapped__ = True
@@ -1402,6 +1544,7 @@ class PartiesMessage(Base):
     deleted = Column(Boolean, default=False)
     ignore = Column(Boolean, default=False)
     events_list = Column(String, default=json.dumps([]))
+    content_digest = Column(String, default=None)  # digest of the text (without the timestamp footer) and of the events list
 
     created_on = Column(DateTime, default=utilities.now)
     updated_on = Column(DateTime, default=utilities.now, onupdate=utilities.now)
@@ -1409,13 +1552,14 @@ class PartiesMessage(Base):
 
     chat: Chat = relationship("Chat")
 
-    def __init__(self, message: Message, events_type: str, events_list: Optional[List] = None, force_sent=False):
+    def __init__(self, message: Message, events_type: str, events_list: Optional[List] = None, force_sent=False, content_digest: Optional[str] = None):
         self.message_id = message.message_id
         self.chat_id = message.chat.id
         self.message_date = message.date
         self.events_type = events_type
         self.force_sent = force_sent
         self.message_json = json.dumps(message.to_dict(), indent=2)
+        self.content_digest = content_digest
         if events_list:
             self.save_events(events_list)
 
@@ -1779,7 +1923,9 @@ class DescriptionMessage(Base):
 
 
 class HashingVersion:
-    CURRENT = 1
+    MD5 = 1  # text_hash only
+    MINHASH = 2  # text_hash, plus the MinHash signature and its LSH buckets (see text_hashes.py)
+    CURRENT = MINHASH
 
 
 class StaffChatMessage(Base):
@@ -1799,17 +1945,22 @@ class StaffChatMessage(Base):
 
     text_hash = Column(String, default=None)
     text_hashing_version = Column(Integer, default=None)
+    text_minhash = Column(String, default=None)
 
     media_file_id = Column(String, default=None)
     media_file_unique_id = Column(String, default=None)
     media_group_id = Column(Integer, default=None)
     media_type = Column(String, default=None)
+    # perceptual hashes of photos (hex strings, see image_hashes.py)
+    media_phash = Column(String, default=None)
+    media_dhash = Column(String, default=None)
 
     message_json = Column(String, default=None)
     created_on = Column(DateTime, default=utilities.now)
     updated_on = Column(DateTime, default=utilities.now, onupdate=utilities.now)
 
     chat: Chat = relationship("Chat")
+    text_buckets = relationship("StaffChatMessageTextBucket", back_populates="staff_chat_message", cascade="all, delete-orphan")
 
     Index('index_text_hash', text_hash)
     Index('index_media_file_unique_id', media_file_unique_id)
@@ -1831,6 +1982,7 @@ class StaffChatMessage(Base):
         text = message.text or message.caption
         if text:
             self.text_hash = utilities.generate_text_hash(text)
+            self.save_text_minhash(text_hashes.generate_text_minhash(text))
             self.text_hashing_version = HashingVersion.CURRENT
 
         if utilities.contains_media_with_file_id(message):
@@ -1840,6 +1992,25 @@ class StaffChatMessage(Base):
             self.media_group_id = media_group_id
             self.media_type = utilities.detect_media_type(message, raise_on_unknown_type=False)
 
+    def save_image_hashes(self, phash: str, dhash: str):
+        self.media_phash = phash
+        self.media_dhash = dhash
+
+    def save_text_minhash(self, signature: List[int]):
+        self.text_minhash = text_hashes.minhash_to_str(signature)
+
+        # keep the buckets table in sync, reusing the rows of the bands that didn't change
+        current_buckets = {(text_bucket.band, text_bucket.bucket): text_bucket for text_bucket in self.text_buckets}
+        self.text_buckets = [
+            current_buckets.get((band, bucket)) or StaffChatMessageTextBucket(band=band, bucket=bucket)
+            for band, bucket in enumerate(text_hashes.get_lsh_buckets(signature))
+        ]
+
+    def get_text_minhash(self) -> List[int]:
+        if not self.text_minhash:
+            return []
+        return text_hashes.minhash_from_str(self.text_minhash)
+
     def message_link(self):
         chat_id = str(self.chat_id).replace("-100", "")
         base_link = f"https://t.me/c/{chat_id}/{self.message_id}"
@@ -1856,6 +2027,30 @@ class StaffChatMessage(Base):
         return f"<a href=\"{message_link}\">{utilities.escape_html(text)}</a>"
 
 
+class StaffChatMessageTextBucket(Base):
+    """one row per (message, LSH band): messages with similar texts are likely to share a bucket"""
+    __tablename__ = 'staff_chat_message_text_buckets'
+    __allow_unmapped__ = True
+
+    chat_id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, primary_key=True)
+    band = Column(Integer, primary_key=True)
+    bucket = Column(Integer, nullable=False)
+
+    __table_args__ = (ForeignKeyConstraint(
+        [chat_id, message_id],
+        ['staff_chat_messages.chat_id', 'staff_chat_messages.message_id'],
+        ondelete="CASCADE"
+    ),)
+
+    staff_chat_message: StaffChatMessage = relationship("StaffChatMessage", back_populates="text_buckets")
+
+    Index('index_staff_chat_message_text_buckets_bucket', bucket, chat_id, message_id)
+
+    def __repr__(self):
+        return f"StaffChatMessageTextBucket(chat_id={self.chat_id}, message_id={self.message_id}, band={self.band}, bucket={self.bucket})"
+
+
 class Destination:
     EVENTS_CHAT_DEEPLINK = "events-chat-deeplink"
     USERS_CHAT_DEEPLINK = "users-chat-deeplink"
@@ -1,17 +1,71 @@
-from typing import Optional, Union, Iterable
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Union, Iterable, Tuple
 
-from sqlalchemy import true
+from sqlalchemy import true, select
 from sqlalchemy.orm import Session
 from telegram import ChatMemberAdministrator, ChatMemberOwner
 from telegram.constants import ChatMemberStatus
 
+from database.base import DB_CONFIG
 from database.models import Chat, ChatMember as DbChatMember, chat_members_to_dict
-from database.queries import users
+from database.queries import users, chats
+
+logger = logging.getLogger(__name__)
 
 CHAT_MEMBER_STATUS_ADMIN = [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]
 
 CHAT_MEMBER_STATUS_MEMBER = [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER, ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED]
 
+# special chats whose memberships are checked often enough to be cached
+MEMBERSHIP_CACHE_FLAGS = ("is_staff_chat", "is_users_chat", "is_events_chat")
+
+
+class MembershipCache:
+    # (user_id, special chat flag) -> (status or None if we have no ChatMember, expiration timestamp)
+    # least recently used entries first
+    entries: "OrderedDict[Tuple[int, str], Tuple[Optional[str], float]]" = OrderedDict()
+    max_size = DB_CONFIG.get("membership_cache_size", 10000)
+    ttl = DB_CONFIG.get("membership_cache_ttl", 600)  # seconds
+    hits = 0
+    misses = 0
+
+
+def drop_membership_cache(*args):
+    # also registered as special chats cache callback: when a special chat changes, the cached memberships are meaningless
+    logger.debug("dropping membership cache")
+    MembershipCache.entries.clear()
+
+
+chats.add_refresh_callback(drop_membership_cache)
+
+
+def get_membership_cache_stats() -> dict:
+    return dict(hits=MembershipCache.hits, misses=MembershipCache.misses, size=len(MembershipCache.entries))
+
+
+def set_cached_membership(user_id: int, chat_flag: str, status: Optional[str]):
+    key = (user_id, chat_flag)
+    MembershipCache.entries[key] = (status, time.monotonic() + MembershipCache.ttl)
+    MembershipCache.entries.move_to_end(key)
+    if len(MembershipCache.entries) > MembershipCache.max_size:
+        MembershipCache.entries.popitem(last=False)
+
+
+def update_cached_membership(chat_id: int, user_id: int, status: str):
+    """must be called every time the ChatMember of an user in a special chat is saved"""
+    if chats.SpecialChatsCache.chats is None:
+        # we can't tell which special chat (if any) chat_id is
+        for chat_flag in MEMBERSHIP_CACHE_FLAGS:
+            MembershipCache.entries.pop((user_id, chat_flag), None)
+        return
+
+    for chat_flag in MEMBERSHIP_CACHE_FLAGS:
+        special_chat = chats.SpecialChatsCache.chats[chat_flag]
+        if special_chat and special_chat.chat_id == chat_id:
+            set_cached_membership(user_id, chat_flag, status)
+
 
 def save_administrators(session: Session, chat_id: int, administrators: Iterable[Union[ChatMemberAdministrator, ChatMemberOwner]], save_users=True):
     if save_users:
@@ -24,9 +78,10 @@ def save_administrators(session: Session, chat_id: int, administrators: Iterable
     for _, chat_member_dict in chat_administrators_dict.items():
         chat_administrator = DbChatMember(**chat_member_dict)
         session.merge(chat_administrator)
+        update_cached_membership(chat_id, chat_administrator.user_id, chat_administrator.status)
 
 
-def is_member(session: Session, user_id: int, chat_filter, is_admin=False) -> Optional[DbChatMember]:
+def is_member_statement(user_id: int, chat_filter, is_admin=False):
     filters = [DbChatMember.user_id == user_id, chat_filter == true()]
     if is_admin:
         # noinspection PyUnresolvedReferences
@@ -35,42 +90,90 @@ def is_member(session: Session, user_id: int, chat_filter, is_admin=False) -> Op
         # noinspection PyUnresolvedReferences
         filters.append(DbChatMember.status.in_(CHAT_MEMBER_STATUS_MEMBER))
 
-    chat_member = session.query(DbChatMember).join(Chat).filter(*filters).one_or_none()
+    return select(DbChatMember).join(Chat).filter(*filters)
+
+
+def is_member(session: Session, user_id: int, chat_filter, is_admin=False) -> Optional[DbChatMember]:
+    chat_member = session.execute(is_member_statement(user_id, chat_filter, is_admin)).scalar_one_or_none()
 
     return chat_member
 
 
-def get_chat_member(session: Session, user_id: int, chat_filter) -> Optional[DbChatMember]:
-    chat_member = session.query(DbChatMember).join(Chat).filter(
+def get_cached_membership(user_id: int, chat_flag: str) -> Tuple[bool, Optional[str]]:
+    """returns whether the membership was in the cache (and not expired), and the cached status"""
+    key = (user_id, chat_flag)
+    cached = MembershipCache.entries.get(key)
+    if cached and cached[1] > time.monotonic():
+        MembershipCache.hits += 1
+        MembershipCache.entries.move_to_end(key)
+        return True, cached[0]
+
+    MembershipCache.misses += 1
+    return False, None
+
+
+def membership_status_matches(status: Optional[str], is_admin=False) -> bool:
+    return status in (CHAT_MEMBER_STATUS_ADMIN if is_admin else CHAT_MEMBER_STATUS_MEMBER)
+
+
+def is_member_cached(session: Session, user_id: int, chat_filter, is_admin=False) -> bool:
+    """same as bool(is_member()), but for the staff/users/events chats the result is served from memory.
+    Entries are refreshed when a ChatMember is saved, and expire after MembershipCache.ttl seconds"""
+    if chat_filter.key not in MEMBERSHIP_CACHE_FLAGS:
+        return bool(is_member(session, user_id, chat_filter, is_admin=is_admin))
+
+    cached, status = get_cached_membership(user_id, chat_filter.key)
+    if not cached:
+        chat_member = get_chat_member(session, user_id, chat_filter)
+        status = chat_member.status if chat_member else None
+        set_cached_membership(user_id, chat_filter.key, status)
+
+    return membership_status_matches(status, is_admin)
+
+
+def get_chat_member_statement(user_id: int, chat_filter):
+    return select(DbChatMember).join(Chat).filter(
         DbChatMember.user_id == user_id,
         chat_filter == true()
-    ).one_or_none()
+    )
+
+
+def get_chat_member(session: Session, user_id: int, chat_filter) -> Optional[DbChatMember]:
+    chat_member = session.execute(get_chat_member_statement(user_id, chat_filter)).scalar_one_or_none()
 
     return chat_member
 
 
-def get_chat_member_by_id(session: Session, user_id: int, chat_id: int) -> Optional[DbChatMember]:
-    chat_member = session.query(DbChatMember).filter(
+def get_chat_member_by_id_statement(user_id: int, chat_id: int):
+    return select(DbChatMember).filter(
         DbChatMember.user_id == user_id,
         DbChatMember.chat_id == chat_id
-    ).one_or_none()
+    )
+
+
+def get_chat_member_by_id(session: Session, user_id: int, chat_id: int) -> Optional[DbChatMember]:
+    chat_member = session.execute(get_chat_member_by_id_statement(user_id, chat_id)).scalar_one_or_none()
 
     return chat_member
 
 
-def get_user_chat_members(session: Session, user_id: int):
-    query = session.query(DbChatMember).join(Chat).filter(
+def get_user_chat_members_statement(user_id: int):
+    return select(DbChatMember).join(Chat).filter(
         DbChatMember.user_id == user_id
     )
 
-    return session.scalars(query)
 
+def get_user_chat_members(session: Session, user_id: int):
+    return session.scalars(get_user_chat_members_statement(user_id))
 
-def get_chat_chat_members(session: Session, chat_filter, admins_only: bool = False):
+
+def get_chat_chat_members_statement(chat_filter, admins_only: bool = False):
     filters = [chat_filter == true()]
     if admins_only:
         filters.append(DbChatMember.status.in_(CHAT_MEMBER_STATUS_ADMIN))
 
-    query = session.query(DbChatMember).join(Chat).filter(*filters)
+    return select(DbChatMember).join(Chat).filter(*filters)
 
-    return session.scalars(query)
+
+def get_chat_chat_members(session: Session, chat_filter, admins_only: bool = False):
+    return session.scalars(get_chat_chat_members_statement(chat_filter, admins_only))
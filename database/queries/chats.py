@@ -1,6 +1,7 @@
-from typing import Optional, Tuple
+import logging
+from typing import Optional, Tuple, Dict, Set, Callable, List, Iterable
 
-from sqlalchemy import true, select, update, or_
+from sqlalchemy import true, select, update, or_, inspect
 from sqlalchemy.orm import Session
 from telegram import Chat as TelegramChat
 from telegram import ChatMember
@@ -8,14 +9,44 @@ from telegram import ChatMember
 from database.models import Chat, ChatMember as DbChatMember, chat_members_to_dict
 from database.queries import users
 
+logger = logging.getLogger(__name__)
+
+# Chat columns that mark a chat as one of the special chats (at most one chat per flag)
+SPECIAL_CHAT_FLAGS = ("is_staff_chat", "is_users_chat", "is_evaluation_chat", "is_log_chat", "is_modlog_chat", "is_events_chat")
+
+
+class CachedChat:
+    """Read-only snapshot of a Chat, safe to keep around after the session that loaded it is closed"""
+
+    def __init__(self, chat: Chat):
+        for column_attr in inspect(Chat).column_attrs:
+            setattr(self, column_attr.key, getattr(chat, column_attr.key))
+
+    # these methods only read columns, so they work on the snapshot too
+    title_escaped = Chat.title_escaped
+    type_pretty = Chat.type_pretty
+    type_pretty_it = Chat.type_pretty_it
+    is_special_chat = Chat.is_special_chat
+    is_network_chat = Chat.is_network_chat
+
+
+class SpecialChatsCache:
+    # None: not loaded yet. Otherwise: special chat flag -> CachedChat (or None if no chat has that flag)
+    chats: Optional[Dict[str, Optional[CachedChat]]] = None
+    network_chat_ids: Set[int] = set()
+    # called with (chats, network_chat_ids) every time the cache is refreshed
+    refresh_callbacks: List[Callable] = []
+    hits = 0
+    misses = 0
+
 
 def get_chat(session: Session, chat_filter) -> Optional[Chat]:
     chat: Optional[Chat] = session.query(Chat).filter(chat_filter == true()).one_or_none()
     return chat
 
 
-def get_core_chats(session: Session):
-    query = session.query(Chat).filter(or_(
+def get_core_chats_statement():
+    return select(Chat).filter(or_(
         Chat.is_staff_chat == true(),
         Chat.is_evaluation_chat == true(),
         Chat.is_users_chat == true(),
@@ -25,7 +56,51 @@ def get_core_chats(session: Session):
         Chat.network_chat == true(),
     ))
 
-    return session.scalars(query)
+
+def get_core_chats(session: Session):
+    return session.scalars(get_core_chats_statement())
+
+
+def add_refresh_callback(callback: Callable):
+    SpecialChatsCache.refresh_callbacks.append(callback)
+
+
+def set_cache(core_chats: Iterable[Chat]):
+    logger.debug("refreshing special chats cache")
+
+    special_chats = {flag: None for flag in SPECIAL_CHAT_FLAGS}
+    network_chat_ids = set()
+    for chat in core_chats:
+        network_chat_ids.add(chat.chat_id)
+        for flag in SPECIAL_CHAT_FLAGS:
+            if getattr(chat, flag):
+                special_chats[flag] = CachedChat(chat)
+
+    SpecialChatsCache.chats = special_chats
+    SpecialChatsCache.network_chat_ids = network_chat_ids
+
+    for callback in SpecialChatsCache.refresh_callbacks:
+        callback(special_chats, network_chat_ids)
+
+
+def refresh_cache(session: Session):
+    """must be called after a chat's role (or the bot's permissions in a special chat) has been changed and committed"""
+    set_cache(get_core_chats(session))
+
+
+def get_cache_stats() -> dict:
+    return dict(hits=SpecialChatsCache.hits, misses=SpecialChatsCache.misses, loaded=SpecialChatsCache.chats is not None)
+
+
+def get_cached_chat(session: Session, chat_filter) -> Optional[CachedChat]:
+    """same as get_chat(), but served from memory. Use get_chat() when the returned object has to be modified"""
+    if SpecialChatsCache.chats is None:
+        SpecialChatsCache.misses += 1
+        refresh_cache(session)
+    else:
+        SpecialChatsCache.hits += 1
+
+    return SpecialChatsCache.chats[chat_filter.key]
 
 
 def reset_staff_chat(session: Session):
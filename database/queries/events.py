@@ -1,13 +1,13 @@
 import datetime
 from typing import Optional, List, Any, Tuple
 
-from sqlalchemy import select, false, null, true, or_, and_
+from sqlalchemy import select, false, null, true, or_, and_, func
 from sqlalchemy.orm import Session
 from telegram import Message
 
 import utilities
 from config import config
-from database.models import Event, Chat
+from database.models import Event, Chat, EventHashtag
 
 
 def get_or_create(session: Session, chat_id: int, message_id: int, create_if_missing=True, commit=False) -> Optional[Event]:
@@ -45,8 +45,7 @@ def get_event_from_channel_or_discussion_group(session: Session, chat_id: int, m
     ).one_or_none()
 
 
-def get_events(
-        session: Session,
+def get_events_statement(
         skip_canceled: bool = False,
         filters: Optional[List] = None,
         order_by: Optional[List] = None  # list of Event class property to use as order_by
@@ -65,13 +64,22 @@ def get_events(
     if not order_by:
         order_by = []
 
-    query = select(Event).join(Chat).filter(*filters).order_by(*order_by)
+    return select(Event).join(Chat).filter(*filters).order_by(*order_by)
+
+
+def get_events(
+        session: Session,
+        skip_canceled: bool = False,
+        filters: Optional[List] = None,
+        order_by: Optional[List] = None  # list of Event class property to use as order_by
+):
+    query = get_events_statement(skip_canceled, filters, order_by)
     # print(query)
 
     return session.scalars(query)
 
 
-def get_week_events(session: Session, now: datetime.datetime, filters: List, weeks: int = 1) -> Tuple[Any, datetime.datetime, datetime.datetime]:
+def get_week_events_statement(now: datetime.datetime, filters: List, weeks: int = 1) -> Tuple[Any, datetime.date, datetime.date]:
     additional_days = 0 if weeks <= 1 else 7 * weeks
 
     last_monday = utilities.previous_weekday(today=now.date(), weekday=0)
@@ -102,15 +110,67 @@ def get_week_events(session: Session, now: datetime.datetime, filters: List, wee
         Event.message_id
     )
 
+    return statement, last_monday, next_monday
+
+
+def get_week_events(session: Session, now: datetime.datetime, filters: List, weeks: int = 1) -> Tuple[Any, datetime.date, datetime.date]:
+    statement, last_monday, next_monday = get_week_events_statement(now, filters, weeks)
+
     return session.scalars(statement), last_monday, next_monday
 
 
-def get_all_events(session: Session):
-    statement = select(Event).where().order_by(
+def get_events_with_hashtag_statement(
+        hashtag: str,
+        start_date: Optional[datetime.date] = None,
+        end_date: Optional[datetime.date] = None,
+        skip_canceled: bool = False,
+        filters: Optional[List] = None,
+        order_by: Optional[List] = None  # list of Event class property to use as order_by
+):
+    """events with the given hashtag (with or without the '#') taking place between start_date and end_date
+    (both included, either can be omitted). Events without an end date are considered one-day events"""
+
+    filters = list(filters or [])  # do not alter the caller's list
+
+    hashtag = hashtag.lower()
+    if not hashtag.startswith("#"):
+        hashtag = f"#{hashtag}"
+
+    if start_date:
+        filters.append(func.coalesce(Event.end_date, Event.start_date) >= start_date)
+    if end_date:
+        filters.append(Event.start_date <= end_date)
+
+    if not order_by:
+        order_by = [Event.start_date, Event.message_id]
+
+    statement = get_events_statement(skip_canceled, filters, order_by)
+
+    return statement.join(EventHashtag).filter(EventHashtag.hashtag == hashtag)
+
+
+def get_events_with_hashtag(
+        session: Session,
+        hashtag: str,
+        start_date: Optional[datetime.date] = None,
+        end_date: Optional[datetime.date] = None,
+        skip_canceled: bool = False,
+        filters: Optional[List] = None,
+        order_by: Optional[List] = None
+):
+    statement = get_events_with_hashtag_statement(hashtag, start_date, end_date, skip_canceled, filters, order_by)
+
+    return session.scalars(statement)
+
+
+def get_all_events_statement():
+    return select(Event).where().order_by(
         Event.start_year,
         Event.start_month,
         Event.start_day,
         Event.message_id
     )
 
-    return session.scalars(statement)
+
+def get_all_events(session: Session):
+    return session.scalars(get_all_events_statement())
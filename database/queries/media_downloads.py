@@ -0,0 +1,58 @@
+import datetime
+from typing import Optional, Iterable, List, Tuple
+
+from sqlalchemy import select, func, tuple_, false
+from sqlalchemy.orm import Session
+
+from database.models import MediaDownload, MediaDownloadStatus, Event
+
+
+def get(session: Session, chat_id: int, message_id: int) -> Optional[MediaDownload]:
+    return session.get(MediaDownload, (chat_id, message_id))
+
+
+def get_next_queued(session: Session, now: datetime.datetime, skip_file_unique_ids: Iterable[str] = ()) -> Optional[MediaDownload]:
+    """the oldest download that is due. 'skip_file_unique_ids': files that are being downloaded by another worker"""
+    filters = [
+        MediaDownload.status == MediaDownloadStatus.QUEUED,
+        MediaDownload.next_attempt_on <= now
+    ]
+    if skip_file_unique_ids:
+        filters.append(MediaDownload.file_unique_id.not_in(list(skip_file_unique_ids)))
+
+    statement = select(MediaDownload).filter(*filters).order_by(MediaDownload.next_attempt_on).limit(1)
+
+    return session.scalars(statement).first()
+
+
+def count_by_status(session: Session) -> dict:
+    statement = select(MediaDownload.status, func.count()).group_by(MediaDownload.status)
+
+    return {status: count for status, count in session.execute(statement)}
+
+
+def get_image_hashes(session: Session):
+    statement = select(
+        MediaDownload.chat_id,
+        MediaDownload.message_id,
+        MediaDownload.phash,
+        MediaDownload.dhash
+    ).filter(MediaDownload.phash.is_not(None))
+
+    return session.execute(statement).all()
+
+
+def get_events(session: Session, keys: List[Tuple[int, int]]) -> List[Event]:
+    """the (not deleted) events the downloads were queued for"""
+    if not keys:
+        return []
+
+    statement = select(Event).join(
+        MediaDownload,
+        (MediaDownload.event_chat_id == Event.chat_id) & (MediaDownload.event_message_id == Event.message_id)
+    ).filter(
+        tuple_(MediaDownload.chat_id, MediaDownload.message_id).in_(keys),
+        Event.deleted == false()
+    ).distinct()
+
+    return session.scalars(statement).all()
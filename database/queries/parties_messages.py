@@ -1,18 +1,22 @@
 from typing import Optional
 
-from sqlalchemy import false
+from sqlalchemy import false, select
 from sqlalchemy.orm import Session
 
 from database.models import PartiesMessage
 
 
-def get_last_parties_message(session: Session, chat_id: int, events_type: str):
-    parties_message: Optional[PartiesMessage] = (session.query(PartiesMessage).filter(
+def get_last_parties_message_statement(chat_id: int, events_type: str):
+    return select(PartiesMessage).filter(
         PartiesMessage.chat_id == chat_id,
         PartiesMessage.events_type == events_type,
         PartiesMessage.deleted == false(),
         PartiesMessage.ignore == false()
-    ).order_by(PartiesMessage.message_date.desc()).first())
+    ).order_by(PartiesMessage.message_date.desc()).limit(1)
+
+
+def get_last_parties_message(session: Session, chat_id: int, events_type: str):
+    parties_message: Optional[PartiesMessage] = session.scalars(get_last_parties_message_statement(chat_id, events_type)).first()
 
     return parties_message
 
@@ -1,4 +1,5 @@
-from typing import Optional, Union, List
+import logging
+from typing import Optional, Union, List, Dict, Iterable
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
@@ -6,14 +7,36 @@ from sqlalchemy.orm import Session
 from constants import BOT_SETTINGS_DEFAULTS
 from database.models import BotSetting
 
+logger = logging.getLogger(__name__)
+
+
+class CachedBotSetting:
+    """Read-only snapshot of a BotSetting, safe to keep around after the session that loaded it is closed"""
+
+    def __init__(self, setting: BotSetting):
+        self.key = setting.key
+        self.category = setting.category
+        self.value_type = setting.value_type
+        self.value_media_type = setting.value_media_type
+        self.cached_value = setting.value()
+
+    def value(self):
+        return self.cached_value
+
+
+class SettingsCache:
+    # None: not loaded yet, or dropped because a setting was changed
+    settings: Optional[Dict[str, CachedBotSetting]] = None
+    hits = 0
+    misses = 0
+
 
 def get_settings(session: Session):
     statement = select(BotSetting).where()
     return session.scalars(statement)
 
 
-def get_settings_as_dict(
-        session: Session,
+def get_settings_as_dict_statement(
         include_categories: Optional[Union[List[str], str]] = None,
         exclude_categories: Optional[Union[List[str], str]] = None
 ):
@@ -27,7 +50,15 @@ def get_settings_as_dict(
             exclude_categories = [exclude_categories]
         filters.append(BotSetting.category.not_in(exclude_categories))
 
-    statement = select(BotSetting).filter(*filters)
+    return select(BotSetting).filter(*filters)
+
+
+def get_settings_as_dict(
+        session: Session,
+        include_categories: Optional[Union[List[str], str]] = None,
+        exclude_categories: Optional[Union[List[str], str]] = None
+):
+    statement = get_settings_as_dict_statement(include_categories, exclude_categories)
     settings_dict = {}
     for setting in session.scalars(statement):
         settings_dict[setting.key] = setting
@@ -42,3 +73,60 @@ def get_or_create(session: Session, key: str, create_if_missing=True, value=None
         session.add(setting)
 
     return setting
+
+
+def drop_cache():
+    """must be called after a setting has been changed and committed"""
+    logger.debug("dropping settings cache")
+    SettingsCache.settings = None
+
+
+def get_cache_stats() -> dict:
+    return dict(hits=SettingsCache.hits, misses=SettingsCache.misses, loaded=SettingsCache.settings is not None)
+
+
+def set_cache(bot_settings: Iterable[BotSetting]):
+    logger.debug("loading settings cache")
+    SettingsCache.settings = {setting.key: CachedBotSetting(setting) for setting in bot_settings}
+
+
+def load_cache(session: Session):
+    set_cache(get_settings(session))
+
+
+def get_cached_categories(include_categories: Optional[Union[List[str], str]] = None) -> Dict[str, CachedBotSetting]:
+    """the cached settings of the passed categories (all if None). The cache must be loaded"""
+    if isinstance(include_categories, str):
+        include_categories = [include_categories]
+
+    return {key: setting for key, setting in SettingsCache.settings.items() if not include_categories or setting.category in include_categories}
+
+
+def get_cached(session: Session, key: str) -> CachedBotSetting:
+    if SettingsCache.settings is None:
+        SettingsCache.misses += 1
+        load_cache(session)
+    elif key not in SettingsCache.settings:
+        SettingsCache.misses += 1
+    else:
+        SettingsCache.hits += 1
+
+    if key not in SettingsCache.settings:
+        # the setting does not exist yet: create it the same way get_or_create() would
+        SettingsCache.settings[key] = CachedBotSetting(get_or_create(session, key))
+
+    return SettingsCache.settings[key]
+
+
+def get_value(session: Session, key: str):
+    return get_cached(session, key).value()
+
+
+def get_cached_as_dict(session: Session, include_categories: Optional[Union[List[str], str]] = None) -> Dict[str, CachedBotSetting]:
+    if SettingsCache.settings is None:
+        SettingsCache.misses += 1
+        load_cache(session)
+    else:
+        SettingsCache.hits += 1
+
+    return get_cached_categories(include_categories)
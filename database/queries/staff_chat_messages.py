@@ -1,22 +1,185 @@
 import datetime
+import hashlib
 import logging
-from typing import Optional
+import math
+from typing import Optional, List, Tuple, Dict, Set
 
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, tuple_
 from sqlalchemy.orm import Session
 from telegram import Message
 
+import text_hashes
 import utilities
-from database.models import StaffChatMessage
+from config import config
+from database.models import StaffChatMessage, StaffChatMessageTextBucket
 
 logger = logging.getLogger(__name__)
 
+# older messages are deleted by delete_old_messages_job
+MESSAGES_RETENTION_DAYS = 30 * 3
+
 
 class MinLength:
     TEXT = 60
     CAPTION = 60
 
 
+class BloomFilter:
+    """Set membership in a fixed amount of memory: if a value is not in the filter, it was never added. If it is,
+    it was probably added (false positives rate: 'error_rate', as long as no more than 'capacity' values are added).
+    Values cannot be removed: the filter must be rebuilt"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits_count = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes_count = max(1, round(self.bits_count / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.bits_count / 8))
+        self.count = 0
+
+    def positions(self, value: str):
+        # double hashing: k positions from two 64 bit hashes
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return [(h1 + i * h2) % self.bits_count for i in range(self.hashes_count)]
+
+    def add(self, value: str):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+
+class RecentMessagesIndex:
+    """text_hash/media_file_unique_id/LSH bucket -> staff chat messages with that value, for all the saved messages
+    (that is, the ones in the retention window), plus the MinHash signature of each message. The bloom filter in
+    front of it answers the common "not a duplicate" case. Loaded at startup, updated when a message is saved,
+    rebuilt after the old messages are deleted"""
+    # None: not loaded yet, find_duplicates() and find_similar_texts() will query the db
+    entries: Optional[Dict[str, Set[Tuple[int, int]]]] = None
+    text_minhashes: Dict[Tuple[int, int], List[int]] = {}
+    bloom_filter: Optional[BloomFilter] = None
+    bloom_capacity = config.settings.get("duplicates_bloom_capacity", 200000)
+    bloom_error_rate = config.settings.get("duplicates_bloom_error_rate", 0.01)
+
+    bloom_negatives = 0  # lookups answered by the bloom filter alone
+    bloom_false_positives = 0
+    lookups = 0
+
+
+def get_index_values(text_hash: Optional[str], media_file_unique_id: Optional[str], text_minhash: Optional[List[int]] = None) -> List[str]:
+    values = []
+    if text_hash:
+        values.append(f"text:{text_hash}")
+    if media_file_unique_id:
+        values.append(f"media:{media_file_unique_id}")
+    if text_minhash:
+        values.extend(f"bucket:{bucket}" for bucket in text_hashes.get_lsh_buckets(text_minhash))
+
+    return values
+
+
+def find_in_index(values: List[str], message: Message) -> Set[Tuple[int, int]]:
+    """keys of the other messages of the same chat that have at least one of the values"""
+    RecentMessagesIndex.lookups += 1
+
+    keys = set()
+    bloom_positive = False
+    for value in values:
+        if value not in RecentMessagesIndex.bloom_filter:
+            continue
+
+        bloom_positive = True
+        if value not in RecentMessagesIndex.entries:
+            RecentMessagesIndex.bloom_false_positives += 1
+            continue
+
+        value_keys = RecentMessagesIndex.entries[value] - {(message.chat.id, message.message_id)}
+        keys.update(key for key in value_keys if key[0] == message.chat.id)
+
+    if not bloom_positive:
+        RecentMessagesIndex.bloom_negatives += 1
+
+    return keys
+
+
+def rebuild_bloom_filter():
+    capacity = RecentMessagesIndex.bloom_capacity
+    while capacity < len(RecentMessagesIndex.entries) * 2:
+        capacity *= 2
+
+    RecentMessagesIndex.bloom_filter = BloomFilter(capacity, RecentMessagesIndex.bloom_error_rate)
+    for value in RecentMessagesIndex.entries:
+        RecentMessagesIndex.bloom_filter.add(value)
+
+
+def index_message(message: Message, text_minhash: Optional[List[int]] = None):
+    """add the message's hashes to the index. The values are taken from the Message (the same ones
+    StaffChatMessage.update_message_metadata() saves), so the committed row doesn't have to be reloaded.
+    Must be called after find_duplicates() and find_similar_texts(), otherwise the message would match itself
+    in the bloom filter"""
+    if RecentMessagesIndex.entries is None:
+        return
+
+    text = message.text or message.caption
+    text_hash = utilities.generate_text_hash(text) if text else None
+    media_file_unique_id = None
+    if utilities.contains_media_with_file_id(message):
+        _, media_file_unique_id, _ = utilities.get_media_ids(message)
+
+    key = (message.chat.id, message.message_id)
+    if text_minhash:
+        RecentMessagesIndex.text_minhashes[key] = text_minhash
+    for value in get_index_values(text_hash, media_file_unique_id, text_minhash):
+        if value not in RecentMessagesIndex.entries:
+            RecentMessagesIndex.entries[value] = set()
+            RecentMessagesIndex.bloom_filter.add(value)
+        RecentMessagesIndex.entries[value].add(key)
+
+    if RecentMessagesIndex.bloom_filter.count > RecentMessagesIndex.bloom_filter.capacity:
+        # the false positives rate would grow
+        rebuild_bloom_filter()
+
+
+def load_recent_messages_index(session: Session):
+    statement = select(
+        StaffChatMessage.chat_id,
+        StaffChatMessage.message_id,
+        StaffChatMessage.text_hash,
+        StaffChatMessage.media_file_unique_id,
+        StaffChatMessage.text_minhash
+    )
+
+    entries = {}
+    text_minhashes = {}
+    for chat_id, message_id, text_hash, media_file_unique_id, text_minhash_str in session.execute(statement):
+        text_minhash = text_hashes.minhash_from_str(text_minhash_str) if text_minhash_str else None
+        if text_minhash:
+            text_minhashes[(chat_id, message_id)] = text_minhash
+        for value in get_index_values(text_hash, media_file_unique_id, text_minhash):
+            entries.setdefault(value, set()).add((chat_id, message_id))
+
+    RecentMessagesIndex.entries = entries
+    RecentMessagesIndex.text_minhashes = text_minhashes
+    rebuild_bloom_filter()
+    logger.info(f"loaded {len(entries)} staff chat messages hashes (bloom filter: {RecentMessagesIndex.bloom_filter.capacity} values)")
+
+
+def get_recent_messages_index_stats() -> dict:
+    loaded = RecentMessagesIndex.entries is not None
+    return dict(
+        loaded=loaded,
+        values=len(RecentMessagesIndex.entries) if loaded else 0,
+        text_minhashes=len(RecentMessagesIndex.text_minhashes),
+        bloom_capacity=RecentMessagesIndex.bloom_filter.capacity if loaded else 0,
+        lookups=RecentMessagesIndex.lookups,
+        bloom_negatives=RecentMessagesIndex.bloom_negatives,
+        bloom_false_positives=RecentMessagesIndex.bloom_false_positives
+    )
+
+
 def get_or_create(session: Session, message: Message, create_if_missing=True, commit=False) -> Optional[StaffChatMessage]:
     staff_chat_message: StaffChatMessage = session.query(StaffChatMessage).filter(
         StaffChatMessage.chat_id == message.chat.id,
@@ -32,35 +195,105 @@ def get_or_create(session: Session, message: Message, create_if_missing=True, co
     return staff_chat_message
 
 
-def find_duplicates(session: Session, message: Message):
-    filters = [
-        StaffChatMessage.chat_id == message.chat.id,
-        StaffChatMessage.message_id != message.message_id,  # we already saved 'message' when the function is called
-        # StaffChatMessage.text_hashing_version == HashingVersion.CURRENT
+def find_duplicates_in_index(session: Session, message: Message, text_hash: Optional[str], media_file_unique_id: Optional[str]) -> List[StaffChatMessage]:
+    keys = find_in_index(get_index_values(text_hash, media_file_unique_id), message)
+    if not keys:
+        return []
+
+    # the index might still contain the old values of edited messages: double check them
+    duplicates = [
+        d for d in get_by_keys(session, list(keys))
+        if (text_hash and d.text_hash == text_hash) or (media_file_unique_id and d.media_file_unique_id == media_file_unique_id)
     ]
+    return sorted(duplicates, key=lambda d: d.message_id, reverse=True)
 
+
+def find_duplicates(session: Session, message: Message):
+    text_hash, media_file_unique_id = None, None
     if message.text and len(message.text) > MinLength.TEXT:
         text_hash = utilities.generate_text_hash(message.text)
-        filters.append(StaffChatMessage.text_hash == text_hash)
     elif message.caption and len(message.caption) > MinLength.CAPTION and utilities.contains_media_with_file_id(message):
         _, media_file_unique_id, _ = utilities.get_media_ids(message)
-        caption_text_hash = utilities.generate_text_hash(message.caption)
-
-        filters.append(
-            ((StaffChatMessage.media_file_unique_id == media_file_unique_id) | (StaffChatMessage.text_hash == caption_text_hash))
-        )
+        text_hash = utilities.generate_text_hash(message.caption)
     elif utilities.contains_media_with_file_id(message):
         # if no caption or caption is too chort, just check the file_unique_id
         _, media_file_unique_id, _ = utilities.get_media_ids(message)
-        filters.append(StaffChatMessage.media_file_unique_id == media_file_unique_id)
     else:
         return []
 
+    if RecentMessagesIndex.entries is not None:
+        return find_duplicates_in_index(session, message, text_hash, media_file_unique_id)
+
+    filters = [
+        StaffChatMessage.chat_id == message.chat.id,
+        StaffChatMessage.message_id != message.message_id,  # we already saved 'message' when the function is called
+        # StaffChatMessage.text_hashing_version == HashingVersion.CURRENT
+    ]
+    if text_hash and media_file_unique_id:
+        filters.append((StaffChatMessage.media_file_unique_id == media_file_unique_id) | (StaffChatMessage.text_hash == text_hash))
+    elif text_hash:
+        filters.append(StaffChatMessage.text_hash == text_hash)
+    else:
+        filters.append(StaffChatMessage.media_file_unique_id == media_file_unique_id)
+
     statement = select(StaffChatMessage).filter(*filters).order_by(StaffChatMessage.message_id.desc())
 
     return session.scalars(statement).all()
 
 
+def find_similar_texts(session: Session, message: Message, text_minhash: List[int], min_similarity: float) -> List[StaffChatMessage]:
+    """messages whose text is similar to the message's text/caption, even if not identical. Only the messages
+    sharing at least one LSH bucket with the message are compared, so the cost doesn't depend on the table's size.
+    'text_minhash': the message's signature (see StaffChatMessage.get_text_minhash())"""
+    text = message.text or message.caption
+    min_length = MinLength.TEXT if message.text else MinLength.CAPTION
+    if not text or len(text) <= min_length or not text_minhash:
+        return []
+
+    if RecentMessagesIndex.entries is not None:
+        # candidates and signatures are in memory: the db is queried only to fetch the matches
+        keys = find_in_index(get_index_values(None, None, text_minhash), message)
+        similar_keys = [
+            key for key in keys
+            if text_hashes.minhash_similarity(text_minhash, RecentMessagesIndex.text_minhashes.get(key, [])) >= min_similarity
+        ]
+        # the signatures are replaced when a message is edited, so there's no need to check them again
+        return get_by_keys(session, similar_keys)
+
+    # a subquery instead of a join, so sqlite starts from the buckets index instead of scanning the chat's messages
+    candidates_keys = select(StaffChatMessageTextBucket.chat_id, StaffChatMessageTextBucket.message_id).filter(
+        StaffChatMessageTextBucket.bucket.in_(text_hashes.get_lsh_buckets(text_minhash)),
+        StaffChatMessageTextBucket.chat_id == message.chat.id,
+        StaffChatMessageTextBucket.message_id != message.message_id
+    )
+    statement = select(StaffChatMessage).filter(tuple_(StaffChatMessage.chat_id, StaffChatMessage.message_id).in_(candidates_keys))
+
+    return [
+        candidate for candidate in session.scalars(statement).all()
+        if text_hashes.minhash_similarity(text_minhash, candidate.get_text_minhash()) >= min_similarity
+    ]
+
+
+def get_image_hashes(session: Session):
+    statement = select(
+        StaffChatMessage.chat_id,
+        StaffChatMessage.message_id,
+        StaffChatMessage.media_phash,
+        StaffChatMessage.media_dhash
+    ).filter(StaffChatMessage.media_phash.is_not(None))
+
+    return session.execute(statement).all()
+
+
+def get_by_keys(session: Session, keys: List[Tuple[int, int]]) -> List[StaffChatMessage]:
+    if not keys:
+        return []
+
+    statement = select(StaffChatMessage).filter(tuple_(StaffChatMessage.chat_id, StaffChatMessage.message_id).in_(keys))
+
+    return session.scalars(statement).all()
+
+
 def select_old_messages(session: Session, older_than: datetime.datetime):
     statement = select(StaffChatMessage).filter(
         StaffChatMessage.message_date < older_than
@@ -70,6 +303,12 @@ def select_old_messages(session: Session, older_than: datetime.datetime):
 
 
 def delete_old_messages(session: Session, older_than: datetime.datetime):
+    # bulk deletes don't go through the relationship cascade
+    old_messages_keys = select(StaffChatMessage.chat_id, StaffChatMessage.message_id).where(StaffChatMessage.message_date < older_than)
+    session.execute(delete(StaffChatMessageTextBucket).where(
+        tuple_(StaffChatMessageTextBucket.chat_id, StaffChatMessageTextBucket.message_id).in_(old_messages_keys)
+    ))
+
     statement = delete(StaffChatMessage).where(StaffChatMessage.message_date < older_than)
 
     result = session.execute(statement)
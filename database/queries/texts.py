@@ -1,10 +1,31 @@
-from typing import Optional
+import logging
+from typing import Optional, Dict, Tuple
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from database.models import LocalizedText
 
+logger = logging.getLogger(__name__)
+
+
+class CachedLocalizedText:
+    """Read-only snapshot of a LocalizedText, safe to keep around after the session that loaded it is closed"""
+
+    def __init__(self, ltext: LocalizedText):
+        self.key = ltext.key
+        self.language = ltext.language
+        self.value = ltext.value
+
+
+class TextsCache:
+    # None: not loaded yet, or dropped because a text was changed
+    texts: Optional[Dict[Tuple[str, str], CachedLocalizedText]] = None
+    # (key, language, fallback_language) -> text the fallback chain resolves to (None if neither exists)
+    resolved: Dict[Tuple[str, str, str], Optional[CachedLocalizedText]] = {}
+    hits = 0
+    misses = 0
+
 
 def get_localized_text(
         session: Session,
@@ -76,3 +97,43 @@ def get_or_create_localized_text(session: Session, key: str, language: str, crea
         session.add(text)
 
     return text
+
+
+def drop_cache():
+    """must be called after a text has been changed and committed"""
+    logger.debug("dropping localized texts cache")
+    TextsCache.texts = None
+    TextsCache.resolved = {}
+
+
+def get_cache_stats() -> dict:
+    return dict(hits=TextsCache.hits, misses=TextsCache.misses, resolved=len(TextsCache.resolved), loaded=TextsCache.texts is not None)
+
+
+def get_cached_with_fallback(
+        session: Session,
+        key: str,
+        language: str,
+        fallback_language: str,
+        raise_if_no_fallback: Optional[bool] = True
+) -> Optional[CachedLocalizedText]:
+    """same as get_localized_text_with_fallback(), but served from memory. All texts are loaded with a single
+    query the first time, then each (key, language, fallback_language) combination is resolved only once"""
+
+    resolved_key = (key, language, fallback_language)
+    if TextsCache.texts is not None and resolved_key in TextsCache.resolved:
+        TextsCache.hits += 1
+        text = TextsCache.resolved[resolved_key]
+    else:
+        TextsCache.misses += 1
+        if TextsCache.texts is None:
+            logger.debug("loading localized texts cache")
+            TextsCache.texts = {(ltext.key, ltext.language): CachedLocalizedText(ltext) for ltext in session.scalars(select(LocalizedText))}
+
+        text = TextsCache.texts.get((key, language)) or TextsCache.texts.get((key, fallback_language))
+        TextsCache.resolved[resolved_key] = text
+
+    if not text and raise_if_no_fallback:
+        raise ValueError(f"no {language}/{fallback_language} <{key}> text")
+
+    return text
@@ -2,6 +2,7 @@ import logging
 from functools import wraps
 from typing import Optional
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 # noinspection PyPackageRequirements
 from telegram import Update, ReplyKeyboardRemove, ReplyParameters
@@ -13,9 +14,10 @@ from telegram.ext import CallbackContext, ConversationHandler
 import utilities
 from config import config
 from constants import TempDataKey
-from database.base import get_session
+from database.base import get_session, session_scope, get_async_session
 from database.models import User, Chat
 from database.queries import chats, chat_members, users, private_chat_messages
+from database.async_queries import users as async_users, chats as async_chats
 from emojis import Emoji
 
 logger = logging.getLogger(__name__)
@@ -76,7 +78,8 @@ def catch_exception(silent=False, ignore_message_not_modified_exception=False):
                     if sent_message.chat.id > 0:
                         # only save if we sent the message in a private chat
                         try:
-                            private_chat_messages.save(get_session(), sent_message, commit=True)
+                            with session_scope() as session:
+                                private_chat_messages.save(session, sent_message)
                         except Exception as e:
                             logger.warning(f"error while saving \"an error occurred\" message: {e}")
 
@@ -187,6 +190,9 @@ def pass_session(
                 if not pass_down_db_instances:
                     context.chat_data.pop(TempDataKey.DB_INSTANCES, None)
 
+                # the session will not be recycled, so we can give its connection back to the pool
+                session.close()
+
                 # raise the exception anyway, so outher decorators can catch it
                 raise
 
@@ -201,6 +207,10 @@ def pass_session(
             logger_session.debug("committing session...")
             session.commit()
 
+            if not pass_down_db_instances:
+                # no other handler will use this session
+                session.close()
+
             return result
 
         return wrapped
@@ -236,11 +246,111 @@ def pass_session_job(
                     logger.warning(f"exception while running job ({e}): committing")
                     session.commit()
 
+                session.close()
+
                 # raise the exception anyway, so outher decorators can catch it
                 raise
 
             logger.debug("committing session...")
             session.commit()
+            session.close()
+
+            return result
+
+        return wrapped
+
+    return real_decorator
+
+
+def pass_async_session(
+        pass_user=False,
+        pass_chat=False,
+        rollback_on_exception=False,
+        commit_on_exception=True
+):
+    # async counterpart of pass_session(): the callback receives an AsyncSession and must use the queries
+    # in database.async_queries. Db instances cannot be passed down to other handlers groups
+
+    if all([rollback_on_exception, commit_on_exception]):
+        raise ValueError("'rollback_on_exception' and 'commit_on_exception' are mutually exclusive")
+
+    def real_decorator(func):
+        @wraps(func)
+        async def wrapped(update: Update, context: CallbackContext, *args, **kwargs):
+            logger_session.debug("fetching a new async session")
+            session: AsyncSession = get_async_session()
+
+            try:
+                if pass_user and update.effective_user:
+                    logger_session.debug("fetching User object")
+                    kwargs['user'] = await async_users.get_safe(session, update.effective_user, commit=True)
+
+                if pass_chat and update.effective_chat:
+                    if update.effective_chat.id > 0:
+                        logger_session.warning("'pass_chat' shouldn't be True for updates that come from private chats")
+                    else:
+                        logger_session.debug("fetching Chat object")
+                        kwargs['chat'] = await async_chats.get_safe(session, update.effective_chat, commit=True)
+
+                # noinspection PyBroadException
+                try:
+                    result = await func(update, context, session=session, *args, **kwargs)
+                except Exception as e:
+                    if rollback_on_exception:
+                        logger_session.warning(f"exception while running an handler callback ({e}): rolling back")
+                        await session.rollback()
+
+                    if commit_on_exception:
+                        logger_session.warning(f"exception while running an handler callback ({e}): committing")
+                        await session.commit()
+
+                    # raise the exception anyway, so outher decorators can catch it
+                    raise
+
+                logger_session.debug("committing async session...")
+                await session.commit()
+            finally:
+                await session.close()
+
+            return result
+
+        return wrapped
+
+    return real_decorator
+
+
+def pass_async_session_job(
+        rollback_on_exception=False,
+        commit_on_exception=True
+):
+    if all([rollback_on_exception, commit_on_exception]):
+        raise ValueError("'rollback_on_exception' and 'commit_on_exception' are mutually exclusive")
+
+    def real_decorator(func):
+        @wraps(func)
+        async def wrapped(context: CallbackContext, *args, **kwargs):
+            session: AsyncSession = get_async_session()
+
+            try:
+                # noinspection PyBroadException
+                try:
+                    result = await func(context, session=session, *args, **kwargs)
+                except Exception as e:
+                    if rollback_on_exception:
+                        logger.warning(f"exception while running job ({e}): rolling back")
+                        await session.rollback()
+
+                    if commit_on_exception:
+                        logger.warning(f"exception while running job ({e}): committing")
+                        await session.commit()
+
+                    # raise the exception anyway, so outher decorators can catch it
+                    raise
+
+                logger.debug("committing async session...")
+                await session.commit()
+            finally:
+                await session.close()
 
             return result
 
@@ -254,9 +364,9 @@ def staff_member():
         @wraps(func)
         async def wrapped(update: Update, context: CallbackContext, session: Session, *args, **kwargs):
             # we fetch the session once per message at max, cause the decorator is run only if a message passes filters
-            if not chat_members.is_member(session, update.effective_user.id, Chat.is_staff_chat) and not utilities.is_superadmin(update.effective_user):
+            if not chat_members.is_member_cached(session, update.effective_user.id, Chat.is_staff_chat) and not utilities.is_superadmin(update.effective_user):
                 logger.warning(f"{update.effective_user.id} ({update.effective_user.full_name}) not recognized as a member of {update.effective_chat.id} ({update.effective_chat.title})")
-                staff_chat = chats.get_chat(session, Chat.is_staff_chat)
+                staff_chat = chats.get_cached_chat(session, Chat.is_staff_chat)
                 await update.message.reply_text(f"You're not a member of {utilities.escape_html(staff_chat.title)}. "
                                                 f"If you think this is an error, please ask a recognized admin to "
                                                 f"use <code>/reloadadmins</code> in the staff chat")
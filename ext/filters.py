@@ -1,15 +1,12 @@
 import logging
 import re
-from typing import Iterable
-
-from sqlalchemy.orm import Session
+from typing import Optional, Dict, Set
 from telegram.ext import filters
 from telegram.ext.filters import MessageFilter
 
 import utilities
 from config import config
 from database.base import session_scope
-from database.models import Chat
 from database.queries import chats
 
 logger = logging.getLogger(__name__)
@@ -32,13 +29,22 @@ class FilterReplyToBot(MessageFilter):
 
 
 class FilterEventsChatMessageLink(MessageFilter):
-    def __init__(self, chat_id: int):
+    def __init__(self, chat_id: Optional[int] = None):
         super().__init__()
+        self.pattern = None
+        self.set_chat_id(chat_id)
+
+    def set_chat_id(self, chat_id: Optional[int]):
+        if not chat_id:
+            # no events chat set: never match
+            self.pattern = None
+            return
+
         chat_id = str(chat_id).replace("-100", "")
         self.pattern = rf"^https://t\.me/c/{chat_id}/\d+"
 
     def filter(self, message):
-        if message.text:
+        if self.pattern and message.text:
             return bool(re.search(self.pattern, message.text, re.I))
 
         return False
@@ -105,7 +111,7 @@ class Filter:
     REPLY_TO_AUTOMATIC_FORWARD = FilterReplyToAutomaticForward()
     RADAR_PASSWORD = FilterRadarPassword()
     FLY_MEDIA_DOWNLOAD = filters.PHOTO | filters.VIDEO | filters.ANIMATION  # media we can consider as fly, for backups
-    EVENTS_CHAT_MESSAGE_LINK = FilterFalse()  # we init this filter later
+    EVENTS_CHAT_MESSAGE_LINK = FilterEventsChatMessageLink()  # the events chat is set by update_chat_filters()
 
 
 class ChatFilter:
@@ -118,41 +124,35 @@ class ChatFilter:
     EVALUATION_LOG_GROUP_POST = filters.SenderChat([])  # filter to catch log post in the evaluation group
 
 
+def update_chat_filters(special_chats: Dict[str, Optional[chats.CachedChat]], network_chat_ids: Set[int]):
+    """called every time the special chats cache is refreshed, so the filters always match the current chats"""
+    logger.debug("updating chat filters...")
+
+    def chat_ids(flag: str):
+        chat = special_chats[flag]
+        return {chat.chat_id} if chat else set()
+
+    events_chat: Optional[chats.CachedChat] = special_chats["is_events_chat"]
+    logger.debug(f"EVENTS filter: {events_chat.chat_id if events_chat else None}")
+    ChatFilter.EVENTS.chat_ids = chat_ids("is_events_chat")
+    ChatFilter.EVENTS_GROUP_POST.chat_ids = chat_ids("is_events_chat")
+    Filter.EVENTS_CHAT_MESSAGE_LINK.set_chat_id(events_chat.chat_id if events_chat else None)
+
+    ChatFilter.STAFF.chat_ids = chat_ids("is_staff_chat")
+    ChatFilter.EVALUATION.chat_ids = chat_ids("is_evaluation_chat")
+    ChatFilter.EVALUATION_LOG_GROUP_POST.chat_ids = chat_ids("is_log_chat")
+    ChatFilter.USERS.chat_ids = chat_ids("is_users_chat")
+    ChatFilter.NETWORK.chat_ids = network_chat_ids
+    logger.debug(f"STAFF: {ChatFilter.STAFF.chat_ids}, EVALUATION: {ChatFilter.EVALUATION.chat_ids}, "
+                  f"EVALUATION_LOG_GROUP_POST: {ChatFilter.EVALUATION_LOG_GROUP_POST.chat_ids}, "
+                  f"USERS: {ChatFilter.USERS.chat_ids}, NETWORK: {ChatFilter.NETWORK.chat_ids}")
+
+
 def init_filters():
     logger.debug("initializing filters...")
+    chats.add_refresh_callback(update_chat_filters)
     with session_scope() as session:
-        session: Session
-
-        events_chat: Chat = chats.get_chat(session, Chat.is_events_chat)
-        if events_chat:
-            logger.debug(f"initializing EVENTS filter ({events_chat.chat_id})...")
-            ChatFilter.EVENTS.chat_ids = {events_chat.chat_id}
-            ChatFilter.EVENTS_GROUP_POST.chat_ids = {events_chat.chat_id}
-            Filter.EVENTS_CHAT_MESSAGE_LINK = FilterEventsChatMessageLink(events_chat.chat_id)
-
-        staff_chat: Chat = chats.get_chat(session, Chat.is_staff_chat)
-        if staff_chat:
-            logger.debug(f"initializing STAFF filter ({staff_chat.chat_id})...")
-            ChatFilter.STAFF.chat_ids = {staff_chat.chat_id}
-
-        evaluation_chat: Chat = chats.get_chat(session, Chat.is_evaluation_chat)
-        if evaluation_chat:
-            logger.debug(f"initializing EVALUATION filter ({evaluation_chat.chat_id})...")
-            ChatFilter.EVALUATION.chat_ids = {evaluation_chat.chat_id}
-
-        log_chat: Chat = chats.get_chat(session, Chat.is_log_chat)
-        if log_chat:
-            logger.debug(f"initializing EVALUATION_LOG_GROUP_POST filter ({log_chat.chat_id})...")
-            ChatFilter.EVALUATION_LOG_GROUP_POST.chat_ids = {log_chat.chat_id}
-
-        users_chat: Chat = chats.get_chat(session, Chat.is_users_chat)
-        if users_chat:
-            logger.debug(f"initializing USERS filter ({users_chat.chat_id})...")
-            ChatFilter.USERS.chat_ids = {users_chat.chat_id}
-
-        logger.info("initializing NETWORK filter...")
-        network_chats: Iterable[Chat] = chats.get_core_chats(session)
-        ChatFilter.NETWORK.chat_ids = {c.chat_id for c in network_chats}
+        chats.refresh_cache(session)
 
 
 init_filters()
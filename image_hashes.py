@@ -0,0 +1,155 @@
+"""Perceptual hashes of photos, and the in-memory indexes used to find near-duplicates of a flyer (the same image
+re-compressed, resized or slightly cropped, which has a different file_unique_id)"""
+
+import asyncio
+import io
+import itertools
+import logging
+import pathlib
+from collections import defaultdict
+from typing import Tuple, List, Dict, Set, Hashable, Union
+
+import imagehash
+from PIL import Image
+from sqlalchemy.orm import Session
+from telegram import Message, PhotoSize
+
+from config import config
+from database.queries import staff_chat_messages, media_downloads
+
+logger = logging.getLogger(__name__)
+
+# the smallest photo size at least this large is downloaded: hashes are computed on a 32x32 thumbnail anyway
+HASHED_PHOTO_SIZE = 320
+
+
+def compute_image_hashes(image: Union[bytes, pathlib.Path, str]) -> Tuple[str, str]:
+    """returns the (pHash, dHash) of the image as 16 chars hex strings. CPU-bound: run it in an executor"""
+    if isinstance(image, bytes):
+        image = io.BytesIO(image)
+
+    with Image.open(image) as pil_image:
+        return str(imagehash.phash(pil_image)), str(imagehash.dhash(pil_image))
+
+
+async def get_photo_hashes(message: Message) -> Tuple[str, str]:
+    photo_size: PhotoSize = next((p for p in message.photo if max(p.width, p.height) >= HASHED_PHOTO_SIZE), message.photo[-1])
+    new_file = await photo_size.get_file()
+    image_bytes = await new_file.download_as_bytearray()
+
+    return await asyncio.get_running_loop().run_in_executor(None, compute_image_hashes, bytes(image_bytes))
+
+
+async def get_file_hashes(file_path: Union[pathlib.Path, str]) -> Tuple[str, str]:
+    return await asyncio.get_running_loop().run_in_executor(None, compute_image_hashes, pathlib.Path(file_path))
+
+
+class HammingIndex:
+    """Multi-index hashing over 64 bit hashes: every hash is split in 4 chunks of 16 bits, and each chunk has its own
+    lookup table. If two hashes are within distance d, at least one of their chunks is within distance d // 4, so a
+    lookup only has to check the buckets of the chunks at that distance, instead of every saved hash.
+    A candidate is a match if its pHash is within 'max_distance' and its dHash is within 'max_dhash_distance'"""
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self, max_distance: int, max_dhash_distance: int):
+        self.max_distance = max_distance
+        self.max_dhash_distance = max_dhash_distance
+
+        chunk_radius = max_distance // self.CHUNKS
+        self.chunk_masks = [0]
+        for flipped_bits in range(1, chunk_radius + 1):
+            for bits in itertools.combinations(range(self.CHUNK_BITS), flipped_bits):
+                self.chunk_masks.append(sum(1 << bit for bit in bits))
+
+        self.tables: List[Dict[int, Set[Hashable]]] = [defaultdict(set) for _ in range(self.CHUNKS)]
+        self.hashes: Dict[Hashable, Tuple[int, int]] = {}  # key -> (phash, dhash)
+
+        self.lookups = 0
+        self.candidates = 0
+
+    @classmethod
+    def chunks(cls, phash: int) -> List[int]:
+        chunk_mask = (1 << cls.CHUNK_BITS) - 1
+        return [(phash >> (i * cls.CHUNK_BITS)) & chunk_mask for i in range(cls.CHUNKS)]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, key: Hashable, phash: str, dhash: str):
+        self.remove(key)
+
+        phash_int = int(phash, 16)
+        self.hashes[key] = (phash_int, int(dhash, 16))
+        for table, chunk in zip(self.tables, self.chunks(phash_int)):
+            table[chunk].add(key)
+
+    def remove(self, key: Hashable):
+        hashes = self.hashes.pop(key, None)
+        if not hashes:
+            return
+
+        for table, chunk in zip(self.tables, self.chunks(hashes[0])):
+            table[chunk].discard(key)
+            if not table[chunk]:
+                del table[chunk]
+
+    def clear(self):
+        for table in self.tables:
+            table.clear()
+        self.hashes.clear()
+
+    def find(self, phash: str, dhash: str) -> List[Tuple[Hashable, int]]:
+        """returns the (key, pHash distance) of the matches, closest first"""
+        phash_int, dhash_int = int(phash, 16), int(dhash, 16)
+
+        candidates = set()
+        for table, chunk in zip(self.tables, self.chunks(phash_int)):
+            for chunk_mask in self.chunk_masks:
+                candidates.update(table.get(chunk ^ chunk_mask, ()))
+
+        self.lookups += 1
+        self.candidates += len(candidates)
+
+        matches = []
+        for key in candidates:
+            candidate_phash, candidate_dhash = self.hashes[key]
+            distance = (phash_int ^ candidate_phash).bit_count()
+            if distance <= self.max_distance and (dhash_int ^ candidate_dhash).bit_count() <= self.max_dhash_distance:
+                matches.append((key, distance))
+
+        return sorted(matches, key=lambda match: match[1])
+
+
+class ImageHashIndexes:
+    max_distance: int = config.settings.get("duplicates_image_max_distance", 6)
+    max_dhash_distance: int = config.settings.get("duplicates_image_max_dhash_distance", 10)
+
+    # keys: (chat_id, message_id) of the StaffChatMessage/MediaDownload
+    staff_chat = HammingIndex(max_distance, max_dhash_distance)
+    events = HammingIndex(max_distance, max_dhash_distance)
+
+
+def get_image_hash_indexes_stats() -> dict:
+    return dict(
+        staff_chat_hashes=len(ImageHashIndexes.staff_chat),
+        events_hashes=len(ImageHashIndexes.events),
+        lookups=ImageHashIndexes.staff_chat.lookups + ImageHashIndexes.events.lookups,
+        candidates_checked=ImageHashIndexes.staff_chat.candidates + ImageHashIndexes.events.candidates
+    )
+
+
+def load_staff_chat_image_hashes(session: Session):
+    ImageHashIndexes.staff_chat.clear()
+    for chat_id, message_id, phash, dhash in staff_chat_messages.get_image_hashes(session):
+        ImageHashIndexes.staff_chat.add((chat_id, message_id), phash, dhash)
+
+    logger.info(f"loaded {len(ImageHashIndexes.staff_chat)} staff chat image hashes")
+
+
+def load_events_image_hashes(session: Session):
+    ImageHashIndexes.events.clear()
+    for chat_id, message_id, phash, dhash in media_downloads.get_image_hashes(session):
+        ImageHashIndexes.events.add((chat_id, message_id), phash, dhash)
+
+    logger.info(f"loaded {len(ImageHashIndexes.events)} events image hashes")
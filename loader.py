@@ -2,14 +2,37 @@ import importlib
 import logging
 import re
 from pathlib import Path
+from typing import List, Set
 
 # noinspection PyPackageRequirements
-from telegram.ext import Application, BaseHandler, ConversationHandler
+from telegram import Update
+# noinspection PyPackageRequirements
+from telegram.ext import Application, BaseHandler, ConversationHandler, CommandHandler, PrefixHandler, MessageHandler, \
+    CallbackQueryHandler, ChatMemberHandler, ChatJoinRequestHandler, MessageReactionHandler, ChatBoostHandler, \
+    InlineQueryHandler, ChosenInlineResultHandler, PollHandler, PollAnswerHandler, ShippingQueryHandler, \
+    PreCheckoutQueryHandler
 
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# MessageHandler's filters might match any of these (business messages are ignored: the bot doesn't use them)
+MESSAGE_UPDATE_TYPES = {Update.MESSAGE, Update.EDITED_MESSAGE, Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST}
+
+HANDLER_UPDATE_TYPES = {
+    CommandHandler: {Update.MESSAGE, Update.EDITED_MESSAGE},  # CommandHandler and PrefixHandler always add filters.UpdateType.MESSAGES
+    PrefixHandler: {Update.MESSAGE, Update.EDITED_MESSAGE},
+    MessageHandler: MESSAGE_UPDATE_TYPES,
+    CallbackQueryHandler: {Update.CALLBACK_QUERY},
+    ChatJoinRequestHandler: {Update.CHAT_JOIN_REQUEST},
+    InlineQueryHandler: {Update.INLINE_QUERY},
+    ChosenInlineResultHandler: {Update.CHOSEN_INLINE_RESULT},
+    PollHandler: {Update.POLL},
+    PollAnswerHandler: {Update.POLL_ANSWER},
+    ShippingQueryHandler: {Update.SHIPPING_QUERY},
+    PreCheckoutQueryHandler: {Update.PRE_CHECKOUT_QUERY},
+}
+
 
 def read_manifest(manifest_path: Path):
     if not manifest_path:
@@ -94,7 +117,58 @@ def scan_modules_to_import(plugins_directory: Path, manifest_file_name="manifest
     return paths_to_import
 
 
-def load_modules(app: Application, plugins_directory: str, manifest_file_name="manifest"):
+def get_handler_update_types(handler: BaseHandler) -> Set[str]:
+    """the update types the handler might handle"""
+    if isinstance(handler, ConversationHandler):
+        handlers = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            handlers.extend(state_handlers)
+
+        return set().union(*[get_handler_update_types(conversation_handler) for conversation_handler in handlers])
+
+    if isinstance(handler, ChatMemberHandler):
+        return {
+            ChatMemberHandler.MY_CHAT_MEMBER: {Update.MY_CHAT_MEMBER},
+            ChatMemberHandler.CHAT_MEMBER: {Update.CHAT_MEMBER},
+            ChatMemberHandler.ANY_CHAT_MEMBER: {Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER}
+        }[handler.chat_member_types]
+
+    if isinstance(handler, MessageReactionHandler):
+        return {
+            MessageReactionHandler.MESSAGE_REACTION_UPDATED: {Update.MESSAGE_REACTION},
+            MessageReactionHandler.MESSAGE_REACTION_COUNT_UPDATED: {Update.MESSAGE_REACTION_COUNT},
+            MessageReactionHandler.MESSAGE_REACTION: {Update.MESSAGE_REACTION, Update.MESSAGE_REACTION_COUNT}
+        }[handler.message_reaction_types]
+
+    if isinstance(handler, ChatBoostHandler):
+        return {
+            ChatBoostHandler.CHAT_BOOST: {Update.CHAT_BOOST},
+            ChatBoostHandler.REMOVED_CHAT_BOOST: {Update.REMOVED_CHAT_BOOST},
+            ChatBoostHandler.ANY_CHAT_BOOST: {Update.CHAT_BOOST, Update.REMOVED_CHAT_BOOST}
+        }[handler.chat_boost_types]
+
+    for handler_type, update_types in HANDLER_UPDATE_TYPES.items():
+        if isinstance(handler, handler_type):
+            return update_types
+
+    # TypeHandler, custom handlers...: we can't tell
+    logger.warning(f"can't tell which updates {type(handler).__name__} handles: all update types will be requested")
+    return set(Update.ALL_TYPES)
+
+
+def get_allowed_updates(app: Application) -> List[str]:
+    """the update types the app's handlers might handle, in the order of Update.ALL_TYPES"""
+    update_types = set()
+    for group_handlers in app.handlers.values():
+        for handler in group_handlers:
+            update_types.update(get_handler_update_types(handler))
+
+    return [update_type for update_type in Update.ALL_TYPES if update_type in update_types]
+
+
+def load_modules(app: Application, plugins_directory: str, manifest_file_name="manifest") -> List[str]:
+    """load the handlers of the modules in the manifest (or in the plugins directory), and return the update types
+    they can handle, to be used as 'allowed_updates'"""
     plugins_directory = Path(plugins_directory)
 
     paths_to_import = scan_modules_to_import(plugins_directory, manifest_file_name)
@@ -118,3 +192,10 @@ def load_modules(app: Application, plugins_directory: str, manifest_file_name="m
                     logger.debug(f"loading ConversationHandler(handler={import_path}.{handler_name}, group={group})")
                 else:
                     logger.debug(f"loading {type(handler).__name__}(handler={import_path}.{handler.callback.__name__}, group={group})")
+
+    allowed_updates = get_allowed_updates(app)
+    dropped_updates = [update_type for update_type in Update.ALL_TYPES if update_type not in allowed_updates]
+    logger.info(f"allowed updates for mode <{config.handlers.mode}>: {', '.join(allowed_updates)}")
+    logger.info(f"no handler for these updates, they will not be requested: {', '.join(dropped_updates)}")
+
+    return allowed_updates
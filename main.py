@@ -18,12 +18,14 @@ from telegram.ext import ExtBot
 import utilities
 from config import config
 from constants import Language, HandlersMode, BOT_SETTINGS_DEFAULTS
-from database.base import get_session, Base, engine
+from database.base import get_session, Base, engine, async_engine
 from database.models import BotSetting, ChatMember
 from database.models import ChatMember as DbChatMember, Chat
-from database.queries import chats, chat_members
+from database.queries import chats, chat_members, settings, staff_chat_messages
+from image_hashes import load_staff_chat_image_hashes, load_events_image_hashes
 from loader import load_modules
 from plugins.events.job import parties_message_job
+from plugins.events.media_backup import start_media_backup_workers, stop_media_backup_workers
 from plugins.staff.chat.duplicates_job import delete_old_messages_job
 
 filterwarnings(action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning)
@@ -218,6 +220,7 @@ async def post_init(application: Application) -> None:
             setting.show_if_true_key = bot_setting_data["show_if_true_key"]
 
     session.commit()
+    settings.drop_cache()
 
     staff_chat = chats.get_chat(session, Chat.is_staff_chat)
     users_chat = chats.get_chat(session, Chat.is_users_chat)
@@ -262,15 +265,36 @@ async def post_init(application: Application) -> None:
         chat_members.save_administrators(session, chat.chat_id, administrators)
         session.commit()
 
+    # some special chat might have been reset, and the bot's permissions might have changed
+    chats.refresh_cache(session)
+
     if config.settings.set_commands:
         if config.handlers.mode == HandlersMode.BBR:
             await set_bbr_commands(session, bot)
         elif config.handlers.mode == HandlersMode.FLYTEK:
             await set_flytek_commands(session, bot)
 
+    if config.handlers.mode == HandlersMode.FLYTEK:
+        logger_startup.info("loading image hashes...")
+        load_staff_chat_image_hashes(session)
+        load_events_image_hashes(session)
+        logger_startup.info("loading staff chat messages hashes...")
+        staff_chat_messages.load_recent_messages_index(session)
+
     session.commit()
     session.close()
 
+    if config.handlers.mode == HandlersMode.FLYTEK and config.settings.backup_events:
+        start_media_backup_workers(bot)
+
+
+async def post_shutdown(application: Application) -> None:
+    await stop_media_backup_workers()
+
+    # aiosqlite connections run in their own thread: close them, or the interpreter will wait for them on exit
+    logger.info("disposing async engine...")
+    await async_engine.dispose()
+
 
 def main():
     utilities.load_logging_config('logging.json')
@@ -278,9 +302,9 @@ def main():
     import telegram
     logger.info(f"ptb version: {telegram.__version__}")
 
-    app: Application = builder.post_init(post_init).build()
+    app: Application = builder.post_init(post_init).post_shutdown(post_shutdown).build()
 
-    load_modules(app, "plugins", manifest_file_name=config.handlers.manifest)
+    allowed_updates = load_modules(app, "plugins", manifest_file_name=config.handlers.manifest)
 
     if config.handlers.mode == HandlersMode.FLYTEK:
         app.job_queue.run_repeating(
@@ -302,18 +326,7 @@ def main():
     logger_startup.info(f"polling for updates (drop_pending_updates={drop_pending_updates})...")
     app.run_polling(
         drop_pending_updates=drop_pending_updates,
-        allowed_updates=[
-            Update.MESSAGE,
-            Update.CHANNEL_POST,
-            Update.EDITED_MESSAGE,
-            Update.EDITED_CHANNEL_POST,
-            Update.CALLBACK_QUERY,
-            Update.CHAT_MEMBER,
-            Update.MY_CHAT_MEMBER,
-            Update.MESSAGE_REACTION,
-            Update.MESSAGE_REACTION_COUNT,
-            Update.CHAT_JOIN_REQUEST
-        ]
+        allowed_updates=allowed_updates  # only the updates the loaded handlers can handle
     )
 
 
@@ -22,8 +22,7 @@ from plugins.events.common import (
     add_event_message_metadata,
     parse_message_text,
     parse_message_entities,
-    drop_events_cache,
-    backup_event_media
+    drop_events_cache
 )
 
 logger = logging.getLogger(__name__)
@@ -15,7 +15,7 @@ import decorators
 import utilities
 from config import config
 from constants import Group, BotSettingKey, Language, LocalizedTextKey, TempDataKey
-from database.models import User, PrivateChatMessage, Chat, BotSetting, ApplicationRequest
+from database.models import User, PrivateChatMessage, Chat, ApplicationRequest
 from database.queries import texts, settings, users, chats, private_chat_messages, common
 from emojis import Emoji
 from ext.filters import ChatFilter
@@ -43,9 +43,8 @@ def accepted_or_rejected_text(request_id: int, approved: bool, admin: TelegramUs
 
 async def invite_link_reply_markup(session: Session, bot: Bot, user: User) -> Optional[InlineKeyboardMarkup]:
     # check whether there is a folder link set
-    folder_link_setting = settings.get_or_create(session, BotSettingKey.FOLDER_LINK)
-    if folder_link_setting.value():
-        folder_link = folder_link_setting.value()
+    folder_link = settings.get_value(session, BotSettingKey.FOLDER_LINK)
+    if folder_link:
         logger.info(f"folder link is set ({folder_link}): using folder link instead of generating an invite link to the users chat")
 
         user.last_request.folder_link = folder_link
@@ -56,7 +55,7 @@ async def invite_link_reply_markup(session: Session, bot: Bot, user: User) -> Op
         return reply_markup
 
     logger.info("generating invite link...")
-    users_chat = chats.get_chat(session, Chat.is_users_chat)
+    users_chat = chats.get_cached_chat(session, Chat.is_users_chat)
 
     use_default_invite_link = True  # we set this to False if the invite link generation succeeds
     can_be_revoked = False
@@ -82,8 +81,7 @@ async def invite_link_reply_markup(session: Session, bot: Bot, user: User) -> Op
 
     if use_default_invite_link:
         logger.info("using default invite link (if set)")
-        invite_link_setting = settings.get_or_create(session, BotSettingKey.CHAT_INVITE_LINK)
-        invite_link = invite_link_setting.value()
+        invite_link = settings.get_value(session, BotSettingKey.CHAT_INVITE_LINK)
 
         if not invite_link:
             logger.warning("user will not receive an invite link because we failed to generate one and no primary link is set")
@@ -100,8 +98,8 @@ async def invite_link_reply_markup(session: Session, bot: Bot, user: User) -> Op
 
 
 async def send_message_to_user(session: Session, bot: Bot, user: User):
-    fallback_language = settings.get_or_create(session, BotSettingKey.FALLBACK_LANGAUGE).value()
-    ltext = texts.get_localized_text_with_fallback(
+    fallback_language = settings.get_value(session, BotSettingKey.FALLBACK_LANGAUGE)
+    ltext = texts.get_cached_with_fallback(
         session,
         LocalizedTextKey.APPLICATION_ACCEPTED,
         Language.IT,
@@ -124,12 +122,12 @@ async def delete_history(session: Session, bot: Bot, user: User, delete_reason:
     if send_rabbit:
         # send the rabbit message then delete (it will be less noticeable that messages are being deleted)
         # rabbit_file_id = "AgACAgQAAxkBAAIF4WRCV9_H-H1tQHnA2443fXtcVy4iAAKkujEbkmDgUYIhRK-rWlZHAQADAgADeAADLwQ"
-        setting: BotSetting = settings.get_or_create(session, BotSettingKey.RABBIT_FILE)
+        rabbit_file_id = settings.get_value(session, BotSettingKey.RABBIT_FILE)
 
-        if setting.value():
+        if rabbit_file_id:
             logger.info("sending rabbit file...")
             try:
-                sent_rabbit_message = await bot.send_photo(user.user_id, setting.value(), protect_content=True)
+                sent_rabbit_message = await bot.send_photo(user.user_id, rabbit_file_id, protect_content=True)
             except BadRequest as e:
                 logger.error(f"cannot send file: {e.message}")
 
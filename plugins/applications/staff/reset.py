@@ -136,7 +136,7 @@ async def on_reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE, s
     only_if_banned = not utilities.get_command(update.message.text) == "resetkick"  # check whether to kick the user
     await unban_user(context.bot, session, user, only_if_banned=only_if_banned)
 
-    log_chat = chats.get_chat(session, Chat.is_log_chat)
+    log_chat = chats.get_cached_chat(session, Chat.is_log_chat)
     if not log_chat:
         logger.warning("no log chat set")
         return
@@ -1,6 +1,5 @@
 import logging
 import re
-import sqlite3
 from typing import Optional, List
 
 import sqlalchemy
@@ -106,8 +105,8 @@ def get_done_keyboard(input_field_placeholder: Optional[str] = None):
 
 
 def get_text(session: Session, ltext_key: str, user: TelegramUser, raise_if_no_fallback: Optional[bool] = True) -> Optional[str]:
-    fallback_language = settings.get_or_create(session, BotSettingKey.FALLBACK_LANGAUGE).value()
-    ltext = texts.get_localized_text_with_fallback(
+    fallback_language = settings.get_value(session, BotSettingKey.FALLBACK_LANGAUGE)
+    ltext = texts.get_cached_with_fallback(
         session,
         ltext_key,
         Language.IT,
@@ -138,12 +137,13 @@ async def on_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, s
 
     chat_member = chat_members.get_chat_member(session, update.effective_user.id, Chat.is_users_chat)
     if not chat_member:
-        users_chat = chats.get_chat(session, Chat.is_users_chat)
+        users_chat = chats.get_cached_chat(session, Chat.is_users_chat)
         logger.info(f"no ChatMember record for user {update.effective_user.id} in chat {users_chat.chat_id}, fetching ChatMember...")
         tg_chat_member = await context.bot.get_chat_member(users_chat.chat_id, update.effective_user.id)
         chat_member = DbChatMember.from_chat_member(users_chat.chat_id, tg_chat_member)
         session.add(chat_member)
         session.commit()
+        chat_members.update_cached_membership(users_chat.chat_id, chat_member.user_id, chat_member.status)
 
     if chat_member.is_member() or (user.last_request and user.last_request.accepted()):
         logger.info("user is already a member of the users chat *or* they were accepted but did not join the chat: sending welcome text for members")
@@ -338,20 +338,6 @@ async def on_waiting_social_received(update: Update, context: ContextTypes.DEFAU
     return State.WAITING_DESCRIBE_SELF
 
 
-def retry_on_db_locked(callback, *args, **kwargs):
-    attempts = 0
-    max_attempts = 15
-    while True:
-        attempts += 1
-        try:
-            return callback(*args, **kwargs)
-        except sqlite3.OperationalError as e:
-            logger.warning(f"<{e}> error while running function <{callback.__name__}()>")
-            if attempts >= max_attempts:
-                logger.info(f"too many attempts: {attempts}")
-                raise e
-
-
 @decorators.catch_exception()
 @decorators.pass_session(pass_user=True)
 @decorators.check_pending_request()
@@ -497,8 +483,8 @@ async def on_timeout_or_done(update: Update, context: ContextTypes.DEFAULT_TYPE,
     # save the message_id of the message we sent to the user saying that their request has been sent to the admins
     user.pending_request.request_sent_message_message_id = sent_message.message_id
 
-    log_chat = chats.get_chat(session, Chat.is_log_chat)
-    evaluation_chat = chats.get_chat(session, Chat.is_evaluation_chat)
+    log_chat = chats.get_cached_chat(session, Chat.is_log_chat)
+    evaluation_chat = chats.get_cached_chat(session, Chat.is_evaluation_chat)
 
     await send_application_log_message(
         bot=context.bot,
@@ -100,7 +100,7 @@ async def check_suspicious_join(session: Session, user: User, chat: Chat, bot: B
         # joined through the primary invite link of the admin that generated that folder invite link
 
         logger.debug("no last request to check or last request is pending/rejected: we log the join")
-        log_chat = chats.get_chat(session, Chat.is_log_chat)
+        log_chat = chats.get_cached_chat(session, Chat.is_log_chat)
 
         user_mention = user.mention()
 
@@ -153,7 +153,7 @@ async def remove_and_revoke_invite_link(user: User, chat: Chat, bot: Bot):
 async def log_join_or_leave(user_left_or_kicked: bool, session: Session, bot: Bot, chat_member_updated: ChatMemberUpdated):
     user_joined = not user_left_or_kicked
 
-    modlog_chat = chats.get_chat(session, Chat.is_modlog_chat)
+    modlog_chat = chats.get_cached_chat(session, Chat.is_modlog_chat)
     if not modlog_chat:
         logger.warning(f"no modlog chat set: we won't log join/leave")
         return
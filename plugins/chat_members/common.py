@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from telegram import Update
 
 from database.models import User, ChatMember as DbChatMember
-from database.queries import users
+from database.queries import users, chat_members
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +49,7 @@ def save_chat_member(session: Session, update: Update, commit=False) -> DbChatMe
 
     chat_member_record = DbChatMember.from_chat_member(update.effective_chat.id, chat_member_to_save)
     session.merge(chat_member_record)
+    chat_members.update_cached_membership(update.effective_chat.id, chat_member_record.user_id, chat_member_record.status)
 
     if commit:
         session.commit()
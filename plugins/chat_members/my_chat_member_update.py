@@ -11,6 +11,7 @@ import decorators
 import utilities
 from constants import Group
 from database.models import Chat
+from database.queries import chats
 from plugins.chat_members.common import (
     save_or_update_users_from_chat_member_update,
     save_chat_member
@@ -52,6 +53,11 @@ async def on_my_chat_member_update(update: Update, _, session: Session, chat: Op
         logger.info("saving new chat_member object...")
         save_chat_member(session, update)
 
+        if chat.is_network_chat():
+            # the bot's permissions in a special chat are part of the cached special chats
+            session.commit()
+            chats.refresh_cache(session)
+
 
 HANDLERS = (
     (ChatMemberHandler(on_my_chat_member_update, ChatMemberHandler.MY_CHAT_MEMBER), Group.NORMAL),
@@ -43,6 +43,7 @@ async def on_group_message(update: Update, context: ContextTypes.DEFAULT_TYPE, s
 
     db_chat_member = DbChatMember.from_chat_member(chat_id, tg_chat_member)
     session.add(db_chat_member)
+    chat_members.update_cached_membership(chat_id, db_chat_member.user_id, db_chat_member.status)
 
 
 HANDLERS = (
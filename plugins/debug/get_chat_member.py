@@ -17,7 +17,7 @@ logger = logging.getLogger(__name__)
 @decorators.catch_exception()
 @decorators.pass_session()
 async def on_getcm_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
-    users_chat = chats.get_chat(session, Chat.is_users_chat)
+    users_chat = chats.get_cached_chat(session, Chat.is_users_chat)
     user_id = utilities.get_user_id_from_text(update.message.text, pattern=Regex.USER_ID_OPTIONAL_HASHTAG)
     logger.info(f"user id: {user_id}")
 
@@ -36,6 +36,7 @@ async def on_getcm_command(update: Update, context: ContextTypes.DEFAULT_TYPE, s
     chat_member_record = DbChatMember.from_chat_member(users_chat.chat_id, chat_member)
     session.merge(chat_member_record)
     session.commit()
+    chat_members.update_cached_membership(users_chat.chat_id, chat_member_record.user_id, chat_member_record.status)
 
     await update.message.reply_text(f"ChatMember created/updated")
 
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import logging
+import time
 from pathlib import Path
 from typing import Optional, List, Union
 
@@ -14,7 +16,7 @@ from telegram.ext import ContextTypes, filters, CommandHandler, CallbackContext,
 
 import decorators
 import utilities
-from constants import Group, TempDataKey, COMMAND_PREFIXES
+from constants import Group, COMMAND_PREFIXES
 from database.models import Event, User, DeletionReason, DELETION_REASON_DESC, ChannelComment
 from database.queries import events, private_chat_messages
 from ext.filters import Filter, ChatFilter
@@ -23,12 +25,16 @@ from plugins.events.common import (
     parse_message_text,
     drop_events_cache,
     add_event_message_metadata,
-    get_all_events_strings_from_db_group_by,
+    get_all_events_lines_from_db_group_by,
     send_events_messages,
     format_event_string,
+    get_event_line,
     FILTER_DESCRIPTION,
-    ORDER_BY_DESCRIPTION, GROUP_BY_DESCRIPTION, EventFormatting, backup_event_media
+    ORDER_BY_DESCRIPTION, GROUP_BY_DESCRIPTION, EventFormatting, PARSER_VERSION
 )
+from plugins.events.job import request_parties_message_update
+from plugins.events.media_backup import queue_event_media_backup
+from plugins.events.reparse import EventsReparser, ReparseProgress
 from config import config
 
 logger = logging.getLogger(__name__)
@@ -53,12 +59,12 @@ async def on_events_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
     logger.info(f"/events {utilities.log(update)}")
 
     args = context.args if context.args else []
-    all_events_strings = get_all_events_strings_from_db_group_by(session, args)
+    all_events_strings, entities_counts = get_all_events_lines_from_db_group_by(session, args)
 
     # logger.debug(f"result: {len(messages_to_send)} messages, {len(text_lines)} lines")
 
     protect_content = not utilities.is_superadmin(update.effective_user)
-    await send_events_messages(update.message, all_events_strings, protect_content)
+    await send_events_messages(update.message, all_events_strings, protect_content, entities_counts=entities_counts)
 
 
 @decorators.catch_exception()
@@ -70,10 +76,10 @@ async def on_title_command(update: Update, context: ContextTypes.DEFAULT_TYPE, s
     title_filter = utilities.get_argument(update.message.text)
     logger.info(f"like filter: {title_filter}")
 
-    all_events_strings = get_all_events_strings_from_db_group_by(session, args=[], title_filter=title_filter)
+    all_events_strings, entities_counts = get_all_events_lines_from_db_group_by(session, args=[], title_filter=title_filter)
 
     protect_content = not utilities.is_superadmin(update.effective_user)
-    await send_events_messages(update.message, all_events_strings, protect_content)
+    await send_events_messages(update.message, all_events_strings, protect_content, entities_counts=entities_counts)
 
 
 @decorators.catch_exception()
@@ -96,41 +102,55 @@ async def on_invalid_events_command(update: Update, context: ContextTypes.DEFAUL
         order_by=[Event.message_id]
     )
     all_events_strings = []
-    total_entities_count = 0
+    entities_counts = []
     formatting = EventFormatting(use_message_date=True)
     for i, event in enumerate(events_list):
         if event.is_valid():
             continue
 
-        text_line, event_entities_count = format_event_string(event, formatting)
+        text_line, event_entities_count = get_event_line(event, formatting)
         all_events_strings.append(text_line)
-        total_entities_count += event_entities_count  # not used yet, find something to do with this
+        entities_counts.append(event_entities_count)
 
     protect_content = not utilities.is_superadmin(update.effective_user)
-    sent_messages = await send_events_messages(update.message, all_events_strings, protect_content)
+    sent_messages = await send_events_messages(update.message, all_events_strings, protect_content, entities_counts=entities_counts)
     private_chat_messages.save(session, sent_messages)
 
 
 @decorators.catch_exception()
-@decorators.pass_session()
-async def on_parse_events_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
+async def on_parse_events_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"/parseevents {utilities.log(update)}")
 
-    events_list: List[Event] = events.get_all_events(session)
-    events_count = 0
-    for i, event in enumerate(events_list):
-        events_count = i + 1
-        logger.debug(f"{events_count}. {event}")
-        parse_message_text(event.message_text, event)
+    # "/parseevents all" re-parses every event, not just the ones parsed by an older parser version
+    force = bool(context.args) and context.args[0].lower() == "all"
+    reparser = EventsReparser(
+        batch_size=config.settings.get("reparse_batch_size", 1000),
+        processes=config.settings.get("reparse_processes", 0),
+        force=force
+    )
 
-        if not event.message_json:
-            continue
+    status_message = await update.message.reply_text(f"re-parsing events (parser version: {PARSER_VERSION})...")
 
-        message_dict = json.loads(event.message_json)
-        message = Message.de_json(message_dict, context.bot)
-        parse_message_entities(message, event)
+    # each batch is parsed and committed in a worker thread, so the bot keeps answering in the meantime
+    batches = reparser.run()
+    progress: Optional[ReparseProgress] = None
+    last_status_update = time.monotonic()
+    while True:
+        batch_progress = await asyncio.to_thread(next, batches, None)
+        if not batch_progress:
+            break
 
-    await update.message.reply_text(f"parsed {events_count} db entries")
+        progress = batch_progress
+        if time.monotonic() - last_status_update > 5:
+            last_status_update = time.monotonic()
+            await status_message.edit_text(f"re-parsed {progress.parsed}/{progress.total} events ({progress.changed} changed)...")
+
+    if not progress:
+        await status_message.edit_text(f"no event to re-parse (parser version: {PARSER_VERSION})")
+        return
+
+    drop_events_cache(context)
+    await status_message.edit_text(f"<code>{utilities.escape_html(progress.summary())}</code>")
 
 
 async def event_from_link(update_or_message: Union[Update, Message], context: CallbackContext, session: Session, try_from_discussion_group_message=False) -> Optional[Event]:
@@ -277,15 +297,15 @@ async def on_event_link_action_button(update: Update, context: ContextTypes.DEFA
     if action == EventMessageLinkAction.RESTORE:
         event.restore()
 
-        context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
-        drop_events_cache(context)
+        request_parties_message_update(context)
+        drop_events_cache(context, event)
 
         await update.callback_query.answer("evento ripristinato")
     elif action == EventMessageLinkAction.DELETE_DUPLICATE:
         event.delete(DeletionReason.DUPLICATE)
 
-        context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
-        drop_events_cache(context)
+        request_parties_message_update(context)
+        drop_events_cache(context, event)
 
         await update.callback_query.answer("evento eliminato (duplicato)")
     elif action == EventMessageLinkAction.GET_MEDIA_PATHS:
@@ -364,8 +384,8 @@ async def on_delete_option_button(update: Update, context: ContextTypes.DEFAULT_
 
     if action in (EventMessageLinkAction.DELETE_DUPLICATE, EventMessageLinkAction.DELETE_MESSAGE_DELETED, EventMessageLinkAction.DELETE_NOT_A_PARTY, EventMessageLinkAction.DELETE_OTHER):
         logger.info("dropping events cache...")
-        context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
-        drop_events_cache(context)
+        request_parties_message_update(context)
+        drop_events_cache(context, event)
 
     logger.info(f"delete options, selected action: {action}")
 
@@ -439,14 +459,13 @@ async def on_reparse_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
     logger.info(f"re-parsed event: {event}")
 
-    logger.info("setting flag to signal that the parties message list shoudl be updated...")
-    context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
+    request_parties_message_update(context)
 
     event_str, _ = format_event_string(event)
     await update.effective_message.reply_text(f"{event_str}\n\n^event re-parsed")
 
     logger.info("dropping events cache...")
-    drop_events_cache(context)
+    drop_events_cache(context, event)
 
     session.commit()
 
@@ -607,10 +626,7 @@ async def on_comment_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
     )
 
     if config.settings.backup_events:
-        # noinspection PyTypeChecker
-        file_path: Path = await backup_event_media(update.message.reply_to_message)
-        if file_path:
-            event.add_media_file_path(file_path)
+        queue_event_media_backup(session, update.message.reply_to_message, event)
 
 
 HANDLERS = (
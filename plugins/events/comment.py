@@ -1,5 +1,4 @@
 import logging
-from pathlib import Path
 from typing import Optional
 
 from sqlalchemy.orm import Session
@@ -12,7 +11,7 @@ from constants import Group
 from database.models import Chat, Event, User, ChannelComment
 from database.queries import events, channel_comments
 from ext.filters import ChatFilter, Filter
-from plugins.events.common import backup_event_media
+from plugins.events.media_backup import queue_event_media_backup
 from config import config
 
 logger = logging.getLogger(__name__)
@@ -50,9 +49,7 @@ async def on_channel_comment(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
     if config.settings.backup_events and not channel_comment.not_info:
         # do not download if a message is marked as "not info"
-        file_path: Path = await backup_event_media(update)
-        if file_path and event:
-            event.add_media_file_path(file_path)
+        queue_event_media_backup(session, message, event)
 
 
 HANDLERS = (
@@ -1,20 +1,25 @@
+import asyncio
 import copy
 import datetime
 import logging
-import pathlib
 import re
+import time
+from collections import OrderedDict
 from re import Match
-from typing import Optional, List, Union, Tuple, Sequence, Dict
+from types import MappingProxyType
+from typing import Optional, List, Union, Tuple, Sequence, Dict, Iterable, Mapping, Any
 
 from sqlalchemy import true, null
-from sqlalchemy.orm import Session
-from telegram import Message, MessageEntity, Update
-from telegram.constants import MessageLimit, FileSizeLimit
-from telegram.ext import CallbackContext
+from sqlalchemy.orm import Session, object_session
+from telegram import Message, MessageEntity
+from telegram.constants import MessageLimit
+from telegram.ext import CallbackContext, ContextTypes
 
+import decorators
 import utilities
-from constants import Regex, RegionName, REGIONS_DATA, TempDataKey, MONTHS_IT, SUBREGIONS_DATA
-from database.models import Event, EVENT_TYPE, EventType, EventTypeHashtag
+from config import config
+from constants import Regex, RegionName, REGIONS_DATA, TempDataKey, MONTHS_IT, SUBREGIONS_DATA, Timeout
+from database.models import Event, EVENT_TYPE, EventType, EventTypeHashtag, EventHashtag
 from database.queries import events
 from emojis import Emoji, Flag
 
@@ -116,7 +121,6 @@ class DateMatchNormal:
 
             end_date.validate()
 
-        logger.debug(f"parsed dates: {start_date}; {end_date}")
         return start_date, end_date
 
 
@@ -151,7 +155,6 @@ class DateMatchDaysList:
         end_date.fix_months_overlap(start_date.day)
         end_date.validate()
 
-        logger.debug(f"parsed dates: {start_date}; {end_date}")
         return start_date, end_date
 
 
@@ -198,7 +201,6 @@ class DateMatchMonthsJump:
         end_date = EventDate(end_year, end_month, end_day)
         end_date.validate()
 
-        logger.debug(f"parsed dates: {start_date}; {end_date}")
         return start_date, end_date
 
 
@@ -240,13 +242,60 @@ MONTHS = (
 )
 
 
+CANCELED_HASHTAGS = frozenset((
+    "#annullata",
+    "#annullato",
+    "#canceled",
+    "#cancelled",
+    "#rimandata",
+    "#rimandato",
+    "#posticipato",
+    "#posticipata",
+    "#fake",
+))
+
+SOON_HASHTAGS = frozenset(("#soon", "#comingsoon", "#moreinfosoon"))
+
+
+def hashtags_priority_map(items: Iterable[Tuple[str, Any]]) -> Mapping[str, Tuple[int, Any]]:
+    """build a read-only hashtag -> (priority, value) map from (hashtag, value) pairs. The priority is the position
+    of the first pair with that hashtag, so the lowest priority found in a post is the pair that a linear scan
+    of the pairs would have matched first"""
+    priority_map = {}
+    for priority, (hashtag, value) in enumerate(items):
+        priority_map.setdefault(hashtag, (priority, value))
+
+    return MappingProxyType(priority_map)
+
+
+# built once from constants: classifying a post only costs a dict lookup per hashtag
+REGION_BY_HASHTAG = hashtags_priority_map((h.lower(), name) for name, data in REGIONS_DATA.items() for h in data["hashtags"])
+SUBREGION_BY_HASHTAG = hashtags_priority_map((h.lower(), name) for name, data in SUBREGIONS_DATA.items() for h in data["hashtags"])
+EVENT_TYPE_BY_HASHTAG = hashtags_priority_map(EVENT_TYPE.items())
+MONTH_BY_HASHTAG = hashtags_priority_map((h, i + 1) for i, h in enumerate(MONTHS))
+
+
+def classify_hashtags(priority_map: Mapping[str, Tuple[int, Any]], hashtags_list: List[str], last_wins: bool = False):
+    """return the value of the hashtag with the lowest priority (or the highest, if last_wins), None if no hashtag
+    of the list is in the map"""
+    matches = [priority_map[hashtag] for hashtag in hashtags_list if hashtag in priority_map]
+    if not matches:
+        return None
+
+    return max(matches)[1] if last_wins else min(matches)[1]
+
+
 def find_region_in_list(regions_data, hashtags_list):
     # REGION and SUBREGION
+    if regions_data is REGIONS_DATA:
+        return classify_hashtags(REGION_BY_HASHTAG, hashtags_list)
+    if regions_data is SUBREGIONS_DATA:
+        return classify_hashtags(SUBREGION_BY_HASHTAG, hashtags_list)
+
     for region_name, region_data in regions_data.items():
         for region_hashtag in region_data["hashtags"]:
             if region_hashtag.lower() in hashtags_list:
                 # return after the first match
-                # logger.debug(f"found {region_hashtag}")
                 return region_name
 
     return None
@@ -256,10 +305,10 @@ def parse_message_entities_list(hashtags_list: List[str], event: Event):
     event.save_hashtags(hashtags_list)
 
     # TYPE
-    for hashtag, event_type in EVENT_TYPE.items():
-        if hashtag in hashtags_list:
-            event.event_type = event_type
-            break
+    # if a message has more the one hashtag in EVENT_TYPE, the first one (in EVENT_TYPE's order) will be used
+    event_type = classify_hashtags(EVENT_TYPE_BY_HASHTAG, hashtags_list)
+    if event_type:
+        event.event_type = event_type
 
     # LOCALATA
     if EventTypeHashtag.LOCALATA in hashtags_list:
@@ -271,46 +320,25 @@ def parse_message_entities_list(hashtags_list: List[str], event: Event):
         event.localata = False
 
     # CANCELED
-    if (
-        "#annullata" in hashtags_list
-        or "#annullato" in hashtags_list
-        or "#canceled" in hashtags_list
-        or "#cancelled" in hashtags_list
-        or "#rimandata" in hashtags_list
-        or "#rimandato" in hashtags_list
-        or "#posticipato" in hashtags_list
-        or "#posticipata" in hashtags_list
-        or "#fake" in hashtags_list
-    ):
-        event.canceled = True
-    else:
-        # un-cancel events that do not have these hashtags
-        event.canceled = False
+    # un-cancel events that do not have these hashtags
+    event.canceled = not CANCELED_HASHTAGS.isdisjoint(hashtags_list)
 
     # SOON
-    if "#soon" in hashtags_list or "#comingsoon" in hashtags_list or "#moreinfosoon" in hashtags_list:
-        event.soon = True
-    else:
-        # un-soon events that do not have these hashtags
-        event.soon = False
+    # un-soon events that do not have these hashtags
+    event.soon = not SOON_HASHTAGS.isdisjoint(hashtags_list)
 
     # if no region/subregion is found in the hashtags list, set it to NULL
     # REGION
-    event.region = find_region_in_list(REGIONS_DATA, hashtags_list)
+    event.region = classify_hashtags(REGION_BY_HASHTAG, hashtags_list)
     # SUBREGION
-    event.subregion = find_region_in_list(SUBREGIONS_DATA, hashtags_list)
+    event.subregion = classify_hashtags(SUBREGION_BY_HASHTAG, hashtags_list)
 
     # DATES
     # enter this only if dates are not already filled
     if not event.start_month and not event.start_year:
-        month_hashtag_found = False
-        for i, month_hashtag in enumerate(MONTHS):
-            if month_hashtag not in hashtags_list:
-                continue
-
-            month_hashtag_found = True
-
-            month = i + 1
+        # if more than one month hashtag is found, the last one in MONTHS' order is used
+        month = classify_hashtags(MONTH_BY_HASHTAG, hashtags_list, last_wins=True)
+        if month:
             year = utilities.now().year
             if month < utilities.now().month:
                 year += 1
@@ -322,8 +350,7 @@ def parse_message_entities_list(hashtags_list: List[str], event: Event):
             event.end_year = year
 
             event.dates_from_hashtags = True
-
-        if not month_hashtag_found:
+        else:
             # set to false if no month hashtag was found
             event.dates_from_hashtags = False
 
@@ -362,68 +389,109 @@ def parse_message_entities_dict(message_dict: dict, event: Event):
     parse_message_entities_list(hashtags_list, event)
 
 
-def parse_message_text(message_text: str, event: Event):
-    # TITLE
-    title_match = re.search(Regex.FIRST_LINE, message_text, re.M)
-    if title_match:
-        event.event_title = title_match.group(1)
-    else:
-        logger.info("couldn't parse any title")
+# bump this every time the way events are parsed changes (text regexes, hashtags): /parseevents will re-parse
+# only the events parsed by an older version
+PARSER_VERSION = 1
 
-    # DETAILED LOCATION
-    location_match = re.search(Regex.DETAILED_LOCATION, message_text, re.M)
-    if location_match and location_match.group(1) is not None:
-        detailed_location = location_match.group(1).strip()
-        logger.info(f"detailed location: {detailed_location}")
-    else:
-        logger.info(f"couldn't match detailed location")
-        detailed_location = None
-    event.detailed_location = detailed_location
 
-    # DATES
-    parsing_success = False
-    date_tests = [DateMatchMonthsJump, DateMatchDaysList, DateMatchNormal]
-    for date_test in date_tests:
-        date_match = None
-        for i, pattern in enumerate(date_test.PATTERN):
-            logger.debug(f"testing pattern #{i} for regex '{date_test.NAME}'")
-            date_match = re.search(pattern, message_text, re.M | re.I)
-            if date_match:
-                logger.debug("pattern match successfull")
-                break
+class EventTextParser:
+    """Extracts title, detailed location and dates from an event's text. All the regexes are compiled once, when
+    the parser is created, instead of being looked up in re's cache for every post"""
 
-        if not date_match:
-            continue
+    # order matters: the first test that matches and extracts valid dates wins
+    DATE_TESTS = (DateMatchMonthsJump, DateMatchDaysList, DateMatchNormal)
 
-        try:
-            start_date, end_date = date_test.extract(date_match)
-            parsing_success = True
-            break
-        except ValueError as e:
-            logger.info(f"error while extracting date with test '{date_test.NAME}': {e}")
-            continue
+    def __init__(self):
+        self.title_pattern = re.compile(Regex.FIRST_LINE, re.M)
+        self.detailed_location_pattern = re.compile(Regex.DETAILED_LOCATION, re.M)
+        self.date_tests = [(date_test, [re.compile(pattern, re.M | re.I) for pattern in date_test.PATTERN]) for date_test in self.DATE_TESTS]
 
-    if not parsing_success:
-        logger.info("couldn't parse any date with any regex")
-        event.reset_date_fields()
-    else:
-        event.start_day = start_date.day
-        event.start_month = start_date.month
-        event.start_year = start_date.year
-        event.end_day = end_date.day
-        event.end_month = end_date.month
-        event.end_year = end_date.year
+    def match_title(self, message_text: str) -> Optional[re.Match]:
+        return self.title_pattern.search(message_text)
+
+    def parse_title(self, message_text: str) -> Optional[str]:
+        title_match = self.match_title(message_text)
+        return title_match.group(1) if title_match else None
 
-        event.populate_date_fields()
-        event.dates_from_hashtags = False
+    def parse_detailed_location(self, message_text: str) -> Optional[str]:
+        location_match = self.detailed_location_pattern.search(message_text)
+        if location_match and location_match.group(1) is not None:
+            return location_match.group(1).strip()
 
+    def parse_dates(self, message_text: str) -> Optional[Tuple[EventDate, EventDate]]:
+        for date_test, patterns in self.date_tests:
+            date_match = None
+            for pattern in patterns:
+                date_match = pattern.search(message_text)
+                if date_match:
+                    break
 
-def drop_events_cache(context: CallbackContext):
-    if TempDataKey.EVENTS_CACHE in context.bot_data:
-        context.bot_data.pop(TempDataKey.EVENTS_CACHE)
-        return True
+            if not date_match:
+                continue
+
+            try:
+                return date_test.extract(date_match)
+            except ValueError as e:
+                logger.info(f"error while extracting date with test '{date_test.NAME}': {e}")
+                continue
 
-    return False
+    def parse(self, message_text: str, event: Event):
+        # TITLE
+        title_match = self.match_title(message_text)
+        if title_match:
+            event.event_title = title_match.group(1)
+        else:
+            logger.info("couldn't parse any title")
+
+        # DETAILED LOCATION
+        event.detailed_location = self.parse_detailed_location(message_text)
+        if not event.detailed_location:
+            logger.info(f"couldn't match detailed location")
+
+        # DATES
+        dates = self.parse_dates(message_text)
+        if not dates:
+            logger.info("couldn't parse any date with any regex")
+            event.reset_date_fields()
+        else:
+            start_date, end_date = dates
+            event.start_day = start_date.day
+            event.start_month = start_date.month
+            event.start_year = start_date.year
+            event.end_day = end_date.day
+            event.end_month = end_date.month
+            event.end_year = end_date.year
+
+            event.populate_date_fields()
+            event.dates_from_hashtags = False
+
+
+EVENT_TEXT_PARSER = EventTextParser()
+
+
+def parse_message_text(message_text: str, event: Event):
+    EVENT_TEXT_PARSER.parse(message_text, event)
+    event.parser_version = PARSER_VERSION
+
+
+def drop_events_cache(context: CallbackContext, event: Optional[Event] = None) -> bool:
+    """must be called every time an event is changed. If the event is passed, only the cached lists it might
+    appear in are dropped (call it before committing: the event must still be attached to its session).
+    Returns whether some radar list was dropped"""
+
+    # the radar results used to be cached in bot_data, which is persisted
+    context.bot_data.pop(TempDataKey.EVENTS_CACHE, None)
+
+    if event:
+        drop_event_lines_cache(event.chat_id, event.message_id)
+    else:
+        drop_event_lines_cache()
+
+    if not invalidate_radar_cache(event):
+        return False
+
+    schedule_radar_cache_prewarm(context)
+    return True
 
 
 class EventFormatting:
@@ -451,6 +519,10 @@ class EventFormatting:
         options_str = ", ".join(options)
         return f"EventFormatting({options_str})"
 
+    @property
+    def key(self) -> tuple:
+        return self.bold, self.region_emoji, self.discussion_group_link, self.use_message_date, self.collapse
+
 
 def format_event_string(event: Event, formatting: Optional[EventFormatting] = None) -> Tuple[str, int]:
     if not formatting:
@@ -492,58 +564,127 @@ def format_event_string(event: Event, formatting: Optional[EventFormatting] = No
     return text, utilities.count_html_entities(text)
 
 
-def time_to_split(
-        text_lines: List[str],
-        initial_message_length: int = 0,
-        initial_entities_count: int = 0
-) -> bool:
-    # message_length = len("\n\naggiornato al xx/xx/xxxx xx:xx")
+class EventLinesCache:
+    # (chat_id, message_id) -> {formatting key: (event version, line, entities count)}
+    # least recently used events first
+    entries: "OrderedDict[Tuple[int, int], Dict[tuple, Tuple[Any, str, int]]]" = OrderedDict()
+    max_size = config.settings.get("event_lines_cache_size", 5000)  # number of events
+    hits = 0
+    misses = 0
 
-    # we do this thing to avoid to create references
-    message_length = 0
-    message_length += initial_message_length
-    entities_count = 0
-    entities_count += initial_entities_count
 
-    for line in text_lines:
-        message_length += len(line)
-        entities_count += utilities.count_html_entities(line)
+def drop_event_lines_cache(chat_id: Optional[int] = None, message_id: Optional[int] = None):
+    """drop the lines of an event, or the whole cache if no event is passed. Must be called every time an
+    event is changed"""
+    if chat_id is None:
+        logger.debug("dropping event lines cache")
+        EventLinesCache.entries.clear()
+    else:
+        EventLinesCache.entries.pop((chat_id, message_id), None)
 
-    if message_length >= MessageLimit.MAX_TEXT_LENGTH:
-        return True
 
-    if entities_count >= MessageLimit.MESSAGE_ENTITIES:
-        return True
+def get_event_lines_cache_stats() -> dict:
+    return dict(hits=EventLinesCache.hits, misses=EventLinesCache.misses, size=len(EventLinesCache.entries))
 
 
-def split_messages(all_events: List[str], return_after_first_message=False) -> List[str]:
-    messages_to_send = []
-    next_message_events = []
-    for events_string in all_events:
-        if time_to_split(next_message_events):
-            new_message_to_send = "\n".join(next_message_events)
-            messages_to_send.append(new_message_to_send)
+def get_event_line(event: Event, formatting: EventFormatting) -> Tuple[str, int]:
+    """same as format_event_string(), but the line is cached until the event changes. Only use it for events
+    that were loaded from the db and not modified since: updated_on is used as the event version"""
+    key = (event.chat_id, event.message_id)
+    event_lines = EventLinesCache.entries.get(key)
+    if event_lines is None:
+        event_lines = EventLinesCache.entries[key] = {}
+        if len(EventLinesCache.entries) > EventLinesCache.max_size:
+            EventLinesCache.entries.popitem(last=False)
+    else:
+        EventLinesCache.entries.move_to_end(key)
+
+        cached_line = event_lines.get(formatting.key)
+        if cached_line and cached_line[0] == event.updated_on:
+            EventLinesCache.hits += 1
+            return cached_line[1], cached_line[2]
+
+    EventLinesCache.misses += 1
+    text, entities_count = format_event_string(event, formatting)
+    event_lines[formatting.key] = (event.updated_on, text, entities_count)
+
+    return text, entities_count
+
+
+class MessageSplitter:
+    """Groups lines into messages that respect telegram's text length and entities limits. The running length and
+    entities count are updated as lines are added, so every line is looked at only once"""
+
+    def __init__(self, max_length: int = MessageLimit.MAX_TEXT_LENGTH, max_entities: int = MessageLimit.MESSAGE_ENTITIES, separator: str = "\n"):
+        self.max_length = max_length
+        self.max_entities = max_entities
+        self.separator = separator
+
+        self.lines: List[str] = []
+        self.length = 0
+        self.entities_count = 0
+
+    def add_line(self, line: str, entities_count: Optional[int] = None) -> Optional[str]:
+        """add a line to the current message. If the line doesn't fit, the current message is returned and the
+        line becomes the first one of the next message. A line that doesn't fit on its own is sent alone"""
+
+        if entities_count is None:
+            entities_count = utilities.count_html_entities(line)
+
+        message = None
+        if self.lines and (self.length + len(self.separator) + len(line) > self.max_length or self.entities_count + entities_count > self.max_entities):
+            message = self.flush()
+
+        if self.lines:
+            self.length += len(self.separator)
+        self.lines.append(line)
+        self.length += len(line)
+        self.entities_count += entities_count
+
+        return message
+
+    def flush(self) -> Optional[str]:
+        """return the current message (if any) and start a new one"""
+        if not self.lines:
+            return
+
+        message = self.separator.join(self.lines)
+
+        self.lines = []
+        self.length = 0
+        self.entities_count = 0
+
+        return message
 
-            # logger.debug(f"time to split, messages: {len(messages_to_send)}, lines: {len(text_lines)}")
+
+def split_messages(all_events: List[str], return_after_first_message=False, entities_counts: Optional[List[int]] = None) -> List[str]:
+    # entities_counts: the entities count of each line, as returned by format_event_string(). If not passed,
+    # each line will be scanned once
+    messages_to_send = []
+    splitter = MessageSplitter()
+    for i, events_string in enumerate(all_events):
+        message = splitter.add_line(events_string, entities_counts[i] if entities_counts else None)
+        if message:
+            messages_to_send.append(message)
             if return_after_first_message:
                 return messages_to_send
 
-            next_message_events = [events_string]
-        else:
-            # logger.debug(f"no time to split, messages: {len(messages_to_send)}, lines: {len(text_lines)}")
-            next_message_events.append(events_string)
-
-    if next_message_events:
-        last_message_text = "\n".join(next_message_events)
+    last_message_text = splitter.flush()
+    if last_message_text:
         messages_to_send.append(last_message_text)
 
     return messages_to_send
 
 
-async def send_events_messages(message: Message, all_events_strings: List[str], protect_content: bool = True) -> List[Message]:
+async def send_events_messages(
+        message: Message,
+        all_events_strings: List[str],
+        protect_content: bool = True,
+        entities_counts: Optional[List[int]] = None
+) -> List[Message]:
     sent_messages = []
 
-    messages_to_send = split_messages(all_events_strings, return_after_first_message=False)
+    messages_to_send = split_messages(all_events_strings, return_after_first_message=False, entities_counts=entities_counts)
 
     if not messages_to_send:
         sent_message = await message.reply_text("vuoto :(", protect_content=protect_content)
@@ -601,6 +742,9 @@ FILTER_DESCRIPTION = {
 }
 
 
+IT_REGIONS = (RegionName.ITALIA, RegionName.CENTRO_ITALIA, RegionName.NORD_ITALIA, RegionName.SUD_ITALIA, RegionName.SICILIA, RegionName.SARDEGNA)
+
+
 def extract_query_filters(
         args: List[str],
         today: Optional[datetime.date] = None,
@@ -702,17 +846,89 @@ def extract_query_filters(
         ])
 
     # EVENT REGION
-    it_regions = [RegionName.ITALIA, RegionName.CENTRO_ITALIA, RegionName.NORD_ITALIA, RegionName.SUD_ITALIA, RegionName.SICILIA, RegionName.SARDEGNA]
     if EventFilter.IT in args:
-        query_filters.append(Event.region.in_(it_regions))
+        query_filters.append(Event.region.in_(IT_REGIONS))
     elif EventFilter.NOT_IT in args:
         query_filters.append((
-            (Event.region.not_in(it_regions) | (Event.region == null()))
+            (Event.region.not_in(IT_REGIONS) | (Event.region == null()))
         ))
 
+    # HASHTAGS (eg. "#maggio", "#soon", "#lombardia"): the events must have all of them
+    for arg in args:
+        if arg.startswith("#") and len(arg) > 1:
+            query_filters.append(Event.event_hashtags.any(EventHashtag.hashtag == arg))
+
     return query_filters
 
 
+def event_matches_filters(event: Event, args: List[str]) -> bool:
+    """python counterpart of the type and region filters of extract_query_filters(): used to split, in memory,
+    a list of events that was fetched from the db with the time filters only"""
+    args = [arg.lower() for arg in args]
+
+    if EventFilter.NOT_FREE in args or EventFilter.LEGAL in args:
+        if event.event_type == EventType.FREE:
+            return False
+    elif EventFilter.FREE in args:
+        if event.event_type != EventType.FREE:
+            return False
+
+    if EventFilter.IT in args:
+        if event.region not in IT_REGIONS:
+            return False
+    elif EventFilter.NOT_IT in args:
+        if event.region in IT_REGIONS:
+            return False
+
+    return True
+
+
+def event_in_time_window(event: Event, args: List[str], today: Optional[datetime.date] = None) -> bool:
+    """python counterpart of the time filters of extract_query_filters()"""
+    args = [arg.lower() for arg in args]
+    today = today or datetime.date.today()
+
+    if EventFilter.WEEK in args or EventFilter.WEEK_2 in args:
+        additional_days = 7 if EventFilter.WEEK_2 in args else 0
+        last_monday = utilities.previous_weekday(today=today, weekday=0)
+        next_monday = utilities.next_weekday(today=today, weekday=0, additional_days=additional_days)
+
+        return (
+            (event.start_date is not None and last_monday <= event.start_date < next_monday)
+            or (event.end_date is not None and last_monday <= event.end_date < next_monday)
+        )
+    elif EventFilter.SOON in args:
+        return bool(event.soon)
+    elif EventFilter.MONTH_FUTURE_AND_NEXT_MONTH in args:
+        next_month = today.month + 1 if today.month != 12 else 1
+        next_month_year = today.year if today.month != 12 else today.year + 1
+        no_end_tolerance_date = today + datetime.timedelta(days=-7)
+
+        if event.start_month == next_month and event.start_year == next_month_year:
+            return True
+        if event.start_month == today.month and event.start_year == today.year and (
+                event.start_day is None
+                or today.day <= event.start_day
+                or (event.end_day is not None and today.day <= event.end_day)
+        ):
+            return True
+
+        return (
+            event.end_day is None and event.start_day is not None and event.start_date is not None
+            and no_end_tolerance_date <= event.start_date <= today
+        )
+
+    if event.start_year is None or event.start_month is None:
+        return False
+
+    if EventFilter.MONTH_AND_NEXT_MONTH in args:
+        next_month = today.month + 1 if today.month != 12 else 1
+        return event.start_year >= today.year and event.start_month in (today.month, next_month)
+
+    # default: EventFilter.ALL
+    return event.start_year >= today.year and event.start_month >= today.month
+
+
 class OrderBy:
     DATE = "obd"
     WEEK_NUMBER = "obw"
@@ -809,6 +1025,18 @@ def extract_order_by(args: List[str]) -> List:
     return order_by_from_group_by + order_by  # duplicates don't break the query
 
 
+def sort_events(events_list: Iterable[Event], order_by: List) -> List[Event]:
+    """sort the events in memory like the db would with the columns returned by extract_order_by(): ascending,
+    with null values first. Events that have the same values are sorted by message_id"""
+    columns_names = [column.key for column in order_by] + ["message_id"]
+
+    def sort_key(event: Event):
+        values = [getattr(event, column_name) for column_name in columns_names]
+        return [(value is not None, value) for value in values]
+
+    return sorted(events_list, key=sort_key)
+
+
 class GroupBy:
     WEEK_NUMBER = "gbw"
     MONTH = "gbm"
@@ -888,38 +1116,39 @@ def get_all_events_strings_from_db(session: Session, args: List[str], date_overr
             logger.info(f"skipping invalid event: {event}")
             continue
 
-        text_line, event_entities_count = format_event_string(event, formatting)
+        text_line, event_entities_count = get_event_line(event, formatting)
         all_events_strings.append(text_line)
         total_entities_count += event_entities_count  # not used yet, find something to do with this
 
     return all_events_strings
 
 
-def get_all_events_strings_from_db_group_by(
+def get_events_from_db(
         session: Session,
         args: List[str],
         date_override: Optional[datetime.date] = None,
-        formatting: Optional[EventFormatting] = None,
         title_filter: Optional[str] = None
-) -> List[str]:
-    logger.debug("getting events from db...")
-
-    if not formatting:
-        formatting = EventFormatting()  # use default formatting
-    logger.debug(f"formatting: {formatting}")
-
+) -> List[Event]:
     query_filters = extract_query_filters(args, today=date_override, title_filter=title_filter)
     order_by = extract_order_by(args)  # returns the default ordering if no elegible arg is provided
-    group_by_key = extract_group_by(args)
-    logger.info(f"group by key: {group_by_key}")
 
-    events_list: List[Event] = events.get_events(session, filters=query_filters, order_by=order_by)
+    return list(events.get_events(session, filters=query_filters, order_by=order_by))
+
+
+def get_events_lines_group_by(
+        events_list: Iterable[Event],
+        group_by_key: str,
+        formatting: EventFormatting
+) -> Tuple[List[str], List[int]]:
+    """the lines of a list of events (plus the group by headers) and the entities count of each line"""
     events_dict = events_to_dict(events_list, group_by_key)
 
     all_events_strings = []
+    entities_counts = []
     for group_by, events_list in events_dict.items():
         if formatting.collapse:
             all_events_strings.append("<blockquote expandable>")
+            entities_counts.append(1)
 
         if group_by:
             # 'group_by' might be an empty string: if so, do not apply grouping headers
@@ -927,66 +1156,208 @@ def get_all_events_strings_from_db_group_by(
             newline_or_none = "\n" if not formatting.collapse else ""  # no newline if collapse is true (it would look ugly)
             header_line = f"{newline_or_none}<b>{group_by}</b>"
             all_events_strings.append(header_line)
+            entities_counts.append(1)
 
         event: Event
         for event in events_list:
-            text_line, event_entities_count = format_event_string(event, formatting)
+            text_line, event_entities_count = get_event_line(event, formatting)
             all_events_strings.append(text_line)
+            entities_counts.append(event_entities_count)
 
         if formatting.collapse:
             all_events_strings.append("</blockquote>")
+            entities_counts.append(0)
+
+    return all_events_strings, entities_counts
+
+
+def get_all_events_lines_from_db_group_by(
+        session: Session,
+        args: List[str],
+        date_override: Optional[datetime.date] = None,
+        formatting: Optional[EventFormatting] = None,
+        title_filter: Optional[str] = None
+) -> Tuple[List[str], List[int]]:
+    """same as get_all_events_strings_from_db_group_by(), but also returns the entities count of each line,
+    so split_messages() doesn't have to count them again"""
+    logger.debug("getting events from db...")
+
+    if not formatting:
+        formatting = EventFormatting()  # use default formatting
+    logger.debug(f"formatting: {formatting}")
+
+    group_by_key = extract_group_by(args)
+    logger.info(f"group by key: {group_by_key}")
+
+    events_list = get_events_from_db(session, args, date_override, title_filter)
 
+    return get_events_lines_group_by(events_list, group_by_key, formatting)
+
+
+def get_all_events_strings_from_db_group_by(
+        session: Session,
+        args: List[str],
+        date_override: Optional[datetime.date] = None,
+        formatting: Optional[EventFormatting] = None,
+        title_filter: Optional[str] = None
+) -> List[str]:
+    all_events_strings, _ = get_all_events_lines_from_db_group_by(session, args, date_override, formatting, title_filter)
     return all_events_strings
 
 
-async def download_event_media(message: Message) -> Optional[pathlib.Path]:
-    if not message.photo and not message.video and not message.animation:
-        logger.debug(f"no media to backup")
-        return
+# the filters combinations that can be selected with radar.get_events_reply_markup()'s buttons: their lists are
+# rebuilt in the background after they are dropped
+RADAR_FILTERS_COMBINATIONS = [
+    [region_filter, type_filter, time_filter]
+    for region_filter in (EventFilter.IT, EventFilter.NOT_IT)
+    for type_filter in (EventFilter.FREE, EventFilter.NOT_FREE)
+    for time_filter in (EventFilter.WEEK, EventFilter.WEEK_2, EventFilter.MONTH_FUTURE_AND_NEXT_MONTH, EventFilter.SOON)
+]
 
-    if not message.photo and message.effective_attachment.file_size > FileSizeLimit.FILESIZE_DOWNLOAD:
-        logger.info(f"file too large: {message.effective_attachment.file_size} bytes")
-        return
 
-    file_unique_id = message.photo[-1].file_unique_id if message.photo else message.effective_attachment.file_unique_id
-    chat_id_str = str(message.chat.id).replace("-100", "")
+def get_radar_args(filters: List[str], date_override: Optional[datetime.date] = None) -> List[str]:
+    args = filters[:]
+    if date_override:
+        # we cache the result *for this specific date override*, queries that
+        # do not override the date should not be date-dependent
+        args.append(date_override.strftime("%Y%m%d"))
+
+    if EventFilter.WEEK not in args:
+        # always group by week for radar23, but only if the temporal filter is not EventFilter.WEEK
+        args.append(GroupBy.WEEK_NUMBER)
+
+    args.sort()  # it's important to sort the args, see #82
+    return args
+
+
+class RadarCacheEntry:
+    def __init__(self, args: List[str], today: datetime.date, lines: List[str], entities_counts: List[int], event_keys: set):
+        self.args = args
+        self.today = today  # the date the query filters were built with
+        self.lines = lines
+        self.entities_counts = entities_counts
+        self.event_keys = event_keys  # (chat_id, message_id) of the events in the list
+        self.saved_on = time.monotonic()
+        # unique across restarts too: users' user_data (which is persisted) keeps the version of the list they received
+        self.version = time.time_ns()
+
+    def is_valid(self, today: datetime.date) -> bool:
+        return self.today == today and time.monotonic() - self.saved_on < RadarCache.ttl
+
 
-    file_name = f"{message.chat.type}_{chat_id_str}_{message.message_id}_{file_unique_id}"
+class RadarCache:
+    # "+"-joined radar args -> RadarCacheEntry, least recently used first
+    entries: "OrderedDict[str, RadarCacheEntry]" = OrderedDict()
+    max_size = config.settings.get("radar_cache_size", 200)
+    ttl = Timeout.ONE_HOUR * 20  # seconds
+    prewarm_delay = config.settings.get("radar_cache_prewarm_delay", 10)  # seconds
+    hits = 0
+    misses = 0
+    dropped = 0
 
-    if message.photo:
-        file_name = f"{file_name}.jpg"
-    elif message.video or message.animation:
-        file_name = f"{file_name}.mp4"
 
-    file_path = pathlib.Path("events_data") / file_name
+RADAR_CACHE_PREWARM_JOB_NAME = "radar_cache_prewarm"
 
-    if file_path.is_file():
-        logger.info(f"file <{file_path}> already exist: skipping download")
+
+def get_radar_cache_stats() -> dict:
+    return dict(hits=RadarCache.hits, misses=RadarCache.misses, dropped=RadarCache.dropped, size=len(RadarCache.entries))
+
+
+def get_cached_radar_lines(args: List[str], today: datetime.date) -> Optional[RadarCacheEntry]:
+    args_cache_key = "+".join(args)
+    entry = RadarCache.entries.get(args_cache_key)
+    if not entry or not entry.is_valid(today):
+        RadarCache.misses += 1
         return
 
-    logger.info(f"downloading to {file_path}...")
-    if message.photo:
-        new_file = await message.effective_attachment[-1].get_file()
-    else:
-        new_file = await message.effective_attachment.get_file()
+    RadarCache.hits += 1
+    RadarCache.entries.move_to_end(args_cache_key)
+    return entry
 
-    await new_file.download_to_drive(file_path)
-    return file_path
 
+def cache_radar_lines(session: Session, args: List[str], today: datetime.date) -> RadarCacheEntry:
+    events_list = get_events_from_db(session, args, date_override=today)
 
-async def backup_event_media(update_or_message: Union[Update, Message]) -> Optional[pathlib.Path]:
-    # download_event_media() will check whether a file with the same chat_id/message_id/file_unique_id
-    # already exists on disk, and will skip the download if so.
-    # In this way we will not try to download the same media more than once (eg. when a channel post is edited,
-    # but only the caption changed)
+    lines, entities_counts = get_events_lines_group_by(events_list, extract_group_by(args), EventFormatting())
+    event_keys = {(event.chat_id, event.message_id) for event in events_list}
+    entry = RadarCacheEntry(args, today, lines, entities_counts, event_keys)
 
-    if isinstance(update_or_message, Update):
-        message = update_or_message.effective_message
-    else:
-        message = update_or_message
+    args_cache_key = "+".join(args)
+    RadarCache.entries[args_cache_key] = entry
+    RadarCache.entries.move_to_end(args_cache_key)
+    if len(RadarCache.entries) > RadarCache.max_size:
+        RadarCache.entries.popitem(last=False)
+
+    return entry
+
+
+def event_in_radar_lines(session: Session, event: Event, entry: RadarCacheEntry) -> bool:
+    """whether the event (as it is now) would be part of the cached list. The filters are checked in memory
+    first, so the db is queried only for the lists the event might actually be part of"""
+    if event.deleted or not event_matches_filters(event, entry.args) or not event_in_time_window(event, entry.args, entry.today):
+        return False
+
+    hashtags = {arg.lower() for arg in entry.args if arg.startswith("#") and len(arg) > 1}
+    if hashtags and not hashtags.issubset({event_hashtag.hashtag for event_hashtag in event.event_hashtags}):
+        return False
+
+    # the chat the event was posted in is not loaded here: let the db confirm
+    query_filters = extract_query_filters(entry.args, today=entry.today)
+    query_filters.extend([Event.chat_id == event.chat_id, Event.message_id == event.message_id])
+    statement = events.get_events_statement(filters=query_filters).limit(1)
 
-    try:
-        return await download_event_media(message)
-    except Exception as e:
-        logger.error(f"error while trying to download media: {e}", exc_info=True)
+    return session.scalars(statement).first() is not None
+
+
+def invalidate_radar_cache(event: Optional[Event] = None) -> int:
+    """drop the cached radar lists the event was part of or should now be part of, or all of them if no event
+    is passed. Returns the number of dropped lists"""
+    session = object_session(event) if event else None
+    if not session:
+        dropped = len(RadarCache.entries)
+        RadarCache.entries.clear()
+    else:
+        event_key = (event.chat_id, event.message_id)
+        args_cache_keys = [
+            args_cache_key for args_cache_key, entry in RadarCache.entries.items()
+            if event_key in entry.event_keys or event_in_radar_lines(session, event, entry)
+        ]
+        for args_cache_key in args_cache_keys:
+            RadarCache.entries.pop(args_cache_key)
+        dropped = len(args_cache_keys)
+
+    logger.debug(f"dropped {dropped} radar lists")
+    RadarCache.dropped += dropped
+    return dropped
+
+
+def schedule_radar_cache_prewarm(context: CallbackContext):
+    """(re)schedule the job that rebuilds the radar lists, so changes to many events in a row trigger it just once"""
+    if not context.job_queue:
         return
+
+    for job in context.job_queue.get_jobs_by_name(RADAR_CACHE_PREWARM_JOB_NAME):
+        job.schedule_removal()
+
+    context.job_queue.run_once(prewarm_radar_cache_job, when=RadarCache.prewarm_delay, name=RADAR_CACHE_PREWARM_JOB_NAME)
+
+
+@decorators.catch_exception_job()
+@decorators.pass_session_job()
+async def prewarm_radar_cache_job(context: ContextTypes.DEFAULT_TYPE, session: Session):
+    today = datetime.date.today()
+    rebuilt = 0
+    start = time.perf_counter()
+    for filters in RADAR_FILTERS_COMBINATIONS:
+        args = get_radar_args(filters)
+        entry = RadarCache.entries.get("+".join(args))
+        if entry and entry.is_valid(today):
+            continue
+
+        cache_radar_lines(session, args, today)
+        rebuilt += 1
+
+        # let the updates that arrived in the meantime be handled
+        await asyncio.sleep(0)
+
+    logger.info(f"radar cache: rebuilt {rebuilt} lists in {time.perf_counter() - start:.2f} seconds")
@@ -1,24 +1,30 @@
+import asyncio
 import copy
 import datetime
+import hashlib
 import logging
 import re
-from typing import List, Optional
+from typing import List, Optional, Tuple, Dict
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from telegram import Bot, Message, helpers
 from telegram.constants import MessageLimit
 from telegram.error import BadRequest, TelegramError
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, CallbackContext
 
 import decorators
 import utilities
 from config import config
-from constants import BotSettingKey, RegionName, TempDataKey, BotSettingCategory, MONTHS_IT, DeeplinkParam
+from constants import BotSettingKey, RegionName, TempDataKey, BotSettingCategory, MONTHS_IT, DeeplinkParam, HandlersMode
 from database.models import Chat, Event, PartiesMessage, ChatMember
-from database.queries import chats, settings, parties_messages, chat_members
+from database.async_queries import chats as async_chats, settings as async_settings, parties_messages as async_parties_messages, \
+    chat_members as async_chat_members, events as async_events
+from database.queries import chats, settings
+from database.queries.settings import CachedBotSetting
 from emojis import Flag, Emoji
-from plugins.events.common import EventFilter, get_all_events_strings_from_db_group_by, GroupBy, \
-    EventFormatting, OrderBy
+from plugins.events.common import EventFilter, GroupBy, EventFormatting, OrderBy, get_events_from_db, \
+    get_events_lines_group_by, extract_group_by, extract_order_by, extract_query_filters, event_matches_filters, sort_events
 
 logger = logging.getLogger(__name__)
 
@@ -49,27 +55,55 @@ PARTIES_MESSAGE_TYPES_ARGS = {
 }
 
 
-def get_events_text(
-        session: Session,
+class PartiesListEdits:
+    # since startup
+    edited = 0
+    skipped = 0
+
+
+def get_bottom_text(radar_settings: Dict[str, CachedBotSetting], now: datetime.datetime, bot_username: str, send_to_group=False, formatting: Optional[EventFormatting] = None) -> str:
+    """the footer of the last parties list message. 'radar_settings': the cached settings of the radar category"""
+    if not formatting:
+        formatting = EventFormatting()  # use default formatting
+
+    hashtag_current_month = f"#{MONTHS_IT[now.month - 1].lower()}"
+    hashtag_next_month = f"#{MONTHS_IT[now.month].lower() if now.month < 12 else MONTHS_IT[0].lower()}"
+
+    radar_deeplink_part = ""
+    if radar_settings[BotSettingKey.RADAR_ENABLED].value():
+        if radar_settings[BotSettingKey.RADAR_PASSWORD_ENABLED].value():
+            radar_deeplink = helpers.create_deep_linked_url(bot_username, payload=DeeplinkParam.RADAR_UNLOCK_TRIGGER)
+        else:
+            radar_deeplink = helpers.create_deep_linked_url(bot_username, payload=DeeplinkParam.RADAR)
+        radar_deeplink_part = f" - oppure <a href=\"{radar_deeplink}\">&lt;&lt;{Emoji.COMPASS}&gt;&gt;</a> ;)"
+
+    request_channel_invite_link_part = ""
+    if send_to_group:
+        request_link_deeplink = helpers.create_deep_linked_url(bot_username, payload=DeeplinkParam.EVENTS_CHAT_INVITE_LINK)
+        request_channel_invite_link_part = f"➜ <i>non riesci ad accedere alle feste linkate? <a href=\"{request_link_deeplink}\">unisciti al canale</a></i>\n"
+
+    newline_or_empty = "\n" if not formatting.collapse else ""  # additional new line if collapse is false
+    return f"{newline_or_empty}\n➜ <i>per una ricerca più approfondita usa gli hashtag {hashtag_current_month} e {hashtag_next_month}, " \
+           f"e consulta la <a href=\"https://t.me/c/1926530314/45\">guida alla ricerca tramite hashtag</a>" \
+           f"{radar_deeplink_part}</i>\n" \
+           f"{request_channel_invite_link_part}" \
+           f"➜ <i>aggiornato in automatico quando una festa viene pubblicata o modificata</i>"
+
+
+def render_events_text(
         filter_key: str,
+        events_list: List[Event],
         now: datetime.datetime,
         args: List[str],
-        bot_username: str,
-        send_to_group=False,
-        append_bottom_text=True,
+        bottom_text: Optional[str] = None,
         formatting: Optional[EventFormatting] = None
-) -> Optional[str]:
-    logger.info(f"getting events of type \"{filter_key}\"...")
+) -> Optional[Tuple[str, str]]:
+    """returns the text of the list and its digest (see parties_list_digest()), or None if there are no events.
+    'events_list' must be already filtered and sorted"""
+    if not formatting:
+        formatting = EventFormatting()  # use default formatting
 
-    # always group by, even if just a week is requested
-    args.append(GroupBy.WEEK_NUMBER)
-
-    logger.info(f"args: {args}")
-    all_events = get_all_events_strings_from_db_group_by(
-        session=session,
-        args=args,
-        formatting=formatting
-    )
+    all_events, _ = get_events_lines_group_by(events_list, extract_group_by(args), formatting)
     if not all_events:
         return
 
@@ -80,38 +114,12 @@ def get_events_text(
     text = f"<b>{LIST_TYPE_DESCRIPTION[filter_key]}</b>\n\n" \
            f"{events_text}"
 
-    if append_bottom_text:
-        # include all of this only if the filter_key (that is, the parties list message) is the last one we
-        # have to send/edit
-
-        hashtag_current_month = f"#{MONTHS_IT[now.month - 1].lower()}"
-        hashtag_next_month = f"#{MONTHS_IT[now.month].lower() if now.month < 12 else MONTHS_IT[0].lower()}"
-
-        radar_deeplink_part = ""
-        radar_settings = settings.get_settings_as_dict(session, include_categories=BotSettingCategory.RADAR)
-        if radar_settings[BotSettingKey.RADAR_ENABLED].value():
-            if radar_settings[BotSettingKey.RADAR_PASSWORD_ENABLED].value():
-                radar_deeplink = helpers.create_deep_linked_url(bot_username, payload=DeeplinkParam.RADAR_UNLOCK_TRIGGER)
-            else:
-                radar_deeplink = helpers.create_deep_linked_url(bot_username, payload=DeeplinkParam.RADAR)
-            radar_deeplink_part = f" - oppure <a href=\"{radar_deeplink}\">&lt;&lt;{Emoji.COMPASS}&gt;&gt;</a> ;)"
-
-        request_channel_invite_link_part = ""
-        if send_to_group:
-            request_link_deeplink = helpers.create_deep_linked_url(bot_username, payload=DeeplinkParam.EVENTS_CHAT_INVITE_LINK)
-            request_channel_invite_link_part = f"➜ <i>non riesci ad accedere alle feste linkate? <a href=\"{request_link_deeplink}\">unisciti al canale</a></i>\n"
-
-        freq_minutes = utilities.round_to_hour(config.settings.parties_message_job_frequency)
-        refresh_freq = utilities.elapsed_str_from_seconds(freq_minutes * 60, if_empty="pochi minuti")
-        newline_or_empty = "\n" if not formatting.collapse else ""  # additional new line if collapse is false
-        text += f"{newline_or_empty}\n➜ <i>per una ricerca più approfondita usa gli hashtag {hashtag_current_month} e {hashtag_next_month}, " \
-                f"e consulta la <a href=\"https://t.me/c/1926530314/45\">guida alla ricerca tramite hashtag</a>" \
-                f"{radar_deeplink_part}</i>\n" \
-                f"{request_channel_invite_link_part}" \
-                f"➜ <i>aggiornato in automatico (frequenza: {refresh_freq})</i>"
+    if bottom_text:
+        # included only if the filter_key (that is, the parties list message) is the last one we have to send/edit
+        text += bottom_text
 
     html_entities_count = utilities.count_html_entities(text)
-    additional_entities = 2 if append_bottom_text else 0  # add hashtags to the count
+    additional_entities = 2 if bottom_text else 0  # add hashtags to the count
     additional_entities += 1  # just to make sure...
     entities_count = html_entities_count + additional_entities
     logger.debug(f"entities count: {entities_count}/{MessageLimit.MESSAGE_ENTITIES}")
@@ -128,10 +136,91 @@ def get_events_text(
 
         logger.debug(f"entities count (no bold, {html_tags_to_remove_count} html tags removed): {utilities.count_html_entities(text) + additional_entities}")
 
+    # the timestamp footer is not part of the digest, otherwise it would change every time
+    digest = parties_list_digest(text, events_list)
+
     now_str = utilities.format_datetime(now, format_str='%Y%m%d %H%M')
     text += f"\n{utilities.subscript(now_str)} {utilities.subscript(str(entities_count))}"
 
-    return text
+    return text, digest
+
+
+def get_parties_lists_time_args(weeks: int) -> List[str]:
+    # always group by, even if just a week is requested
+    return [EventFilter.WEEK if weeks <= 1 else EventFilter.WEEK_2, GroupBy.WEEK_NUMBER]
+
+
+def get_parties_lists_texts(
+        session: Session,
+        now: datetime.datetime,
+        weeks: int,
+        bot_username: str,
+        send_to_group=False,
+        formatting: Optional[EventFormatting] = None
+) -> Dict[str, Optional[Tuple[str, str]]]:
+    """render all the parties lists in PARTIES_MESSAGE_TYPES_ARGS. The events of the period are fetched with a
+    single query, and then split by each list's filters and sorted in memory, so the number of queries doesn't
+    depend on the number of lists. Returns the text and digest of each list, see render_events_text()"""
+    time_args = get_parties_lists_time_args(weeks)
+    events_list = get_events_from_db(session, time_args)
+    logger.info(f"fetched {len(events_list)} events for args {time_args}")
+
+    radar_settings = settings.get_cached_as_dict(session, include_categories=BotSettingCategory.RADAR)
+    bottom_text = get_bottom_text(radar_settings, now, bot_username, send_to_group, formatting)
+
+    return render_parties_lists_texts(events_list, time_args, now, bottom_text, formatting)
+
+
+async def get_parties_lists_texts_async(
+        session: AsyncSession,
+        now: datetime.datetime,
+        weeks: int,
+        bot_username: str,
+        send_to_group=False,
+        formatting: Optional[EventFormatting] = None
+) -> Dict[str, Optional[Tuple[str, str]]]:
+    """same as get_parties_lists_texts(), with the async queries"""
+    time_args = get_parties_lists_time_args(weeks)
+    events_list = list(await async_events.get_events(session, filters=extract_query_filters(time_args), order_by=extract_order_by(time_args)))
+    logger.info(f"fetched {len(events_list)} events for args {time_args}")
+
+    radar_settings = await async_settings.get_cached_as_dict(session, include_categories=BotSettingCategory.RADAR)
+    bottom_text = get_bottom_text(radar_settings, now, bot_username, send_to_group, formatting)
+
+    return render_parties_lists_texts(events_list, time_args, now, bottom_text, formatting)
+
+
+def render_parties_lists_texts(
+        events_list: List[Event],
+        time_args: List[str],
+        now: datetime.datetime,
+        bottom_text: str,
+        formatting: Optional[EventFormatting] = None
+) -> Dict[str, Optional[Tuple[str, str]]]:
+    last_filter_key = list(PARTIES_MESSAGE_TYPES_ARGS.keys())[-1]
+
+    texts = {}
+    for filter_key, filter_args in PARTIES_MESSAGE_TYPES_ARGS.items():
+        args = filter_args + time_args
+        logger.info(f"rendering events of type \"{filter_key}\" (args: {args})...")
+
+        list_events = sort_events([event for event in events_list if event_matches_filters(event, args)], extract_order_by(args))
+        texts[filter_key] = render_events_text(
+            filter_key=filter_key,
+            events_list=list_events,
+            now=now,
+            args=args,
+            bottom_text=bottom_text if filter_key == last_filter_key else None,
+            formatting=formatting
+        )
+
+    return texts
+
+
+def parties_list_digest(text: str, events_list: List[Event]) -> str:
+    """digest of what the users see in a parties list message: if it didn't change, there's no need to edit the message"""
+    events_ids = ",".join(f"{event.chat_id}/{event.message_id}" for event in events_list)
+    return hashlib.sha256(f"{text}\n{events_ids}".encode("utf-8")).hexdigest()
 
 
 async def pin_message(bot: Bot, new_parties_message: Message, old_parties_message: Optional[PartiesMessage] = None):
@@ -176,13 +265,43 @@ def time_to_post(now_it: datetime.datetime, last_parties_message_isoweek: int, p
     return False
 
 
+PARTIES_MESSAGE_UPDATE_JOB_NAME = "parties_message_update"
+
+# the periodic job and the ones scheduled by request_parties_message_update() or /updatelists must not run
+# at the same time, or they might post the same lists twice
+PARTIES_MESSAGE_JOB_LOCK = asyncio.Lock()
+
+
+def request_parties_message_update(context: CallbackContext):
+    """signal that the parties list messages should be updated. The update runs once no other change happened
+    for 'parties_message_update_delay' seconds, so a burst of changes leads to a single update"""
+    logger.info("setting flag to signal that the parties message list should be updated...")
+    context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
+
+    if config.handlers.mode != HandlersMode.FLYTEK or not context.job_queue:
+        # the parties list is not posted (see main.py): just set the flag
+        return
+
+    for job in context.job_queue.get_jobs_by_name(PARTIES_MESSAGE_UPDATE_JOB_NAME):
+        job.schedule_removal()
+
+    delay = config.settings.get("parties_message_update_delay", 60)
+    logger.debug(f"parties message update scheduled in {delay} seconds")
+    context.job_queue.run_once(parties_message_job, when=delay, name=PARTIES_MESSAGE_UPDATE_JOB_NAME)
+
+
 @decorators.catch_exception_job()
-@decorators.pass_session_job()
-async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: Session):
+@decorators.pass_async_session_job()
+async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
+    async with PARTIES_MESSAGE_JOB_LOCK:
+        await post_or_update_parties_messages(context, session)
+
+
+async def post_or_update_parties_messages(context: ContextTypes.DEFAULT_TYPE, session: AsyncSession):
     logger.info("")
     logger.info("parties message job: start")
 
-    pl_settings = settings.get_settings_as_dict(session, include_categories=BotSettingCategory.PARTIES_LIST)
+    pl_settings = await async_settings.get_cached_as_dict(session, include_categories=BotSettingCategory.PARTIES_LIST)
 
     if not pl_settings[BotSettingKey.PARTIES_LIST].value():
         logger.debug("parties list disabled from settings")
@@ -190,15 +309,15 @@ async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: Sessi
 
     parties_message_send_to_group = pl_settings[BotSettingKey.PARTIES_LIST_POST_TO_USERS_CHAT].value()
     if not parties_message_send_to_group:
-        target_chat: Optional[Chat] = chats.get_chat(session, Chat.is_events_chat)
+        target_chat: Optional[chats.CachedChat] = await async_chats.get_cached_chat(session, Chat.is_events_chat)
     else:
         logger.info("using users chat as target chat")
-        target_chat: Optional[Chat] = chats.get_chat(session, Chat.is_users_chat)
+        target_chat: Optional[chats.CachedChat] = await async_chats.get_cached_chat(session, Chat.is_users_chat)
 
     if not target_chat:
         logger.debug("no events/users chat set")
     elif target_chat.is_users_chat:
-        bot_chat_member: Optional[ChatMember] = chat_members.get_chat_member_by_id(session, context.bot.id, target_chat.chat_id)
+        bot_chat_member: Optional[ChatMember] = await async_chat_members.get_chat_member_by_id(session, context.bot.id, target_chat.chat_id)
         if not (bot_chat_member.is_administrator() and bot_chat_member.can_pin_messages):
             # only admins with the permission to pin messages can edit messages with no time limit
             logger.warning("cannot post to users chat if the bot doesn't have the permission to pin messages")
@@ -217,9 +336,11 @@ async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: Sessi
     # we need to get it before the for loop because it should be valid for every filter
     parties_list_changed = context.bot_data.pop(TempDataKey.UPDATE_PARTIES_MESSAGE, False)
     logger.info(f"'parties_list_changed': {parties_list_changed}")
+    # this flag is set by the /updatelists command: when used, make sure to act as if there has been changes,
+    # and edit the messages even if their content didn't change
+    parties_list_force_update = context.bot_data.pop(TempDataKey.FORCE_UPDATE_PARTIES_MESSAGE, False)
     if not parties_list_changed:
-        # this flag is set by the /updatelists command: when used, make sure to act as if there has been changes
-        parties_list_changed = context.bot_data.pop(TempDataKey.FORCE_UPDATE_PARTIES_MESSAGE, False)
+        parties_list_changed = parties_list_force_update
         logger.info(f"force 'parties_list_changed' flag: {parties_list_changed}")
 
     # we check whether the flag is set once for all filters
@@ -229,14 +350,13 @@ async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: Sessi
 
     now_it = utilities.now(tz=True, dst_check=True)
 
-    # we need this so we can add the footer text just to the last message
-    last_filter_key = list(PARTIES_MESSAGE_TYPES_ARGS.keys())[-1]
+    # all the lists are rendered together, the first time one of them is needed
+    parties_lists_texts: Optional[Dict[str, Optional[Tuple[str, str]]]] = None
 
-    for filter_key, filter_args in PARTIES_MESSAGE_TYPES_ARGS.items():
+    for filter_key in PARTIES_MESSAGE_TYPES_ARGS:
         logger.info(f"filter: {filter_key}")
-        args = [arg for arg in filter_args]  # create a copy of the args list, because we will add items to it
 
-        last_parties_message: Optional[PartiesMessage] = parties_messages.get_last_parties_message(session, target_chat.chat_id, events_type=filter_key)
+        last_parties_message: Optional[PartiesMessage] = await async_parties_messages.get_last_parties_message(session, target_chat.chat_id, events_type=filter_key)
 
         post_new_message = copy.deepcopy(post_new_message_force)  # create a copy, not a reference
         if not post_new_message:
@@ -277,23 +397,23 @@ async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: Sessi
             logger.info(f"parties list changed, but there is no parties list message to update and it's not time to post: continuing to next filter...")
             continue
 
-        logger.info("adding arg to extract number of weeks...")
-        args.append(EventFilter.WEEK) if parties_message_weeks <= 1 else args.append(EventFilter.WEEK_2)
-
-        text = get_events_text(
-            session=session,
-            filter_key=filter_key,
-            now=now_it,
-            args=args,
-            bot_username=context.bot.username,
-            append_bottom_text=filter_key == last_filter_key,
-            send_to_group=parties_message_send_to_group,
-            formatting=EventFormatting(discussion_group_link=parties_message_group_messages_links, collapse=parties_message_collapse)
-        )
-        if not text:
+        if parties_lists_texts is None:
+            parties_lists_texts = await get_parties_lists_texts_async(
+                session=session,
+                now=now_it,
+                weeks=parties_message_weeks,
+                bot_username=context.bot.username,
+                send_to_group=parties_message_send_to_group,
+                formatting=EventFormatting(discussion_group_link=parties_message_group_messages_links, collapse=parties_message_collapse)
+            )
+
+        text_and_digest = parties_lists_texts[filter_key]
+        if not text_and_digest:
             logger.info("no events for this filter, continuing to next one...")
             continue
 
+        text, content_digest = text_and_digest
+
         # no idea why but we *need* large timeouts for these requests
         timeouts = dict(connect_timeout=300, read_timeout=300, write_timeout=300)
 
@@ -302,20 +422,28 @@ async def parties_message_job(context: ContextTypes.DEFAULT_TYPE, session: Sessi
             sent_message = await context.bot.send_message(target_chat.chat_id, text, **timeouts)
 
             logger.info("saving new PartiesMessage...")
-            new_parties_message = PartiesMessage(sent_message, events_type=filter_key, force_sent=post_new_message_force)
+            new_parties_message = PartiesMessage(sent_message, events_type=filter_key, force_sent=post_new_message_force, content_digest=content_digest)
             new_parties_message.force_sent = post_new_message_force
             session.add(new_parties_message)
-            session.commit()
+            await session.commit()
 
             if parties_message_pin:
                 await pin_message(context.bot, sent_message, last_parties_message)
             if parties_message_delete_old and last_parties_message:
                 await delete_old_message(context.bot, last_parties_message)
+        elif parties_list_changed and last_parties_message and not parties_list_force_update and last_parties_message.content_digest == content_digest:
+            # the flag is set by any change to any event, even if it's not part of this list
+            logger.info(f"message {last_parties_message.message_id} in chat {last_parties_message.chat_id} is up to date: no need to edit it")
+            PartiesListEdits.skipped += 1
         elif parties_list_changed and last_parties_message:
             # 'last_parties_message' should always be ok (not None) inside this 'if'
             logger.info(f"editing message {last_parties_message.message_id} in chat {last_parties_message.chat_id}...")
             edited_message = await context.bot.edit_message_text(text, last_parties_message.chat_id, last_parties_message.message_id, **timeouts)
             last_parties_message.save_edited_message(edited_message)
+            last_parties_message.content_digest = content_digest
+            PartiesListEdits.edited += 1
+
+        await session.commit()
 
-        session.commit()
+    logger.info(f"parties list messages since startup: {PartiesListEdits.edited} edited, {PartiesListEdits.skipped} edits skipped (no change)")
 
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pathlib
+from typing import Optional, List, Set, Tuple
+
+from sqlalchemy.orm import Session
+from telegram import Message, Bot
+from telegram.constants import FileSizeLimit, MessageType
+from telegram.error import BadRequest, RetryAfter
+
+import utilities
+from config import config
+from database.base import get_session
+from database.models import Event, MediaDownload, MediaDownloadStatus
+from database.queries import events, media_downloads
+from image_hashes import ImageHashIndexes, get_file_hashes
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DATA_DIRECTORY = pathlib.Path("events_data")
+# content-addressed store: one file per file_unique_id, no matter how many messages it was posted in (the messages
+# are referenced by the media_downloads rows)
+MEDIA_STORE_DIRECTORY = EVENTS_DATA_DIRECTORY / "media"
+
+
+class MediaBackupQueue:
+    """Media backups are saved to the media_downloads table and downloaded by a fixed pool of workers, so the
+    handlers don't have to wait for the downloads. The queue survives restarts: queued downloads are resumed
+    when the workers are started again"""
+    workers_count: int = config.settings.get("media_backup_workers", 2)
+    max_attempts: int = config.settings.get("media_backup_max_attempts", 5)
+    retry_delay: int = config.settings.get("media_backup_retry_delay", 60)  # seconds, doubled at every failed attempt
+    poll_interval: int = 60  # seconds, how often idle workers look for downloads that are due again
+
+    workers: List[asyncio.Task] = []
+    wakeup: Optional[asyncio.Event] = None
+    # what the workers are downloading right now: a file is never downloaded by two workers at the same time
+    in_progress: Set[Tuple[int, int]] = set()
+    in_progress_file_unique_ids: Set[str] = set()
+
+    queued = 0
+    downloaded = 0
+    reused = 0  # file already in the store (posted in another message)
+    retried = 0
+    failed = 0
+
+
+def get_media_backup_stats() -> dict:
+    return dict(
+        workers=len([worker for worker in MediaBackupQueue.workers if not worker.done()]),
+        in_progress=len(MediaBackupQueue.in_progress),
+        queued=MediaBackupQueue.queued,
+        downloaded=MediaBackupQueue.downloaded,
+        reused=MediaBackupQueue.reused,
+        retried=MediaBackupQueue.retried,
+        failed=MediaBackupQueue.failed
+    )
+
+
+def get_media_store_path(file_unique_id: str, extension: str) -> pathlib.Path:
+    """files are sharded in 256 subdirectories by the hash of their file_unique_id, so no directory grows too large"""
+    shard = hashlib.sha1(file_unique_id.encode()).hexdigest()[:2]
+    return MEDIA_STORE_DIRECTORY / shard / f"{file_unique_id}.{extension}"
+
+
+def get_event_media_file_path(message: Message) -> Optional[pathlib.Path]:
+    """where the message's media should be saved, or None if there's nothing to backup"""
+    if not message.photo and not message.video and not message.animation:
+        logger.debug(f"no media to backup")
+        return
+
+    if not message.photo and message.effective_attachment.file_size > FileSizeLimit.FILESIZE_DOWNLOAD:
+        logger.info(f"file too large: {message.effective_attachment.file_size} bytes")
+        return
+
+    file_unique_id = message.photo[-1].file_unique_id if message.photo else message.effective_attachment.file_unique_id
+    extension = "jpg" if message.photo else "mp4"
+
+    return get_media_store_path(file_unique_id, extension)
+
+
+def save_media_file_path(session: Session, media_download: MediaDownload, event: Optional[Event] = None):
+    if not event and media_download.event_chat_id:
+        event = events.get_or_create(session, media_download.event_chat_id, media_download.event_message_id, create_if_missing=False)
+    if not event:
+        return
+
+    if media_download.file_path not in event.get_media_file_paths():
+        event.add_media_file_path(media_download.file_path)
+
+
+def queue_event_media_backup(session: Session, message: Message, event: Optional[Event] = None) -> Optional[MediaDownload]:
+    """queue the backup of the message's media. If 'event' is passed, the file path will be saved to it once
+    the file is downloaded. Commits the session, so the workers can pick the download up right away"""
+    file_path = get_event_media_file_path(message)
+    if not file_path:
+        return
+
+    _, file_unique_id, _ = utilities.get_media_ids(message)
+
+    media_download: Optional[MediaDownload] = media_downloads.get(session, message.chat.id, message.message_id)
+    if media_download and media_download.file_unique_id == file_unique_id:
+        # eg. a channel post was edited, but only the caption changed
+        logger.info(f"media of {message.chat.id}/{message.message_id} already queued/downloaded: skipping")
+        if event and not media_download.event_chat_id:
+            media_download.set_event(event)
+            if media_download.status == MediaDownloadStatus.DONE:
+                save_media_file_path(session, media_download, event)
+            session.commit()
+        return media_download
+
+    if not media_download:
+        media_download = MediaDownload(message.chat.id, message.message_id)
+        session.add(media_download)
+
+    media_download.save_media(message, file_path)
+    media_download.set_event(event)
+
+    # even if the file is already in the store (same file posted in another message, eg. the channel post and
+    # its comments), a worker will take care of it: it has to compute the image hashes too
+    logger.info(f"queueing download of {file_unique_id} to <{file_path}>...")
+    session.commit()
+    MediaBackupQueue.queued += 1
+
+    if MediaBackupQueue.wakeup:
+        MediaBackupQueue.wakeup.set()
+
+    return media_download
+
+
+def claim_next_download(session: Session) -> Optional[MediaDownload]:
+    # there is no await between the select and the in-progress sets update, so workers can't claim the same row
+    media_download = media_downloads.get_next_queued(session, utilities.now(), MediaBackupQueue.in_progress_file_unique_ids)
+    if media_download:
+        MediaBackupQueue.in_progress.add((media_download.chat_id, media_download.message_id))
+        MediaBackupQueue.in_progress_file_unique_ids.add(media_download.file_unique_id)
+
+    return media_download
+
+
+def release_download(download_key: Tuple[int, int], file_unique_id: str):
+    MediaBackupQueue.in_progress.discard(download_key)
+    MediaBackupQueue.in_progress_file_unique_ids.discard(file_unique_id)
+
+
+def postpone_download(media_download: MediaDownload, error: Exception):
+    """schedule another attempt with exponential backoff, or give up if there are no attempts left"""
+    if isinstance(error, RetryAfter):
+        retry_in = error.retry_after
+    else:
+        retry_in = MediaBackupQueue.retry_delay * 2 ** media_download.attempts
+
+    if media_download.attempts + 1 >= MediaBackupQueue.max_attempts:
+        logger.error(f"error while downloading {media_download}, giving up: {error}", exc_info=error)
+        media_download.set_failed(str(error))
+        MediaBackupQueue.failed += 1
+    else:
+        logger.warning(f"error while downloading {media_download}, retrying in {retry_in} seconds: {error}")
+        media_download.set_failed(str(error), retry_in=retry_in)
+        MediaBackupQueue.retried += 1
+
+
+def postpone_download_after_error(download_key: Tuple[int, int], error: Exception) -> bool:
+    """postpone a download that raised an unexpected error, in a new transaction (the worker's one was rolled back),
+    so it is not claimed again right away. Returns False if the download couldn't be updated"""
+    session: Session = get_session()
+    try:
+        media_download: Optional[MediaDownload] = media_downloads.get(session, *download_key)
+        if media_download and media_download.status == MediaDownloadStatus.QUEUED:
+            postpone_download(media_download, error)
+            session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"error while postponing download {download_key}: {e}", exc_info=True)
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+
+async def download_media(bot: Bot, session: Session, media_download: MediaDownload):
+    file_path = pathlib.Path(media_download.file_path)
+    if file_path.is_file():
+        logger.info(f"file {media_download.file_unique_id} already in the store: skipping download")
+        media_download.set_downloaded()
+        MediaBackupQueue.reused += 1
+    else:
+        logger.info(f"downloading to {file_path}...")
+        # download to a temporary file, so an interrupted download is never mistaken for a stored file
+        partial_file_path = file_path.with_name(f"{file_path.name}.part")
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            new_file = await bot.get_file(media_download.file_id)
+            await new_file.download_to_drive(partial_file_path)
+            os.replace(partial_file_path, file_path)
+        except BadRequest as e:
+            # eg. the file_id is not valid anymore, or the file is too big: retrying will not help
+            logger.error(f"cannot download {media_download}: {e}")
+            media_download.set_failed(str(e))
+            MediaBackupQueue.failed += 1
+            return
+        except Exception as e:
+            postpone_download(media_download, e)
+            return
+
+        media_download.set_downloaded()
+        MediaBackupQueue.downloaded += 1
+
+    if media_download.media_type == MessageType.PHOTO and not media_download.phash:
+        try:
+            phash, dhash = await get_file_hashes(file_path)
+            media_download.save_image_hashes(phash, dhash)
+            ImageHashIndexes.events.add((media_download.chat_id, media_download.message_id), phash, dhash)
+        except Exception as e:
+            logger.error(f"error while computing the image hashes of {media_download}: {e}", exc_info=True)
+
+    save_media_file_path(session, media_download)
+
+
+async def media_backup_worker(bot: Bot, worker_id: int):
+    logger.debug(f"media backup worker #{worker_id} started")
+
+    while True:
+        session: Session = get_session()
+        # saved when claimed: after a rollback, reading the row's attributes would need another query
+        download_key: Optional[Tuple[int, int]] = None
+        file_unique_id: Optional[str] = None
+        postponed = True
+        try:
+            media_download = claim_next_download(session)
+            if media_download:
+                download_key = (media_download.chat_id, media_download.message_id)
+                file_unique_id = media_download.file_unique_id
+                await download_media(bot, session, media_download)
+                session.commit()
+        except Exception as e:
+            logger.error(f"media backup worker #{worker_id}: error while processing {download_key}: {e}", exc_info=True)
+            session.rollback()
+            if download_key:
+                # otherwise the row would still be due, and it would be claimed again immediately
+                postponed = postpone_download_after_error(download_key, e)
+        finally:
+            if download_key:
+                release_download(download_key, file_unique_id)
+            session.close()
+
+        if not postponed:
+            # eg. the db is locked: do not retry in a tight loop
+            await asyncio.sleep(MediaBackupQueue.poll_interval)
+
+        if download_key:
+            # look for the next one right away
+            continue
+
+        MediaBackupQueue.wakeup.clear()
+        try:
+            await asyncio.wait_for(MediaBackupQueue.wakeup.wait(), timeout=MediaBackupQueue.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_media_backup_workers(bot: Bot):
+    MediaBackupQueue.wakeup = asyncio.Event()
+    MediaBackupQueue.workers = [
+        asyncio.create_task(media_backup_worker(bot, worker_id), name=f"media_backup_worker_{worker_id}")
+        for worker_id in range(MediaBackupQueue.workers_count)
+    ]
+    logger.info(f"started {len(MediaBackupQueue.workers)} media backup workers")
+
+
+async def stop_media_backup_workers():
+    for worker in MediaBackupQueue.workers:
+        worker.cancel()
+
+    # downloads interrupted now will be resumed at the next startup: they are still queued in the db
+    await asyncio.gather(*MediaBackupQueue.workers, return_exceptions=True)
+    MediaBackupQueue.workers = []
+    logger.info("media backup workers stopped")
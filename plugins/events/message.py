@@ -1,5 +1,4 @@
 import logging
-import pathlib
 from typing import Optional
 
 from sqlalchemy.orm import Session
@@ -19,9 +18,10 @@ from plugins.events.common import (
     add_event_message_metadata,
     parse_message_text,
     parse_message_entities,
-    drop_events_cache,
-    backup_event_media
+    drop_events_cache
 )
+from plugins.events.job import request_parties_message_update
+from plugins.events.media_backup import queue_event_media_backup
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +39,7 @@ async def notify_event_validity(
         message: Message,
         event: Event,
         bot: Bot,
-        staff_chat: Chat,
+        staff_chat: chats.CachedChat,
         is_edited_message: bool,
         was_valid_before_parsing: bool,
         is_valid_after_parsing: bool,
@@ -96,7 +96,7 @@ async def on_album_message_no_text(update: Update, context: ContextTypes.DEFAULT
     # we need to catch updates that do not have a text/caption, but that are part of an album
 
     if config.settings.backup_events:
-        await backup_event_media(update)
+        queue_event_media_backup(session, update.effective_message)
 
 
 @decorators.catch_exception(silent=True)
@@ -145,16 +145,15 @@ async def on_event_message(update: Update, context: ContextTypes.DEFAULT_TYPE, s
     date_in_the_past_after_parsing = event.start_date_in_the_past(raise_on_no_date=False)
     has_hashtags = bool(event.get_hashtags())
 
-    logger.info("setting flag to signal that the parties message list should be updated...")
-    context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
+    request_parties_message_update(context)
 
     logger.info("dropping events cache...")
-    drop_events_cache(context)
+    drop_events_cache(context, event)
 
     session.commit()
 
     if config.settings.notify_events_validity:
-        staff_chat = chats.get_chat(session, Chat.is_staff_chat)
+        staff_chat = chats.get_cached_chat(session, Chat.is_staff_chat)
         if staff_chat:
             await notify_event_validity(
                 message=update.effective_message,
@@ -169,9 +168,8 @@ async def on_event_message(update: Update, context: ContextTypes.DEFAULT_TYPE, s
             )
 
     if config.settings.backup_events:
-        file_path: pathlib.Path = await backup_event_media(update)
-        if file_path:
-            event.add_media_file_path(file_path)
+        # the file path will be saved to the event once downloaded
+        queue_event_media_backup(session, update.effective_message, event)
 
 
 @decorators.catch_exception(silent=True)
@@ -189,12 +187,11 @@ async def on_linked_group_event_message(update: Update, context: ContextTypes.DE
         logger.info("Event: saving discussion group's post info...")
         event.save_discussion_group_message(update.effective_message)
 
-        logger.info("setting flag to signal that the parties message list should be updated...")
-        context.bot_data[TempDataKey.UPDATE_PARTIES_MESSAGE] = True
+        request_parties_message_update(context)
     
         # make sure to drop the event cache so new commands will have updated info
         logger.info("dropping events cache...")
-        drop_events_cache(context)
+        drop_events_cache(context, event)
 
         # no need to try to get a PartiesMessage if an Event for this message was found
         return
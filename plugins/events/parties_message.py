@@ -12,8 +12,8 @@ from constants import Group, TempDataKey, BotSettingKey, WEEKDAYS_IT, BotSetting
 from database.models import Chat, PartiesMessage
 from database.queries import chats, parties_messages, settings
 from ext.filters import ChatFilter, Filter
-from plugins.events.common import EventFilter, EventFormatting
-from plugins.events.job import parties_message_job, LIST_TYPE_DESCRIPTION, get_events_text, PARTIES_MESSAGE_TYPES_ARGS
+from plugins.events.common import EventFormatting
+from plugins.events.job import parties_message_job, LIST_TYPE_DESCRIPTION, get_parties_lists_texts
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +23,11 @@ logger = logging.getLogger(__name__)
 async def on_partiesjob_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"/partiesjob {utilities.log(update)}")
 
-    send_to_group = settings.get_or_create(session, BotSettingKey.PARTIES_LIST_POST_TO_USERS_CHAT).value()
+    send_to_group = settings.get_value(session, BotSettingKey.PARTIES_LIST_POST_TO_USERS_CHAT)
     if send_to_group:
-        target_chat = chats.get_chat(session, Chat.is_users_chat)
+        target_chat = chats.get_cached_chat(session, Chat.is_users_chat)
     else:
-        target_chat = chats.get_chat(session, Chat.is_events_chat)
+        target_chat = chats.get_cached_chat(session, Chat.is_events_chat)
 
     list_needs_update = context.bot_data.get(TempDataKey.UPDATE_PARTIES_MESSAGE, False)
     text = (f"Verrà eseguito il job che controlla se aggiornare i messaggi con la lista delle feste in {target_chat.title} "
@@ -66,27 +66,24 @@ async def on_partiesjob_command(update: Update, context: ContextTypes.DEFAULT_TY
 async def on_getlists_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"/getlists {utilities.log(update)}")
 
-    discussion_group_messages_links = settings.get_or_create(session, BotSettingKey.PARTIES_LIST_DISCUSSION_LINK).value()
-    weeks = settings.get_or_create(session, BotSettingKey.PARTIES_LIST_WEEKS).value()
-    send_to_group = settings.get_or_create(session, BotSettingKey.PARTIES_LIST_POST_TO_USERS_CHAT).value()
-    collapse_list = settings.get_or_create(session, BotSettingKey.PARTIES_LIST_COLLAPSE).value()
-
-    last_filter_key = list(PARTIES_MESSAGE_TYPES_ARGS.keys())[-1]
+    discussion_group_messages_links = settings.get_value(session, BotSettingKey.PARTIES_LIST_DISCUSSION_LINK)
+    weeks = settings.get_value(session, BotSettingKey.PARTIES_LIST_WEEKS)
+    send_to_group = settings.get_value(session, BotSettingKey.PARTIES_LIST_POST_TO_USERS_CHAT)
+    collapse_list = settings.get_value(session, BotSettingKey.PARTIES_LIST_COLLAPSE)
 
     now = utilities.now(tz=True, dst_check=True)
-    for filter_key, args in PARTIES_MESSAGE_TYPES_ARGS.items():
-        args.append(EventFilter.WEEK) if weeks <= 1 else args.append(EventFilter.WEEK_2)
-        text = get_events_text(
-            session=session,
-            filter_key=filter_key,
-            now=now,
-            args=args,
-            bot_username=context.bot.username,
-            send_to_group=send_to_group,
-            append_bottom_text=filter_key == last_filter_key,
-            formatting=EventFormatting(discussion_group_link=discussion_group_messages_links, collapse=collapse_list)
-        )
-        if not text:
+    parties_lists_texts = get_parties_lists_texts(
+        session=session,
+        now=now,
+        weeks=weeks,
+        bot_username=context.bot.username,
+        send_to_group=send_to_group,
+        formatting=EventFormatting(discussion_group_link=discussion_group_messages_links, collapse=collapse_list)
+    )
+    for filter_key, text_and_digest in parties_lists_texts.items():
+        if text_and_digest:
+            text, _ = text_and_digest
+        else:
             text = f"nessuna festa per <code>{filter_key}</code>"
 
         await update.message.reply_html(f"{text}")
@@ -127,7 +124,7 @@ async def on_listsinfo_command(update: Update, context: ContextTypes.DEFAULT_TYP
     logger.info(f"/listsinfo {utilities.log(update)}")
 
     # pls: Parties List Settings
-    pls_dict = settings.get_settings_as_dict(session, include_categories=BotSettingCategory.PARTIES_LIST)
+    pls_dict = settings.get_cached_as_dict(session, include_categories=BotSettingCategory.PARTIES_LIST)
     enabled = pls_dict[BotSettingKey.PARTIES_LIST].value()
     post_to_group = pls_dict[BotSettingKey.PARTIES_LIST_POST_TO_USERS_CHAT].value()
     update_only = pls_dict[BotSettingKey.PARTIES_LIST_UPDATE_ONLY].value()
@@ -8,17 +8,18 @@ from telegram.ext import ContextTypes, filters, CommandHandler, CallbackContext,
 
 import decorators
 import utilities
-from constants import BotSettingKey, Group, MONTHS_IT, TempDataKey, Timeout, DeeplinkParam, BotSettingCategory
+from constants import BotSettingKey, Group, MONTHS_IT, TempDataKey, DeeplinkParam, BotSettingCategory
 from database.models import Chat, User
 from database.queries import settings, chat_members, private_chat_messages
 from emojis import Emoji, Flag
 from ext.filters import Filter
 from plugins.events.common import (
     EventFilter,
-    GroupBy,
     FILTER_DESCRIPTION,
-    get_all_events_strings_from_db_group_by,
-    send_events_messages
+    send_events_messages,
+    get_radar_args,
+    get_cached_radar_lines,
+    cache_radar_lines
 )
 
 logger = logging.getLogger(__name__)
@@ -100,12 +101,12 @@ async def on_radar_command(update: Update, context: ContextTypes.DEFAULT_TYPE, s
         user.can_use_radar = True
         await update.message.reply_html(f"{Emoji.INFO} ora puoi usare il comando /radar23 quando ti pare senza usare il link ;)")
 
-    radar_settings = settings.get_settings_as_dict(session, include_categories=BotSettingCategory.RADAR)
+    radar_settings = settings.get_cached_as_dict(session, include_categories=BotSettingCategory.RADAR)
     radar_enabled = radar_settings[BotSettingKey.RADAR_ENABLED].value()
     radar_password_protected = radar_settings[BotSettingKey.RADAR_PASSWORD_ENABLED].value()
 
-    is_users_chat_member = chat_members.is_member(session, update.effective_user.id, Chat.is_users_chat)
-    is_staff_chat_member = chat_members.is_member(session, update.effective_user.id, Chat.is_staff_chat)
+    is_users_chat_member = chat_members.is_member_cached(session, update.effective_user.id, Chat.is_users_chat)
+    is_staff_chat_member = chat_members.is_member_cached(session, update.effective_user.id, Chat.is_staff_chat)
 
     if not radar_enabled and not is_staff_chat_member:
         logger.info("forbidden: /radar command is disabled from settings and user is not staff")
@@ -229,58 +230,27 @@ async def on_change_filter_cb(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.callback_query.edit_message_reply_markup(reply_markup=reply_markup)
 
 
-def args_key_in_cache(context: CallbackContext, args_cache_key: str) -> bool:
-    if TempDataKey.EVENTS_CACHE not in context.bot_data:
-        return False
-
-    if args_cache_key not in context.bot_data[TempDataKey.EVENTS_CACHE]:
-        return False
-
-    now = utilities.now()
-    time_delta = now - context.bot_data[TempDataKey.EVENTS_CACHE][args_cache_key][TempDataKey.EVENTS_CACHE_SAVED_ON]
-    if time_delta.total_seconds() > Timeout.ONE_HOUR * 20:
-        logger.info(f"cache expired for key {args_cache_key}")
-        return False
-
-    logger.info(f"cache hit for key {args_cache_key}")
-    return True
-
-
-def get_all_events_strings_from_cache(context: CallbackContext, args_cache_key: str) -> Optional[List]:
-    """must be uased after checking whether the cache key is still cached, using args_key_in_cache()"""
-
-    return context.bot_data[TempDataKey.EVENTS_CACHE][args_cache_key][TempDataKey.EVENTS_CACHE_DATA]
-
-
-def get_last_message_id_sent_for_cache_key(context: CallbackContext, args_cache_key: str) -> Optional[int]:
+def get_last_message_id_sent_for_cache_key(context: CallbackContext, args_cache_key: str, version: int) -> Optional[int]:
     if TempDataKey.EVENTS_CACHE not in context.user_data:
         return
 
     if args_cache_key not in context.user_data[TempDataKey.EVENTS_CACHE]:
         return
 
-    # we do not need to check whether the cache is expired or not, because we enter the funciton only if
-    # the same cache key is still valid in bot_data
+    cached_value = context.user_data[TempDataKey.EVENTS_CACHE][args_cache_key]
+    if not isinstance(cached_value, tuple) or cached_value[1] != version:
+        # the list was sent before the cached one was built (or by an older version of the bot, which saved just the message_id)
+        return
 
     logger.debug(f"user cache hit for key {args_cache_key}")
-    return context.user_data[TempDataKey.EVENTS_CACHE][args_cache_key]
+    return cached_value[0]
 
 
-def cache_message_id_for_cache_key(context: CallbackContext, args_cache_key: str, message_id: int):
+def cache_message_id_for_cache_key(context: CallbackContext, args_cache_key: str, message_id: int, version: int):
     if TempDataKey.EVENTS_CACHE not in context.user_data:
         context.user_data[TempDataKey.EVENTS_CACHE] = {}
 
-    context.user_data[TempDataKey.EVENTS_CACHE][args_cache_key] = message_id
-
-
-def cache_all_events_strings_for_cache_key(context: CallbackContext, args_cache_key: str, all_events_strings: List[str]):
-    if TempDataKey.EVENTS_CACHE not in context.bot_data:
-        context.bot_data[TempDataKey.EVENTS_CACHE] = {}
-
-    context.bot_data[TempDataKey.EVENTS_CACHE][args_cache_key] = {
-        TempDataKey.EVENTS_CACHE_SAVED_ON: utilities.now(),
-        TempDataKey.EVENTS_CACHE_DATA: all_events_strings,
-    }
+    context.user_data[TempDataKey.EVENTS_CACHE][args_cache_key] = (message_id, version)
 
 
 @decorators.catch_exception()
@@ -290,39 +260,29 @@ async def on_events_confirm_cb(update: Update, context: ContextTypes.DEFAULT_TYP
     logger.info(log_text)
     logger_radar.info(log_text)
 
-    args = context.user_data.get(TempDataKey.EVENTS_FILTERS, DEFAULT_FILTERS)
-    # we create a copy of the list because modifiyng `args`'s content
-    # will also modify context.user_data[TempDataKey.EVENTS_FILTERS]
-    args = args[:]
+    radar_filters = context.user_data.get(TempDataKey.EVENTS_FILTERS, DEFAULT_FILTERS)
 
     # if the key exists (if it exists, it's always True), do *not* protect the content
     protect_content_override = context.user_data.pop(TempDataKey.RADAR_PROTECT_CONTENT_OVERRIDE, False)
     date_override: Optional[datetime.date] = context.user_data.pop(TempDataKey.RADAR_DATE_OVERRIDE, None)
     if date_override:
-        # we cache the result *for this specific date override*, queries that
-        # do not override the date should not be date-dependent
         logger.debug(f"date override detected: {date_override}")
-        args.append(date_override.strftime("%Y%m%d"))
-
-    if EventFilter.WEEK not in args:
-        # always group by week for radar23, but only if the temporal filter is not EventFilter.WEEK
-        args.append(GroupBy.WEEK_NUMBER)
 
-    args.sort()  # it's important to sort the args, see #82
+    # get_radar_args() returns a copy: modifiyng `radar_filters`'s content would also modify context.user_data[TempDataKey.EVENTS_FILTERS]
+    args = get_radar_args(radar_filters, date_override)
     args_cache_key = "+".join(args)
     logger.debug(f"cache key: {args_cache_key}")
 
-    if not args_key_in_cache(context, args_cache_key):
-        all_events_strings = get_all_events_strings_from_db_group_by(session, args, date_override=date_override)
-        logger.info(f"fetched {len(all_events_strings)} strings from db")
-
-        logger.info(f"caching query result for key {args_cache_key}...")
-        cache_all_events_strings_for_cache_key(context, args_cache_key, all_events_strings)
-    else:  # cache key still valid in bot_data
-        all_events_strings = get_all_events_strings_from_cache(context, args_cache_key)
+    today = date_override or datetime.date.today()
+    radar_lines = get_cached_radar_lines(args, today)
+    if not radar_lines:
+        radar_lines = cache_radar_lines(session, args, today)
+        logger.info(f"fetched {len(radar_lines.lines)} strings from db, cached with key {args_cache_key}")
+    else:
+        logger.info(f"cache hit for key {args_cache_key}")
 
-        # only try this if the cache key exists in bot_data
-        message_id: int = get_last_message_id_sent_for_cache_key(context, args_cache_key)
+        # only try this if the list was already cached
+        message_id: int = get_last_message_id_sent_for_cache_key(context, args_cache_key, radar_lines.version)
         logger.info(f"protect_content_override: {protect_content_override}")
         if message_id and not protect_content_override:
             # we do not reply to an old message if protect_content_override: this flag is set when a user uses /radar24,
@@ -338,6 +298,10 @@ async def on_events_confirm_cb(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return
 
+    # the cached lists must not be modified
+    all_events_strings = radar_lines.lines[:]
+    entities_counts = radar_lines.entities_counts[:]
+
     # logger.debug(f"result: {len(messages_to_send)} messages, {len(text_lines)} lines")
 
     # do not pop existing filters, we will remember them for the next time the user uses /radar
@@ -349,13 +313,13 @@ async def on_events_confirm_cb(update: Update, context: ContextTypes.DEFAULT_TYP
         if not protect_content_override:
             # add a line with the link to join the events chat if /radar23 was used
             deeplink = helpers.create_deep_linked_url(context.bot.username, payload=DeeplinkParam.EVENTS_CHAT_INVITE_LINK)
-            all_events_strings.append(
-                f"\n<i>non riesci ad aprire le feste linkate? usa <a href=\"{deeplink}\">questo link</a></i>"
-            )
+            invite_link_line = f"\n<i>non riesci ad aprire le feste linkate? usa <a href=\"{deeplink}\">questo link</a></i>"
+            all_events_strings.append(invite_link_line)
+            entities_counts.append(utilities.count_html_entities(invite_link_line))
 
         # protect_content = not utilities.is_superadmin(update.effective_user)
         protect_content = not protect_content_override
-        sent_messages = await send_events_messages(update.effective_message, all_events_strings, protect_content)
+        sent_messages = await send_events_messages(update.effective_message, all_events_strings, protect_content, entities_counts=entities_counts)
     else:
         logger.info(f"no event was returned for the selected filters")
         sent_message = await update.effective_message.reply_text(
@@ -368,7 +332,7 @@ async def on_events_confirm_cb(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # just save the message_id of the first message sent
     logger.debug(f"caching user's message_id for key {args_cache_key}...")
-    cache_message_id_for_cache_key(context, args_cache_key, sent_messages[0].message_id)
+    cache_message_id_for_cache_key(context, args_cache_key, sent_messages[0].message_id, radar_lines.version)
 
 
 @decorators.catch_exception()
@@ -0,0 +1,177 @@
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Iterator
+
+from sqlalchemy import select, update, delete, insert, or_, tuple_
+from sqlalchemy.orm import Session
+
+from database.base import get_session
+from database.models import Event, EventHashtag
+from plugins.events.common import parse_message_text, parse_message_entities_dict, PARSER_VERSION
+
+logger = logging.getLogger(__name__)
+
+# the columns parse_message_text()/parse_message_entities_dict() might change. Some of them are kept as they are
+# when the parser doesn't find anything, so the current values are passed to the parser too
+PARSED_COLUMNS = (
+    "event_title",
+    "detailed_location",
+    "start_day",
+    "start_month",
+    "start_year",
+    "start_date",
+    "start_week",
+    "end_day",
+    "end_month",
+    "end_year",
+    "end_date",
+    "dates_from_hashtags",
+    "hashtags",
+    "event_type",
+    "localata",
+    "canceled",
+    "soon",
+    "region",
+    "subregion",
+)
+
+# what we report in the diff summary
+DIFF_GROUPS = dict(
+    dates=("start_day", "start_month", "start_year", "end_day", "end_month", "end_year"),
+    regions=("region", "subregion"),
+    types=("event_type",),
+)
+
+
+def reparse_row(row: dict) -> dict:
+    """re-parse an event from its saved text/json. Runs in the worker processes too, so it must not touch the db"""
+    event = Event(row["chat_id"], row["message_id"])
+    for column in PARSED_COLUMNS:
+        setattr(event, column, row[column])
+
+    if row["message_text"]:
+        parse_message_text(row["message_text"], event)
+    if row["message_json"]:
+        parse_message_entities_dict(json.loads(row["message_json"]), event)
+
+    result = {column: getattr(event, column) for column in PARSED_COLUMNS}
+    result.update(chat_id=row["chat_id"], message_id=row["message_id"], parser_version=PARSER_VERSION)
+
+    return result
+
+
+class ReparseProgress:
+    MAX_EXAMPLES = 5
+
+    def __init__(self, total: int):
+        self.total = total
+        self.parsed = 0
+        self.changed = 0
+        self.changed_by_group = {group: 0 for group in DIFF_GROUPS}
+        self.examples: Dict[str, List[str]] = {group: [] for group in DIFF_GROUPS}
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add(self, old_row: dict, new_row: dict):
+        self.parsed += 1
+
+        row_changed = False
+        for group, columns in DIFF_GROUPS.items():
+            if all(old_row[column] == new_row[column] for column in columns):
+                continue
+
+            row_changed = True
+            self.changed_by_group[group] += 1
+            if len(self.examples[group]) < self.MAX_EXAMPLES:
+                old_values = "/".join(str(old_row[column]) for column in columns)
+                new_values = "/".join(str(new_row[column]) for column in columns)
+                self.examples[group].append(f"{old_row['chat_id']}/{old_row['message_id']}: {old_values} -> {new_values}")
+
+        if row_changed:
+            self.changed += 1
+
+    def summary(self) -> str:
+        lines = [f"parsed {self.parsed}/{self.total} events in {self.elapsed:.1f} seconds (parser version: {PARSER_VERSION})"]
+        for group, count in self.changed_by_group.items():
+            lines.append(f"changed {group}: {count}")
+            lines.extend([f"  {example}" for example in self.examples[group]])
+
+        return "\n".join(lines)
+
+
+class EventsReparser:
+    """Re-parses the saved events in batches. Events are streamed with a read-only session and updated with another
+    one, committing every batch, so the db is never locked for long while the bot is running"""
+
+    def __init__(self, batch_size: int = 1000, processes: int = 0, force: bool = False):
+        self.batch_size = batch_size
+        self.processes = processes  # 0: parse in the current process
+        self.force = force  # re-parse all events, not just the outdated ones
+
+    def filters(self) -> list:
+        if self.force:
+            return []
+
+        return [or_(Event.parser_version.is_(None), Event.parser_version < PARSER_VERSION)]
+
+    def count(self, session: Session) -> int:
+        return session.query(Event).filter(*self.filters()).count()
+
+    @staticmethod
+    def save_event_hashtags(session: Session, new_rows: List[dict]):
+        """the bulk update doesn't go through Event.save_hashtags(), so the event_hashtags rows of the batch
+        are replaced here"""
+        keys = [(row["chat_id"], row["message_id"]) for row in new_rows]
+        session.execute(delete(EventHashtag).where(tuple_(EventHashtag.chat_id, EventHashtag.message_id).in_(keys)))
+
+        event_hashtags = []
+        for row in new_rows:
+            hashtags_list = json.loads(row["hashtags"]) if row["hashtags"] else []
+            event_hashtags.extend([
+                dict(chat_id=row["chat_id"], message_id=row["message_id"], hashtag=hashtag)
+                for hashtag in dict.fromkeys(hashtags_list)
+            ])
+
+        if event_hashtags:
+            session.execute(insert(EventHashtag), event_hashtags)
+
+    def run(self) -> Iterator[ReparseProgress]:
+        """yields the progress after every committed batch"""
+        read_session: Session = get_session()
+        write_session: Session = get_session()
+        executor = ProcessPoolExecutor(self.processes) if self.processes > 0 else None
+
+        try:
+            progress = ReparseProgress(self.count(read_session))
+            logger.info(f"events to re-parse: {progress.total} (force: {self.force}, processes: {self.processes})")
+
+            columns = [Event.chat_id, Event.message_id, Event.message_text, Event.message_json] + [getattr(Event, column) for column in PARSED_COLUMNS]
+            statement = select(*columns).filter(*self.filters()).order_by(Event.chat_id, Event.message_id)
+            result = read_session.execute(statement.execution_options(yield_per=self.batch_size))
+
+            for partition in result.partitions():
+                old_rows = [row._asdict() for row in partition]
+                if executor:
+                    new_rows = list(executor.map(reparse_row, old_rows, chunksize=max(1, len(old_rows) // (self.processes * 4))))
+                else:
+                    new_rows = [reparse_row(row) for row in old_rows]
+
+                write_session.execute(update(Event), new_rows)
+                self.save_event_hashtags(write_session, new_rows)
+                write_session.commit()
+
+                for old_row, new_row in zip(old_rows, new_rows):
+                    progress.add(old_row, new_row)
+
+                logger.info(f"re-parsed {progress.parsed}/{progress.total} events ({progress.changed} changed)")
+                yield progress
+        finally:
+            if executor:
+                executor.shutdown()
+            read_session.close()
+            write_session.close()
@@ -21,7 +21,7 @@ logger = logging.getLogger(__name__)
 async def on_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"/help {utilities.log(update)}")
 
-    if not chat_members.is_member(session, update.effective_user.id, Chat.is_staff_chat, is_admin=True):
+    if not chat_members.is_member_cached(session, update.effective_user.id, Chat.is_staff_chat, is_admin=True):
         logger.debug("user is not admin")
         return await on_start_command(update, context)
 
@@ -1,35 +1,74 @@
 import logging
+from typing import List, Tuple, Optional
 
 from sqlalchemy.orm import Session
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Message
 from telegram.ext import ContextTypes, MessageHandler, CallbackQueryHandler
 from telegram.ext import filters
 
 import decorators
 import utilities
+from config import config
 from constants import Group, TempDataKey
-from database.models import StaffChatMessage
-from database.queries import staff_chat_messages
+from database.models import StaffChatMessage, Event
+from database.queries import staff_chat_messages, media_downloads
 from emojis import Emoji
 from ext.filters import ChatFilter, Filter
+from image_hashes import ImageHashIndexes, get_photo_hashes
 
 logger = logging.getLogger(__name__)
 
+# estimated Jaccard similarity of the texts' shingles
+TEXT_MIN_SIMILARITY = config.settings.get("duplicates_text_min_similarity", 0.8)
+
 DUPLICATE_MESSAGE_REPLY_MARKUP = InlineKeyboardMarkup([[
     InlineKeyboardButton(f"{Emoji.SIGN} elimina questo messaggio", callback_data=f"deldup")
 ]])
 
 
+def merge_duplicates(*duplicates_lists: List[StaffChatMessage]) -> List[StaffChatMessage]:
+    duplicates_by_message_id = {d.message_id: d for duplicates in duplicates_lists for d in duplicates}
+    return sorted(duplicates_by_message_id.values(), key=lambda d: d.message_id, reverse=True)
+
+
+async def save_photo_hashes(message: Message, staff_chat_message: StaffChatMessage) -> Optional[Tuple[str, str]]:
+    try:
+        phash, dhash = await get_photo_hashes(message)
+    except Exception as e:
+        logger.error(f"error while computing the photo's hashes: {e}", exc_info=True)
+        return
+
+    staff_chat_message.save_image_hashes(phash, dhash)
+    return phash, dhash
+
+
+def find_similar_photos(session: Session, message: Message, phash: str, dhash: str) -> Tuple[List[StaffChatMessage], List[Event]]:
+    """staff chat messages and events with a photo that looks like this message's photo, even if it's not the same
+    file (eg. a re-compressed or cropped repost of the same flyer)"""
+    staff_chat_keys = [
+        key for key, _ in ImageHashIndexes.staff_chat.find(phash, dhash)
+        if key[0] == message.chat.id and key[1] != message.message_id
+    ]
+    events_keys = [key for key, _ in ImageHashIndexes.events.find(phash, dhash)]
+
+    return staff_chat_messages.get_by_keys(session, staff_chat_keys), media_downloads.get_events(session, events_keys)
+
+
 @decorators.catch_exception()
 @decorators.pass_session(pass_down_db_instances=True)
 async def on_staff_chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"saving/updating staff chat message {update.effective_message.message_id} {utilities.log(update)}")
     message = update.effective_message
 
-    staff_chat_message: StaffChatMessage = staff_chat_messages.get_or_create(session, message, commit=True)
+    staff_chat_message: StaffChatMessage = staff_chat_messages.get_or_create(session, message)
+    # read before committing: the commit expires the instance, and reading it again would need a query
+    text_minhash = staff_chat_message.get_text_minhash()
+    session.commit()
+
     if message.edit_date:
         logger.debug("edited message: updating message metadata and returning")
         staff_chat_message.update_message_metadata(message)
+        staff_chat_messages.index_message(message, staff_chat_message.get_text_minhash())
 
         # We return just because there's a bug in teh API that will send to the bot and edited_message update when
         # someone reacts to an old message, without it being actually edited
@@ -47,15 +86,36 @@ async def on_staff_chat_message(update: Update, context: ContextTypes.DEFAULT_TY
 
     # will also check the text length (and return an empty list if too short and no media)
     duplicates = staff_chat_messages.find_duplicates(session, message)
+    similar_texts = staff_chat_messages.find_similar_texts(session, message, text_minhash, TEXT_MIN_SIMILARITY)
+    # after the lookups, so the message doesn't match itself
+    staff_chat_messages.index_message(message, text_minhash)
+    duplicates = merge_duplicates(duplicates, similar_texts)
+
+    published_events = []
+    image_hashes = await save_photo_hashes(message, staff_chat_message) if message.photo else None
+    if image_hashes:
+        similar_messages, published_events = find_similar_photos(session, message, *image_hashes)
+        ImageHashIndexes.staff_chat.add((message.chat.id, message.message_id), *image_hashes)
 
-    if not duplicates:
+        duplicates = merge_duplicates(duplicates, similar_messages)
+
+    if not duplicates and not published_events:
         return
 
-    staff_chat_message.duplicate = True
+    lines = []
+    if duplicates:
+        staff_chat_message.duplicate = True
+
+        logger.info(f"found {len(duplicates)} duplicates")
+        duplicates_links = [d.message_link_html(f"{utilities.elapsed_str(d.message_date, 'poco')} fa") for d in duplicates]
+        lines.append(f"Sembra che questo messaggio sia già stato inviato {'; '.join(duplicates_links)}")
+
+    if published_events:
+        logger.info(f"found {len(published_events)} events with a similar flyer")
+        events_links = [event.title_link_html() for event in published_events]
+        lines.append(f"Sembra che questo flyer sia già stato pubblicato nel canale: {'; '.join(events_links)}")
 
-    logger.info(f"found {len(duplicates)} duplicates")
-    duplicates_links = [d.message_link_html(f"{utilities.elapsed_str(d.message_date, 'poco')} fa") for d in duplicates]
-    text = f"Sembra che questo messaggio sia già stato inviato {'; '.join(duplicates_links)}"
+    text = "\n".join(lines)
     await update.effective_message.reply_text(text, reply_markup=DUPLICATE_MESSAGE_REPLY_MARKUP, do_quote=True)
 
 
@@ -7,6 +7,7 @@ from telegram.ext import ContextTypes
 import decorators
 import utilities
 from database.queries import staff_chat_messages
+from image_hashes import load_staff_chat_image_hashes
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +18,14 @@ async def delete_old_messages_job(context: ContextTypes.DEFAULT_TYPE, session: S
     logger.info("")
     logger.info("delete old messages job: start")
 
-    days = 30 * 3
+    days = staff_chat_messages.MESSAGES_RETENTION_DAYS
     now = utilities.now()
     older_than = now - datetime.timedelta(days=days)
     logger.info(f"now: {now}, days: {days}, older than: {older_than}")
 
     deleted_count = staff_chat_messages.delete_old_messages(session, older_than)
     logger.info(f"deleted {deleted_count} records")
+
+    # the hashes of the deleted messages must not be matched anymore
+    load_staff_chat_image_hashes(session)
+    staff_chat_messages.load_recent_messages_index(session)
@@ -20,7 +20,7 @@ logger = logging.getLogger(__name__)
 @decorators.pass_session()
 async def on_edited_message_staff(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"message edit in a group {utilities.log(update)}")
-    if not settings.get_or_create(session, BotSettingKey.BROADCAST_EDITS).value():
+    if not settings.get_value(session, BotSettingKey.BROADCAST_EDITS):
         logger.info("message edits are disabled")
         return
 
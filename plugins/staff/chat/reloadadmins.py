@@ -9,7 +9,7 @@ import decorators
 import utilities
 from constants import Group
 from database.models import Chat
-from database.queries import chats
+from database.queries import chat_members
 from ext.filters import ChatFilter
 
 logger = logging.getLogger(__name__)
@@ -22,7 +22,7 @@ async def on_reloadadmins_command(update: Update, _, session: Session, chat: Cha
 
     logger.info("saving administrators...")
     administrators: Tuple[ChatMember] = await update.effective_chat.get_administrators()
-    chats.update_administrators(session, chat, administrators)
+    chat_members.save_administrators(session, chat.chat_id, administrators)
 
     admins_names = [cm.user.first_name for cm in administrators]
     await update.effective_message.reply_text(f"Saved {len(administrators)} administrators ({', '.join(admins_names)})")
@@ -24,7 +24,7 @@ def get_localized_texts_list_reply_markup(session: Session) -> InlineKeyboardMar
         show = True
         setting_key = ltext_descriptions["show_if_true_bot_setting_key"]
         if setting_key:
-            show = settings.get_or_create(session, setting_key).value_bool
+            show = settings.get_value(session, setting_key)
 
         if not show:
             continue
@@ -173,6 +173,8 @@ async def on_localized_text_delete_button(update: Update, context: ContextTypes.
     )
     if ltext:
         session.delete(ltext)
+        session.commit()
+        texts.drop_cache()
 
     reply_markup = get_ltext_action_languages_reply_markup(action, ltext_key)
     text = f"{ACTION_DESCRIPTORS[action]['emoji']} {ltext_description}: select the language 👇"
@@ -236,6 +238,8 @@ async def on_localized_text_receive(update: Update, context: ContextTypes.DEFAUL
     )
     ltext.value = update.effective_message.text_html
     ltext.save_updated_by(update.effective_user)
+    session.commit()
+    texts.drop_cache()
 
     await update.effective_message.reply_text(f"{ltext_description} set for {lang_emoji}:\n\n{ltext.value}")
 
@@ -173,6 +173,9 @@ async def on_bot_setting_switch_bool_button(update: Update, context: ContextType
 
     setting: BotSetting = settings.get_or_create(session, setting_key)
     setting.update_value(new_value)
+    session.commit()
+    settings.drop_cache()
+
     reply_markup = get_setting_actions_reply_markup(setting)
     text = get_setting_text(setting)
     await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
@@ -186,6 +189,8 @@ async def on_bot_setting_nullify_button(update: Update, context: ContextTypes.DE
 
     setting: BotSetting = settings.get_or_create(session, setting_key)
     setting.update_null()
+    session.commit()
+    settings.drop_cache()
 
     await update.callback_query.answer(f"{Emoji.WARNING} Be careful when you \"nullify\" a setting! "
                                        f"It might break some of the bot's functionalities", show_alert=True)
@@ -272,6 +277,8 @@ async def on_new_setting_value_receive(update: Update, context: ContextTypes.DEF
         setting.update_value_telegram_media(file_id, file_unique_id, utilities.detect_media_type(update.message))
 
     setting.updated_by = update.effective_user.id
+    session.commit()
+    settings.drop_cache()
 
     await update.effective_message.reply_text(f"{setting_emoji} <b>{setting_label}</b> updated:\n\n{setting.value_pretty()}")
 
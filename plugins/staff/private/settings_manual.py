@@ -63,6 +63,8 @@ async def on_set_command(update: Update, context: ContextTypes.DEFAULT_TYPE, ses
     setting = settings.get_or_create(session, key, value=value)
     setting.update_value(value)
     session.add(setting)
+    session.commit()
+    settings.drop_cache()
 
     text = f"New value for <code>{key}</code>: {setting.value_pretty()}"
     await update.message.reply_text(text)
@@ -98,6 +100,8 @@ async def on_enable_disable_command(update: Update, context: ContextTypes.DEFAUL
 
     setting.update_value(value)
     session.add(setting)
+    session.commit()
+    settings.drop_cache()
 
     text = f"<code>{key}</code> {command}d"
     await update.message.reply_text(text)
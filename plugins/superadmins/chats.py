@@ -1,5 +1,4 @@
 import logging
-from typing import Iterable
 
 from sqlalchemy.orm import Session
 from telegram import Update, KeyboardButtonRequestChat, ReplyKeyboardMarkup, \
@@ -13,7 +12,7 @@ from constants import Group
 from database.models import User, Chat, ChatDestination
 from database.queries import chats, chat_members
 from emojis import Emoji
-from ext.filters import Filter, ChatFilter
+from ext.filters import Filter
 
 logger = logging.getLogger(__name__)
 
@@ -80,7 +79,7 @@ SET_CHAT_MARKUP = ReplyKeyboardMarkup([
 async def on_chats_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"/chats {utilities.log(update)}")
 
-    chats_list: Iterable[Chat] = chats.get_core_chats(session)
+    chats_list = chats.get_core_chats(session)
     lines = []
     for chat in chats_list:
         chat_text = f"• <b>{chat.type_pretty_it()}</b>: {utilities.escape_html(chat.title)} [<code>{chat.chat_id}</code>]"
@@ -107,20 +106,17 @@ async def on_setchat_group_command(update: Update, context: ContextTypes.DEFAULT
         chats.reset_staff_chat(session)
         session.commit()
         chat.set_as_staff_chat()
-
-        ChatFilter.STAFF.chat_ids = {chat.chat_id}
     elif destination_type == ChatDestination.USERS:
         chats.reset_users_chat(session)
         session.commit()
         chat.set_as_users_chat()
-
-        ChatFilter.USERS.chat_ids = {chat.chat_id}
     elif destination_type == ChatDestination.EVALUATION:
         chats.reset_evaluation_chat(session)
         session.commit()
         chat.set_as_evaluation_chat()
 
-        ChatFilter.EVALUATION.chat_ids = {chat.chat_id}
+    session.commit()
+    chats.refresh_cache(session)
 
     await update.effective_message.reply_text(f"{utilities.escape_html(chat.title)} impostata come chat {destination_type}")
 
@@ -155,8 +151,8 @@ async def on_setchat_private_command(update: Update, context: ContextTypes.DEFAU
         session.commit()
         chat.set_as_events_chat()
 
-        ChatFilter.EVENTS.chat_ids = {chat.chat_id}
-        ChatFilter.EVENTS_GROUP_POST.chat_ids = {chat.chat_id}
+    session.commit()
+    chats.refresh_cache(session)
 
     await update.effective_message.reply_text(f"{utilities.escape_html(chat.title)} impostata come chat {chat.type_pretty()}")
 
@@ -194,26 +190,18 @@ async def on_chat_shared_update(update: Update, context: ContextTypes.DEFAULT_TY
         chats.reset_staff_chat(session)
         session.commit()
         bot_chat_member.chat.set_as_staff_chat()
-
-        ChatFilter.STAFF.chat_ids = {bot_chat_member.chat_id}
     elif destination_type == ChatDestination.USERS:
         chats.reset_users_chat(session)
         session.commit()
         bot_chat_member.chat.set_as_users_chat()
-
-        ChatFilter.USERS.chat_ids = {bot_chat_member.chat_id}
     elif destination_type == ChatDestination.EVALUATION:
         chats.reset_evaluation_chat(session)
         session.commit()
         bot_chat_member.chat.set_as_evaluation_chat()
-
-        ChatFilter.EVALUATION.chat_ids = {bot_chat_member.chat_id}
     elif destination_type == ChatDestination.EVENTS:
         chats.reset_events_chat(session)
         session.commit()
         bot_chat_member.chat.set_as_events_chat()
-
-        ChatFilter.EVENTS.chat_ids = {bot_chat_member.chat_id}
     elif destination_type == ChatDestination.LOG:
         chats.reset_log_chat(session)
         session.commit()
@@ -231,9 +219,8 @@ async def on_chat_shared_update(update: Update, context: ContextTypes.DEFAULT_TY
         bot_chat_member.chat.unset_as_network_chat()
         session.commit()
 
-    logger.info("re-setting NETWORK chats filter...")
-    network_chats: Iterable[Chat] = chats.get_core_chats(session)
-    ChatFilter.NETWORK.chat_ids = {c.chat_id for c in network_chats}
+    session.commit()
+    chats.refresh_cache(session)  # also updates the chat filters
 
     await update.effective_message.reply_text(
         f"{utilities.escape_html(bot_chat_member.chat.title)} impostata come {bot_chat_member.chat.type_pretty()}",
@@ -6,7 +6,12 @@ from telegram.ext import ContextTypes, CommandHandler
 import decorators
 import utilities
 from constants import Group
+from database.base import get_db_stats
+from database.queries import settings, texts, chats, chat_members, staff_chat_messages
 from ext.filters import Filter
+from plugins.events.common import get_event_lines_cache_stats, get_radar_cache_stats
+from plugins.events.media_backup import get_media_backup_stats
+from image_hashes import get_image_hash_indexes_stats
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +28,43 @@ async def on_senddb_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_document(fh)
 
 
+@decorators.catch_exception()
+async def on_dbstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logger.info(f"/dbstats {utilities.log(update)}")
+
+    lines = [f"<code>{key}</code>: {value}" for key, value in get_db_stats().items()]
+
+    lines.append("\n<b>settings cache</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in settings.get_cache_stats().items()])
+
+    lines.append("\n<b>localized texts cache</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in texts.get_cache_stats().items()])
+
+    lines.append("\n<b>special chats cache</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in chats.get_cache_stats().items()])
+
+    lines.append("\n<b>membership cache</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in chat_members.get_membership_cache_stats().items()])
+
+    lines.append("\n<b>event lines cache</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in get_event_lines_cache_stats().items()])
+
+    lines.append("\n<b>radar cache</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in get_radar_cache_stats().items()])
+
+    lines.append("\n<b>media backup queue</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in get_media_backup_stats().items()])
+
+    lines.append("\n<b>image hashes</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in get_image_hash_indexes_stats().items()])
+
+    lines.append("\n<b>duplicates index</b>")
+    lines.extend([f"<code>{key}</code>: {value}" for key, value in staff_chat_messages.get_recent_messages_index_stats().items()])
+
+    await update.message.reply_html("\n".join(lines))
+
+
 HANDLERS = (
     (CommandHandler(["senddb", "db"], on_senddb_command, filters=Filter.SUPERADMIN_AND_PRIVATE), Group.NORMAL),
+    (CommandHandler(["dbstats"], on_dbstats_command, filters=Filter.SUPERADMIN_AND_PRIVATE), Group.NORMAL),
 )
@@ -149,7 +149,7 @@ async def on_events_chat_invite_deeplink(update: Update, context: ContextTypes.D
         logger.info("forbidden: user is not member of the users chat")
         return
 
-    events_chat: Optional[Chat] = chats.get_chat(session, Chat.is_events_chat)
+    events_chat: Optional[chats.CachedChat] = chats.get_cached_chat(session, Chat.is_events_chat)
     if not events_chat:
         logger.warning("no events chat is set")
         return
@@ -189,7 +189,7 @@ async def on_users_chat_invite_deeplink(update: Update, context: ContextTypes.DE
 
     user.set_started()
 
-    users_chat: Optional[Chat] = chats.get_chat(session, Chat.is_users_chat)
+    users_chat: Optional[chats.CachedChat] = chats.get_cached_chat(session, Chat.is_users_chat)
     if not users_chat:
         logger.warning("no users chat is set")
         return
@@ -241,7 +241,7 @@ async def on_qrcode_deeplink(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
     user.set_started()
 
-    users_chat: Optional[Chat] = chats.get_chat(session, Chat.is_users_chat)
+    users_chat: Optional[chats.CachedChat] = chats.get_cached_chat(session, Chat.is_users_chat)
     if not users_chat:
         logger.warning("no users chat is set")
         return
@@ -272,7 +272,7 @@ async def on_qrcode_deeplink(update: Update, context: ContextTypes.DEFAULT_TYPE,
         )
 
         logger.info("sending log message...")
-        log_chat = chats.get_chat(session, Chat.is_log_chat)
+        log_chat = chats.get_cached_chat(session, Chat.is_log_chat)
         user_full_name = utilities.escape(update.effective_user.full_name)
         await context.bot.send_message(
             log_chat.chat_id,
@@ -27,12 +27,12 @@ async def on_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, se
         # TODO: continue update propagation
         return
 
-    if chat_members.is_member(session, update.effective_user.id, Chat.is_staff_chat):
+    if chat_members.is_member_cached(session, update.effective_user.id, Chat.is_staff_chat):
         logger.info("ignoring user message: staff chat member")
         # TODO: continue update propagation
         return
 
-    target_chat: Chat = chats.get_chat(session, Chat.is_staff_chat)  # we check whether none or not later
+    target_chat: chats.CachedChat = chats.get_cached_chat(session, Chat.is_staff_chat)  # we check whether none or not later
 
     if user.conversate_with_staff_override:
         # in this case, the user should be able to talk to the staff even if a request is pending/rejected
@@ -41,9 +41,9 @@ async def on_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, se
         logger.info("user can talk to the staff regardless of the approval mode status/whether they are part of the users chat or not")
         if user.pending_request_id or user.last_request.rejected():
             logger.info("user has a pending/rejected request: target chat is evaluation chat")
-            target_chat: Chat = chats.get_chat(session, Chat.is_evaluation_chat)
+            target_chat: chats.CachedChat = chats.get_cached_chat(session, Chat.is_evaluation_chat)
     else:
-        approval_mode = settings.get_or_create(session, BotSettingKey.APPROVAL_MODE).value()
+        approval_mode = settings.get_value(session, BotSettingKey.APPROVAL_MODE)
         if approval_mode:
             # if approval mode is on and conversate_with_staff_override is false, find all possible
             # cases where we should ignore the message
@@ -60,12 +60,13 @@ async def on_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, se
                 chat_member = chat_members.get_chat_member(session, update.effective_user.id, Chat.is_users_chat)
                 if not chat_member:
                     # we don't have the ChatMember record saved for this user in the users chat
-                    users_chat = chats.get_chat(session, Chat.is_users_chat)
+                    users_chat = chats.get_cached_chat(session, Chat.is_users_chat)
                     logger.debug(f"no ChatMember record for user {update.effective_user.id} in chat {users_chat.chat_id}, fetching ChatMember...")
                     tg_chat_member = await context.bot.get_chat_member(users_chat.chat_id, update.effective_user.id)
                     chat_member = DbChatMember.from_chat_member(users_chat.chat_id, tg_chat_member)
                     session.add(chat_member)
                     session.commit()
+                    chat_members.update_cached_membership(users_chat.chat_id, chat_member.user_id, chat_member.status)
 
                 if not user_allowed and chat_member.is_member():
                     logger.info("allowed: user is a meber of the users chat, or was a member or left")
@@ -80,11 +81,11 @@ async def on_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, se
 
                 if user.last_request and user.last_request.rejected():
                     logger.info(f"user's last request was rejected: we will answer if the ltext is set")
-                    ltext = texts.get_localized_text_with_fallback(
+                    ltext = texts.get_cached_with_fallback(
                         session,
                         LocalizedTextKey.APPLICATION_REJECTED_ANSWER,
                         Language.IT,
-                        fallback_language=settings.get_or_create(session, BotSettingKey.FALLBACK_LANGAUGE).value(),
+                        fallback_language=settings.get_value(session, BotSettingKey.FALLBACK_LANGAUGE),
                         raise_if_no_fallback=False
                     )
                     if ltext:
@@ -111,15 +112,15 @@ async def on_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     user_message.save_message_json(forwarded_message)
     session.add(user_message)
 
-    if settings.get_or_create(session, BotSettingKey.SENT_TO_STAFF).value():
+    if settings.get_value(session, BotSettingKey.SENT_TO_STAFF):
         user_language = utilities.get_language_code(user.selected_language, update.effective_user.language_code)
         logger.info(f"sending 'sent to staff' message (user language: {user_language})...")
         try:
-            sent_to_staff = texts.get_localized_text_with_fallback(
+            sent_to_staff = texts.get_cached_with_fallback(
                 session,
                 LocalizedTextKey.SENT_TO_STAFF,
                 user_language,
-                fallback_language=settings.get_or_create(session, BotSettingKey.FALLBACK_LANGAUGE).value(),
+                fallback_language=settings.get_value(session, BotSettingKey.FALLBACK_LANGAUGE),
                 raise_if_no_fallback=True
             )
             text = sent_to_staff.value
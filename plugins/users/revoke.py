@@ -19,7 +19,7 @@ logger = logging.getLogger(__name__)
 async def on_revoke_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE, session: Session):
     logger.info(f"/revoke (user) {utilities.log(update)}")
 
-    if not settings.get_or_create(session, BotSettingKey.ALLOW_USER_REVOKE).value():
+    if not settings.get_value(session, BotSettingKey.ALLOW_USER_REVOKE):
         logger.info("user revoke is not allowed")
         return
 
@@ -66,11 +66,11 @@ async def on_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, s
 
     language_code = utilities.get_language_code(user.selected_language, update.effective_user.language_code)
 
-    welcome_text = texts.get_localized_text_with_fallback(
+    welcome_text = texts.get_cached_with_fallback(
         session,
         LocalizedTextKey.WELCOME,
         language_code,
-        fallback_language=settings.get_or_create(session, BotSettingKey.FALLBACK_LANGAUGE).value()
+        fallback_language=settings.get_value(session, BotSettingKey.FALLBACK_LANGAUGE)
     )
     welcome_texts = texts.get_texts(session, LocalizedTextKey.WELCOME).all()
     reply_markup = get_start_reply_markup(welcome_text.language, welcome_texts)
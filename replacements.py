@@ -1,3 +1,4 @@
+import re
 from typing import Optional
 
 from sqlalchemy.orm import Session
@@ -20,17 +21,26 @@ PLACEHOLDER_REPLACEMENTS_TELEGRAM_USER = {
 
 
 PLACEHOLDER_REPLACEMENTS_DATABASE = {
-    "{CHATLINK}": lambda s: settings.get_or_create(s, BotSettingKey.CHAT_INVITE_LINK).value() or "",
+    "{CHATLINK}": lambda s: settings.get_value(s, BotSettingKey.CHAT_INVITE_LINK) or "",
 }
 
 
-def replace_placeholders(text: str, user: Optional[TelegramUser] = None, session: Optional[Session] = None):
-    if user:
-        for placeholder, repl_func in PLACEHOLDER_REPLACEMENTS_TELEGRAM_USER.items():
-            text = text.replace(placeholder, repl_func(user))
+# all placeholders in a single pattern, so the text is scanned once
+PLACEHOLDERS_PATTERN = re.compile("|".join(
+    re.escape(placeholder) for placeholder in [*PLACEHOLDER_REPLACEMENTS_TELEGRAM_USER, *PLACEHOLDER_REPLACEMENTS_DATABASE]
+))
 
-    if session is not None:
-        for placeholder, repl_func in PLACEHOLDER_REPLACEMENTS_DATABASE.items():
-            text = text.replace(placeholder, repl_func(session))
 
-    return text
+def replace_placeholders(text: str, user: Optional[TelegramUser] = None, session: Optional[Session] = None):
+    def get_replacement(match: re.Match) -> str:
+        placeholder = match.group(0)
+        if user and placeholder in PLACEHOLDER_REPLACEMENTS_TELEGRAM_USER:
+            return PLACEHOLDER_REPLACEMENTS_TELEGRAM_USER[placeholder](user)
+        if session is not None and placeholder in PLACEHOLDER_REPLACEMENTS_DATABASE:
+            return PLACEHOLDER_REPLACEMENTS_DATABASE[placeholder](session)
+
+        # we can't replace it: leave it as it is
+        return placeholder
+
+    # replacement values are computed only for the placeholders that are actually used in the text
+    return PLACEHOLDERS_PATTERN.sub(get_replacement, text)
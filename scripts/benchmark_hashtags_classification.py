@@ -0,0 +1,139 @@
+"""Compare the hashtags classification done by parse_message_entities_list() (type, localata, canceled, soon, region,
+subregion, month) with the linear scans it used before the hashtag -> classification maps, over the hashtags
+saved in the events archive: the results must be identical, and the new one should be faster.
+
+Run it from the repository root: python -m scripts.benchmark_hashtags_classification [--db bot.db] [--runs 5]
+If the database has no saved hashtags, random posts are generated.
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import time
+import warnings
+from typing import List
+
+from sqlalchemy.exc import SAWarning
+
+from constants import REGIONS_DATA, SUBREGIONS_DATA
+from database.models import EVENT_TYPE, EventTypeHashtag, EventType
+from plugins.events.common import (
+    MONTHS,
+    EVENT_TYPE_BY_HASHTAG,
+    REGION_BY_HASHTAG,
+    SUBREGION_BY_HASHTAG,
+    MONTH_BY_HASHTAG,
+    CANCELED_HASHTAGS,
+    SOON_HASHTAGS,
+    classify_hashtags
+)
+
+warnings.filterwarnings("ignore", category=SAWarning)
+
+
+def find_region_in_list_reference(regions_data, hashtags_list):
+    for region_name, region_data in regions_data.items():
+        for region_hashtag in region_data["hashtags"]:
+            if region_hashtag.lower() in hashtags_list:
+                return region_name
+
+    return None
+
+
+def classify_reference(hashtags_list: List[str]) -> tuple:
+    # the linear scans parse_message_entities_list() used to do, kept as reference
+    event_type = None
+    for hashtag, hashtag_event_type in EVENT_TYPE.items():
+        if hashtag in hashtags_list:
+            event_type = hashtag_event_type
+            break
+
+    localata = EventTypeHashtag.LOCALATA in hashtags_list
+    if localata and not event_type:
+        event_type = EventType.LEGAL
+
+    canceled = any(h in hashtags_list for h in ("#annullata", "#annullato", "#canceled", "#cancelled", "#rimandata", "#rimandato", "#posticipato", "#posticipata", "#fake"))
+    soon = "#soon" in hashtags_list or "#comingsoon" in hashtags_list or "#moreinfosoon" in hashtags_list
+
+    month = None
+    for i, month_hashtag in enumerate(MONTHS):
+        if month_hashtag in hashtags_list:
+            month = i + 1
+
+    region = find_region_in_list_reference(REGIONS_DATA, hashtags_list)
+    subregion = find_region_in_list_reference(SUBREGIONS_DATA, hashtags_list)
+
+    return event_type, localata, canceled, soon, region, subregion, month
+
+
+def classify_current(hashtags_list: List[str]) -> tuple:
+    # same steps as parse_message_entities_list(), without an Event
+    event_type = classify_hashtags(EVENT_TYPE_BY_HASHTAG, hashtags_list)
+
+    localata = EventTypeHashtag.LOCALATA in hashtags_list
+    if localata and not event_type:
+        event_type = EventType.LEGAL
+
+    canceled = not CANCELED_HASHTAGS.isdisjoint(hashtags_list)
+    soon = not SOON_HASHTAGS.isdisjoint(hashtags_list)
+    month = classify_hashtags(MONTH_BY_HASHTAG, hashtags_list, last_wins=True)
+    region = classify_hashtags(REGION_BY_HASHTAG, hashtags_list)
+    subregion = classify_hashtags(SUBREGION_BY_HASHTAG, hashtags_list)
+
+    return event_type, localata, canceled, soon, region, subregion, month
+
+
+def get_hashtags_lists(db_path: str) -> List[List[str]]:
+    connection = sqlite3.connect(db_path)
+    hashtags_lists = [json.loads(row[0]) for row in connection.execute("SELECT hashtags FROM events WHERE hashtags IS NOT NULL")]
+    connection.close()
+
+    return hashtags_lists
+
+
+def random_hashtags_lists(count: int) -> List[List[str]]:
+    known_hashtags = list(REGION_BY_HASHTAG) + list(SUBREGION_BY_HASHTAG) + list(EVENT_TYPE_BY_HASHTAG) + list(MONTH_BY_HASHTAG)
+    known_hashtags += list(CANCELED_HASHTAGS) + list(SOON_HASHTAGS) + ["#techno", "#tekno", "#rave", "#freeparty", "#weekend"]
+
+    return [random.sample(known_hashtags, random.randint(0, 8)) for _ in range(count)]
+
+
+def classifications_per_second(classify_func, hashtags_lists: List[List[str]], runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for hashtags_list in hashtags_lists:
+            classify_func(hashtags_list)
+
+    return len(hashtags_lists) * runs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="bot.db", help="database to read the saved hashtags from")
+    parser.add_argument("--runs", type=int, default=5, help="how many times the posts are classified to measure the speed")
+    args = parser.parse_args()
+
+    hashtags_lists = get_hashtags_lists(args.db)
+    if not hashtags_lists:
+        print("no saved hashtags in the database, using 20000 random posts")
+        hashtags_lists = random_hashtags_lists(20000)
+
+    mismatches = 0
+    for hashtags_list in hashtags_lists:
+        expected, result = classify_reference(hashtags_list), classify_current(hashtags_list)
+        if expected != result:
+            mismatches += 1
+            print(f"mismatch for {hashtags_list}: {expected} != {result}")
+
+    print(f"{len(hashtags_lists) - mismatches}/{len(hashtags_lists)} posts classified as before")
+    print(f"linear scans:   {classifications_per_second(classify_reference, hashtags_lists, args.runs):10.0f} posts/s")
+    print(f"hashtags maps:  {classifications_per_second(classify_current, hashtags_lists, args.runs):10.0f} posts/s")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Seed a throwaway database and measure the per-lookup latency of the relay tables' hot queries (staff replies,
+membership checks, history deletion) without and with their indexes.
+
+Run it from the repository root: python -m scripts.benchmark_relay_lookups [--rows 1000000] [--lookups 2000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import warnings
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.orm import Session
+
+from database.base import Base
+from database.models import Chat
+from database.queries import admin_messages, chat_members, private_chat_messages, user_messages
+
+warnings.filterwarnings("ignore", category=SAWarning)
+
+RELAY_INDEXES = (
+    "index_user_messages_forwarded_message",
+    "index_chat_members_chat_id_status",
+    "index_private_chat_messages_user_id_revoked",
+    "index_chats_is_staff_chat",
+    "index_chats_is_evaluation_chat",
+    "index_chats_is_users_chat",
+    "index_chats_is_events_chat",
+)
+
+CHATS_COUNT = 1000
+STAFF_CHAT_ID = -1
+USERS_CHAT_ID = -2
+STATUSES = ("member", "member", "member", "left", "kicked", "administrator")
+
+
+def fake_reply_update(chat_id: int, replied_to_message_id: int):
+    # the bare minimum get_user_message()/get_admin_message() read from the Update
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=SimpleNamespace(reply_to_message=SimpleNamespace(message_id=replied_to_message_id))
+    )
+
+
+def seed(db_path: str, rows: int):
+    connection = sqlite3.connect(db_path)
+
+    chats = [(-(i + 1), f"chat {i}", i == 0, i == 1) for i in range(CHATS_COUNT)]
+    connection.executemany("INSERT INTO chats (chat_id, title, is_staff_chat, is_users_chat) VALUES (?, ?, ?, ?)", chats)
+
+    # every user is a member of ~10 chats, always including the users chat
+    users_count = rows // 10
+    connection.executemany(
+        "INSERT OR IGNORE INTO chat_members (user_id, chat_id, status) VALUES (?, ?, ?)",
+        ((i % users_count, USERS_CHAT_ID if i < users_count else -random.randint(1, CHATS_COUNT), random.choice(STATUSES)) for i in range(rows))
+    )
+
+    connection.executemany(
+        "INSERT INTO user_messages (message_id, user_id, forwarded_chat_id, forwarded_message_id) VALUES (?, ?, ?, ?)",
+        ((i, random.randint(1, users_count), STAFF_CHAT_ID, i + 1_000_000) for i in range(rows))
+    )
+    connection.executemany(
+        "INSERT INTO admin_messages (message_id, chat_id, target_user_id, reply_message_id) VALUES (?, ?, ?, ?)",
+        ((i, STAFF_CHAT_ID, random.randint(1, users_count), i) for i in range(rows))
+    )
+    connection.executemany(
+        "INSERT INTO private_chat_messages (message_id, user_id, revoked) VALUES (?, ?, ?)",
+        ((i, random.randint(1, users_count), random.random() < 0.3) for i in range(rows))
+    )
+
+    connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+
+    return users_count
+
+
+def get_lookups(rows: int, users_count: int):
+    return (
+        ("user_messages.get_user_message", lambda s: user_messages.get_user_message(s, fake_reply_update(STAFF_CHAT_ID, random.randrange(rows) + 1_000_000))),
+        ("admin_messages.get_admin_message", lambda s: admin_messages.get_admin_message(s, fake_reply_update(STAFF_CHAT_ID, random.randrange(rows)))),
+        ("chat_members.is_member (users chat)", lambda s: chat_members.is_member(s, random.randrange(users_count), Chat.is_users_chat)),
+        ("chat_members.get_chat_chat_members (staff admins)", lambda s: chat_members.get_chat_chat_members(s, Chat.is_staff_chat, admins_only=True).all()),
+        ("private_chat_messages.get_messages", lambda s: private_chat_messages.get_messages(s, random.randrange(users_count)).all()),
+    )
+
+
+def run_lookups(db_path: str, lookups, iterations: int):
+    results = {}
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as session:
+        for description, lookup in lookups:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                lookup(session)
+                session.expunge_all()
+            results[description] = (time.perf_counter() - start) / iterations * 1000
+
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows to insert in each relay table")
+    parser.add_argument("--lookups", type=int, default=2000, help="how many times each lookup is run")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    connection = sqlite3.connect(db_path)
+    index_statements = [sql for name, sql in connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'") if name in RELAY_INDEXES]
+    for index_name in RELAY_INDEXES:
+        connection.execute(f"DROP INDEX {index_name}")
+    connection.close()
+
+    print(f"seeding {db_path} with {args.rows} rows per table...")
+    users_count = seed(db_path, args.rows)
+    lookups = get_lookups(args.rows, users_count)
+
+    # without indexes, fewer iterations are enough (and full scans on 1M rows are slow)
+    before = run_lookups(db_path, lookups, max(1, args.lookups // 20))
+
+    connection = sqlite3.connect(db_path)
+    for sql in index_statements:
+        connection.execute(sql)
+    connection.execute("ANALYZE")
+    connection.close()
+
+    after = run_lookups(db_path, lookups, args.lookups)
+
+    print(f"{'lookup':55} {'before':>12} {'after':>12}")
+    for description, _ in lookups:
+        print(f"{description:55} {before[description]:10.3f}ms {after[description]:10.3f}ms")
+
+    shutil.rmtree(os.path.dirname(db_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Compare the old split_messages() (which re-counted the length and entities of every buffered line each time
+an event was added) with the streaming MessageSplitter, on a list of fake events like the one /events a or
+/radar23 send.
+
+Run it from the repository root: python -m scripts.benchmark_split_messages [--events 2000] [--runs 5]
+"""
+
+import argparse
+import random
+import time
+import warnings
+from typing import List
+
+from sqlalchemy.exc import SAWarning
+from telegram.constants import MessageLimit
+
+import utilities
+from constants import RegionName
+from database.models import Event, EventType
+from plugins.events.common import format_event_string, split_messages, EventFormatting
+
+warnings.filterwarnings("ignore", category=SAWarning)
+
+EVENTS_CHAT_ID = -1001234567890
+DISCUSSION_GROUP_CHAT_ID = -1009876543210
+
+
+def fake_events(count: int) -> List[Event]:
+    regions = [v for k, v in vars(RegionName).items() if not k.startswith("_")]
+    event_types = [v for k, v in vars(EventType).items() if not k.startswith("_")]
+
+    events_list = []
+    for i in range(count):
+        event = Event(EVENTS_CHAT_ID, i + 1)
+        event.event_title = f"party number {i} " + "x" * random.randint(0, 30)
+        event.region = random.choice(regions)
+        event.event_type = random.choice(event_types)
+        event.canceled = random.random() < 0.05
+        event.start_year = event.end_year = 2024
+        event.start_month = event.end_month = random.randint(1, 12)
+        event.start_day = random.randint(1, 27)
+        event.end_day = event.start_day + random.randint(0, 1)
+        if random.random() < 0.5:
+            event.discussion_group_chat_id = DISCUSSION_GROUP_CHAT_ID
+            event.discussion_group_message_id = i + 1
+        events_list.append(event)
+
+    return events_list
+
+
+def time_to_split_old(text_lines: List[str]) -> bool:
+    # the old implementation, kept here as reference
+    message_length = 0
+    entities_count = 0
+    for line in text_lines:
+        message_length += len(line)
+        entities_count += utilities.count_html_entities(line)
+
+    return message_length >= MessageLimit.MAX_TEXT_LENGTH or entities_count >= MessageLimit.MESSAGE_ENTITIES
+
+
+def split_messages_old(all_events: List[str]) -> List[str]:
+    messages_to_send = []
+    next_message_events = []
+    for events_string in all_events:
+        if time_to_split_old(next_message_events):
+            messages_to_send.append("\n".join(next_message_events))
+            next_message_events = [events_string]
+        else:
+            next_message_events.append(events_string)
+
+    if next_message_events:
+        messages_to_send.append("\n".join(next_message_events))
+
+    return messages_to_send
+
+
+def benchmark(description: str, func, runs: int):
+    start = time.perf_counter()
+    for _ in range(runs):
+        messages = func()
+    elapsed = (time.perf_counter() - start) / runs * 1000
+
+    longest = max(len(m) for m in messages)
+    most_entities = max(utilities.count_html_entities(m) for m in messages)
+    print(f"{description:45} {elapsed:10.3f}ms  {len(messages):4} messages, longest: {longest} chars, most entities: {most_entities}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000, help="how many events to format and split")
+    parser.add_argument("--runs", type=int, default=5, help="how many times each implementation is run")
+    args = parser.parse_args()
+
+    formatting = EventFormatting()
+    lines, entities_counts = [], []
+    for event in fake_events(args.events):
+        text_line, event_entities_count = format_event_string(event, formatting)
+        lines.append(text_line)
+        entities_counts.append(event_entities_count)
+
+    print(f"limits: {MessageLimit.MAX_TEXT_LENGTH} chars, {MessageLimit.MESSAGE_ENTITIES} entities")
+    benchmark("old split_messages()", lambda: split_messages_old(lines), args.runs)
+    benchmark("split_messages()", lambda: split_messages(lines), args.runs)
+    benchmark("split_messages() + entities counts", lambda: split_messages(lines, entities_counts=entities_counts), args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Move the media backups saved before the content-addressed store ('{chat_type}_{chat_id}_{message_id}_{file_unique_id}'
+files in events_data/) to the store (events_data/media/), where every file is saved once per file_unique_id.
+
+Files are hardlinked to the store, the paths saved in the events and in the media_downloads table are updated, then
+the old names are removed, unless --keep-legacy-names is passed: in that case duplicates are replaced with
+hardlinks to the stored file, so the old paths keep working. Either way, the bytes used by duplicates are reclaimed.
+
+Run it from the repository root, preferably while the bot is not running:
+
+    python -m scripts.dedupe_events_data [--db bot.db] [--dry-run] [--keep-legacy-names]
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import warnings
+from typing import Dict, List
+
+from sqlalchemy.exc import SAWarning
+
+from plugins.events.media_backup import EVENTS_DATA_DIRECTORY, get_media_store_path
+
+warnings.filterwarnings("ignore", category=SAWarning)
+
+# chat types and ids never contain underscores, file_unique_ids might
+LEGACY_FILE_NAME = re.compile(r"^(?P<chat_type>[a-z]+)_(?P<chat_id>\d+)_(?P<message_id>\d+)_(?P<file_unique_id>.+)\.(?P<extension>jpg|mp4)$")
+
+
+class DedupeReport:
+    def __init__(self):
+        self.scanned = 0
+        self.stored = 0  # first copy of a file, linked to the store
+        self.duplicates = 0
+        self.mismatches = 0  # same file_unique_id, different size: left where they are
+        self.bytes_reclaimed = 0
+        self.events_updated = 0
+        self.downloads_updated = 0
+
+    def summary(self, dry_run: bool) -> str:
+        lines = [
+            f"legacy files: {self.scanned}",
+            f"stored files: {self.stored}",
+            f"duplicates: {self.duplicates}",
+            f"size mismatches (skipped): {self.mismatches}",
+            f"events updated: {self.events_updated}",
+            f"media downloads updated: {self.downloads_updated}",
+            f"bytes reclaimed: {self.bytes_reclaimed} ({self.bytes_reclaimed / 1024 / 1024:.1f} MiB)"
+        ]
+        if dry_run:
+            lines.append("dry run: nothing was changed")
+
+        return "\n".join(lines)
+
+
+def link_to_store(legacy_paths: List[pathlib.Path], report: DedupeReport, dry_run: bool) -> Dict[str, str]:
+    """returns the old path -> store path of the files that are now in the store"""
+    new_paths = {}
+    stored_sizes = {}  # store path -> size, of the files linked to the store during this run
+    for legacy_path in legacy_paths:
+        match = LEGACY_FILE_NAME.match(legacy_path.name)
+        store_path = get_media_store_path(match.group("file_unique_id"), match.group("extension"))
+        legacy_stat = legacy_path.stat()
+
+        if store_path.exists() and legacy_path.samefile(store_path):
+            # already linked by a previous run
+            new_paths[str(legacy_path)] = str(store_path)
+            continue
+
+        if str(store_path) not in stored_sizes and not store_path.exists():
+            report.stored += 1
+            stored_sizes[str(store_path)] = legacy_stat.st_size
+            if not dry_run:
+                store_path.parent.mkdir(parents=True, exist_ok=True)
+                os.link(legacy_path, store_path)
+
+            new_paths[str(legacy_path)] = str(store_path)
+            continue
+
+        store_size = stored_sizes.get(str(store_path)) or store_path.stat().st_size
+        if store_size != legacy_stat.st_size:
+            print(f"{legacy_path}: {legacy_stat.st_size} bytes, but {store_path} is {store_size} bytes: skipping")
+            report.mismatches += 1
+            continue
+
+        report.duplicates += 1
+        if legacy_stat.st_nlink == 1:
+            report.bytes_reclaimed += legacy_stat.st_size
+
+        new_paths[str(legacy_path)] = str(store_path)
+
+    return new_paths
+
+
+def update_db_paths(db_path: str, new_paths: Dict[str, str], report: DedupeReport, dry_run: bool):
+    connection = sqlite3.connect(db_path)
+
+    events_rows = connection.execute("SELECT chat_id, message_id, media_file_paths FROM events WHERE media_file_paths IS NOT NULL").fetchall()
+    for chat_id, message_id, media_file_paths in events_rows:
+        file_paths = json.loads(media_file_paths)
+        # the same file might have been saved more than once for an event (eg. the post and a comment)
+        updated_file_paths = list(dict.fromkeys([new_paths.get(file_path, file_path) for file_path in file_paths]))
+        if updated_file_paths == file_paths:
+            continue
+
+        report.events_updated += 1
+        connection.execute(
+            "UPDATE events SET media_file_paths = ? WHERE chat_id = ? AND message_id = ?",
+            (json.dumps(updated_file_paths, indent=2), chat_id, message_id)
+        )
+
+    downloads_rows = connection.execute("SELECT chat_id, message_id, file_path FROM media_downloads WHERE file_path IS NOT NULL").fetchall()
+    for chat_id, message_id, file_path in downloads_rows:
+        if file_path not in new_paths:
+            continue
+
+        report.downloads_updated += 1
+        connection.execute(
+            "UPDATE media_downloads SET file_path = ? WHERE chat_id = ? AND message_id = ?",
+            (new_paths[file_path], chat_id, message_id)
+        )
+
+    if dry_run:
+        connection.rollback()
+    else:
+        connection.commit()
+    connection.close()
+
+
+def remove_legacy_names(new_paths: Dict[str, str], keep_legacy_names: bool):
+    for legacy_path, store_path in new_paths.items():
+        legacy_path, store_path = pathlib.Path(legacy_path), pathlib.Path(store_path)
+        if legacy_path.samefile(store_path) and keep_legacy_names:
+            continue
+
+        os.remove(legacy_path)
+        if keep_legacy_names:
+            os.link(store_path, legacy_path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="bot.db", help="database with the events and media downloads to update")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be done")
+    parser.add_argument("--keep-legacy-names", action="store_true", help="replace duplicates with hardlinks instead of removing the old files")
+    args = parser.parse_args()
+
+    legacy_paths = sorted(path for path in EVENTS_DATA_DIRECTORY.iterdir() if path.is_file() and LEGACY_FILE_NAME.match(path.name))
+
+    report = DedupeReport()
+    report.scanned = len(legacy_paths)
+
+    new_paths = link_to_store(legacy_paths, report, args.dry_run)
+    # the db must not point to the old names before they are removed
+    update_db_paths(args.db, new_paths, report, args.dry_run)
+    if not args.dry_run:
+        remove_legacy_names(new_paths, args.keep_legacy_names)
+
+    print(report.summary(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
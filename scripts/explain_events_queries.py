@@ -0,0 +1,65 @@
+"""Print the sqlite query plan of every events query shape used by /radar, the parties list job and the
+comments handler, so a missing/unused index is easy to spot (look for "SCAN events").
+
+Run it from the repository root: python -m scripts.explain_events_queries [path/to/bot.db]
+"""
+
+import datetime
+import itertools
+import sys
+import warnings
+
+from sqlalchemy import create_engine, text, select
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.dialects import sqlite
+
+from database.models import Event
+from database.queries import events
+from plugins.events.common import EventFilter, extract_query_filters, extract_order_by
+from plugins.events.job import PARTIES_MESSAGE_TYPES_ARGS
+
+warnings.filterwarnings("ignore", category=SAWarning)
+
+RADAR_REGION_FILTERS = (EventFilter.IT, EventFilter.NOT_IT)
+RADAR_TYPE_FILTERS = (EventFilter.FREE, EventFilter.NOT_FREE)
+RADAR_TIME_FILTERS = (EventFilter.WEEK, EventFilter.WEEK_2, EventFilter.MONTH_FUTURE_AND_NEXT_MONTH, EventFilter.SOON)
+
+
+def compile_statement(statement) -> str:
+    return str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def print_query_plan(connection, description: str, statement):
+    sql = compile_statement(statement)
+    print(f"--- {description}")
+    for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+        # row: (id, parent, notused, detail)
+        print(f"    {row[3]}")
+    print()
+
+
+def get_queries(today: datetime.date):
+    for args in itertools.product(RADAR_REGION_FILTERS, RADAR_TYPE_FILTERS, RADAR_TIME_FILTERS):
+        args = list(args)
+        statement = events.get_events_statement(filters=extract_query_filters(args, today=today), order_by=extract_order_by(args))
+        yield f"radar {args}", statement
+
+    for list_type, args in PARTIES_MESSAGE_TYPES_ARGS.items():
+        statement = events.get_events_statement(filters=extract_query_filters(args, today=today), order_by=extract_order_by(args))
+        yield f"parties list {list_type} {args}", statement
+
+    statement = select(Event).filter(Event.discussion_group_chat_id == -100, Event.discussion_group_message_id == 1)
+    yield "event from discussion group message", statement
+
+
+def main(db_path: str):
+    engine = create_engine(f"sqlite:///{db_path}")
+    today = datetime.date.today()
+
+    with engine.connect() as connection:
+        for description, statement in get_queries(today):
+            print_query_plan(connection, description, statement)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "bot.db")
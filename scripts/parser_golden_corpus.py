@@ -0,0 +1,165 @@
+"""Golden corpus for parse_message_text(): make sure a change to the parser doesn't change how the archived events are
+parsed, and measure how many posts per second it can parse.
+
+Build the corpus from the events saved in the database (the expected results are produced by the reference
+implementation below, which is the parser as it was before it was precompiled):
+
+    python -m scripts.parser_golden_corpus build [--db bot.db] [--corpus events_corpus.json]
+
+Check the current parser against it:
+
+    python -m scripts.parser_golden_corpus check [--corpus events_corpus.json] [--runs 3]
+
+The corpus contains the text of real posts: do not commit it.
+"""
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import sys
+import time
+import warnings
+from typing import Optional, List
+
+from sqlalchemy.exc import SAWarning
+
+from constants import Regex
+from database.models import Event
+from plugins.events.common import DateMatchMonthsJump, DateMatchDaysList, DateMatchNormal, EVENT_TEXT_PARSER
+
+warnings.filterwarnings("ignore", category=SAWarning)
+
+PARSED_FIELDS = ("event_title", "detailed_location", "start_day", "start_month", "start_year", "end_day", "end_month", "end_year")
+
+
+def parse_message_text_reference(message_text: str) -> dict:
+    # the parser before EventTextParser, kept as reference
+    result = {field: None for field in PARSED_FIELDS}
+
+    title_match = re.search(Regex.FIRST_LINE, message_text, re.M)
+    if title_match:
+        result["event_title"] = title_match.group(1)
+
+    location_match = re.search(Regex.DETAILED_LOCATION, message_text, re.M)
+    if location_match and location_match.group(1) is not None:
+        result["detailed_location"] = location_match.group(1).strip()
+
+    for date_test in [DateMatchMonthsJump, DateMatchDaysList, DateMatchNormal]:
+        date_match = None
+        for pattern in date_test.PATTERN:
+            date_match = re.search(pattern, message_text, re.M | re.I)
+            if date_match:
+                break
+
+        if not date_match:
+            continue
+
+        try:
+            start_date, end_date = date_test.extract(date_match)
+        except ValueError:
+            continue
+
+        result.update(
+            start_day=start_date.day, start_month=start_date.month, start_year=start_date.year,
+            end_day=end_date.day, end_month=end_date.month, end_year=end_date.year
+        )
+        break
+
+    return result
+
+
+def parse_message_text_current(message_text: str) -> dict:
+    # same fields the reference returns, without the cost of populating an Event (so the speed is comparable)
+    result = {field: None for field in PARSED_FIELDS}
+    result["event_title"] = EVENT_TEXT_PARSER.parse_title(message_text)
+    result["detailed_location"] = EVENT_TEXT_PARSER.parse_detailed_location(message_text)
+
+    dates = EVENT_TEXT_PARSER.parse_dates(message_text)
+    if dates:
+        start_date, end_date = dates
+        result.update(
+            start_day=start_date.day, start_month=start_date.month, start_year=start_date.year,
+            end_day=end_date.day, end_month=end_date.month, end_year=end_date.year
+        )
+
+    return result
+
+
+def parse_message_text_event(message_text: str) -> dict:
+    # what parse_message_text() saves on the Event
+    event = Event(0, 0)
+    EVENT_TEXT_PARSER.parse(message_text, event)
+    return {field: getattr(event, field) for field in PARSED_FIELDS}
+
+
+def get_texts(db_path: str) -> List[str]:
+    connection = sqlite3.connect(db_path)
+    texts = [row[0] for row in connection.execute("SELECT message_text FROM events WHERE message_text IS NOT NULL ORDER BY chat_id, message_id")]
+    connection.close()
+
+    return texts
+
+
+def build(db_path: str, corpus_path: str):
+    texts = get_texts(db_path)
+    corpus = [dict(text=text, expected=parse_message_text_reference(text)) for text in texts]
+
+    with open(corpus_path, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False, indent=1)
+
+    print(f"saved {len(corpus)} posts to {corpus_path}")
+
+
+def posts_per_second(parse_func, texts: List[str], runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for text in texts:
+            parse_func(text)
+
+    return len(texts) * runs / (time.perf_counter() - start)
+
+
+def check(corpus_path: str, runs: int) -> bool:
+    with open(corpus_path, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    mismatches = 0
+    for i, item in enumerate(corpus):
+        result = parse_message_text_event(item["text"])
+        if result != item["expected"]:
+            mismatches += 1
+            diff = {field: (item["expected"][field], result[field]) for field in PARSED_FIELDS if item["expected"][field] != result[field]}
+            first_line = item["text"].split("\n", 1)[0]
+            print(f"mismatch #{i} ({first_line[:50]}): {diff}")
+
+    print(f"{len(corpus) - mismatches}/{len(corpus)} posts parsed as expected")
+
+    texts = [item["text"] for item in corpus]
+    if texts:
+        print(f"reference parser: {posts_per_second(parse_message_text_reference, texts, runs):10.0f} posts/s")
+        print(f"current parser:   {posts_per_second(parse_message_text_current, texts, runs):10.0f} posts/s")
+
+    return mismatches == 0
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("build", "check"))
+    parser.add_argument("--db", default="bot.db", help="database to read the events from (build)")
+    parser.add_argument("--corpus", default="events_corpus.json", help="corpus file to write (build) or read (check)")
+    parser.add_argument("--runs", type=int, default=3, help="how many times the corpus is parsed to measure the speed (check)")
+    args = parser.parse_args(argv)
+
+    # the parser logs at INFO level when it can't find something: keep the output readable
+    logging.disable(logging.INFO)
+
+    if args.command == "build":
+        build(args.db, args.corpus)
+    elif not check(args.corpus, args.runs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
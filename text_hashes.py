@@ -0,0 +1,73 @@
+"""MinHash signatures of texts and their LSH buckets, used to find near-duplicate messages (the same info message
+with a fixed date, an added emoji...) without comparing a text with every saved one.
+
+The signature estimates the Jaccard similarity between the character shingles of two texts. It is split in bands,
+and every band is hashed to a bucket: two texts share at least one bucket with high probability if they are
+similar, so only the messages in the same buckets have to be compared"""
+
+import hashlib
+import random
+import re
+from typing import List
+
+import numpy as np
+
+SHINGLE_SIZE = 5  # characters
+SIGNATURE_SIZE = 64  # hash functions
+BANDS = 16
+ROWS_PER_BAND = SIGNATURE_SIZE // BANDS  # with 16 bands of 4 rows, texts with similarity 0.8 share a bucket 99.9% of the times
+
+# hash functions: (a * x + b) % PRIME, with 32 bit shingle hashes. The result always fits in an uint64
+PRIME = 4294967291  # largest prime below 2^32
+
+# fixed seed: the signatures must not change between restarts
+_random = random.Random(20241017)
+HASH_A = np.array([_random.randrange(1, PRIME) for _ in range(SIGNATURE_SIZE)], dtype=np.uint64)
+HASH_B = np.array([_random.randrange(0, PRIME) for _ in range(SIGNATURE_SIZE)], dtype=np.uint64)
+
+
+def normalize_text(text: str) -> str:
+    # same characters generate_text_hash() ignores, but here spaces are collapsed instead of removed, so words
+    # don't stick together
+    text = re.sub(r'(\u180B|\u200B|\u200C|\u200D|\u2060|\uFEFF)+', '', text)
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def get_shingles_hashes(text: str) -> np.ndarray:
+    text = normalize_text(text)
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+    shingles_hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big") for shingle in shingles]
+    return np.array(shingles_hashes, dtype=np.uint64)
+
+
+def generate_text_minhash(text: str) -> List[int]:
+    # one row per hash function, one column per shingle: the signature is the min of every row
+    hashes = (HASH_A[:, None] * get_shingles_hashes(text)[None, :] + HASH_B[:, None]) % PRIME
+
+    return hashes.min(axis=1).tolist()
+
+
+def minhash_to_str(signature: List[int]) -> str:
+    return "".join(f"{value:08x}" for value in signature)
+
+
+def minhash_from_str(signature_str: str) -> List[int]:
+    return [int(signature_str[i:i + 8], 16) for i in range(0, len(signature_str), 8)]
+
+
+def get_lsh_buckets(signature: List[int]) -> List[int]:
+    """one bucket per band. The band number is part of the hash, so the buckets of different bands never collide"""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        band_bytes = band.to_bytes(1, "big") + b"".join(value.to_bytes(4, "big") for value in rows)
+        # sqlite integers are signed 64 bit
+        buckets.append(int.from_bytes(hashlib.blake2b(band_bytes, digest_size=8).digest(), "big", signed=True))
+
+    return buckets
+
+
+def minhash_similarity(signature_a: List[int], signature_b: List[int]) -> float:
+    """estimated Jaccard similarity of the two texts"""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / SIGNATURE_SIZE